@@ -1,18 +1,35 @@
-from .ccguard import (  # noqa
-    SqliteAdapter,
-    WebAdapter,
-    ReferenceAdapter,
-    configuration,
-    GitAdapter,
-    adapter_factory,
-    parse_common_args,
-    print_cc_report,
-    print_delta_report,
-    VersionedCobertura,
-    normalize_report_paths,
-    determine_parent_commit,
-    has_better_coverage,
-    get_output,
-)
-
 __version__ = "0.7.0"
+
+# the names are resolved on first use, so that ccguard_client starts quickly
+_EXPORTS = {
+    "SqliteAdapter": "ccguard",
+    "WebAdapter": "ccguard",
+    "ReferenceAdapter": "ccguard",
+    "configuration": "ccguard",
+    "ConfigurationCache": "ccguard",
+    "GitAdapter": "ccguard",
+    "adapter_factory": "ccguard",
+    "parse_common_args": "ccguard",
+    "print_cc_report": "ccguard",
+    "print_delta_report": "ccguard",
+    "normalize_report_paths": "ccguard",
+    "determine_parent_commit": "ccguard",
+    "has_better_coverage": "ccguard",
+    "get_output": "ccguard",
+    # these import pycobertura
+    "GitFileSystem": "ccguard_versioned",
+    "VersionedCobertura": "ccguard_versioned",
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        import importlib
+
+        module = importlib.import_module("." + _EXPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
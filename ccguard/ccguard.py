@@ -2,21 +2,45 @@
 
 import io
 import argparse
+import base64
+import datetime
+import hashlib
+import itertools
 import json
 import logging
 import sys
 import shlex
 import subprocess
 import sqlite3
-import lxml.etree as ET
+import struct
+import threading
+import time
 from pathlib import Path
 import os
-import requests
-from typing import Optional, Callable, Iterable, Tuple, List
-from contextlib import contextmanager
-from pycobertura import Cobertura, CoberturaDiff, TextReporterDelta, TextReporter
-from pycobertura.reporters import HtmlReporter, HtmlReporterDelta
-from pycobertura.filesystem import FileSystem
+from typing import Optional, Callable, Dict, Iterable, Iterator, Tuple, List
+from urllib.parse import urlencode
+
+try:
+    from . import (
+        ccguard_binary,
+        ccguard_cache,
+        ccguard_compression,
+        ccguard_frames,
+        ccguard_pack,
+    )
+    from .ccguard_lazy import lazy_import
+except ImportError:  # executed as a script
+    import ccguard_binary
+    import ccguard_cache
+    import ccguard_compression
+    import ccguard_frames
+    import ccguard_pack
+    from ccguard_lazy import lazy_import
+
+ET = lazy_import("lxml.etree")
+requests = lazy_import("requests")
+pycobertura = lazy_import("pycobertura")
+reporters = lazy_import("pycobertura.reporters")
 
 __version__ = "dev~"
 HOME = Path.home()
@@ -26,6 +50,7 @@ CONFIG_FILE_NAME = ".ccguard.config.json"
 KNOWN_ADAPTERS = {
     "web": "WebAdapter",
     "sqlite": "SqliteAdapter",
+    "pack": "PackAdapter",
     "default": "SqliteAdapter",
 }
 
@@ -35,17 +60,22 @@ DEFAULT_CONFIGURATION = {
     "threshold.tolerance": 0,
     "threshold.hard-minimum": -1,
     "sqlite.dbpath": HOME.joinpath(DB_FILE_NAME),
+    "sqlite.storage.format": "xml",
+    "pack.path": HOME.joinpath(".ccguard-packs"),
+    "ccguard.wire.format": "xml",
     "known.adapters": KNOWN_ADAPTERS,
 }
 
 
-def configuration(repository_path="."):
+def configuration_paths(repository_path=".") -> List[Path]:
     user_config = HOME.joinpath(CONFIG_FILE_NAME)
     repository_config = Path(repository_path).joinpath(CONFIG_FILE_NAME)
+    return [user_config, repository_config]
 
-    paths = [user_config, repository_config]
+
+def configuration(repository_path="."):
     config = dict(DEFAULT_CONFIGURATION)
-    for path in paths:
+    for path in configuration_paths(repository_path):
         logging.debug("Considering %s as configuration file", path)
         try:
             with open(path) as config_fd:
@@ -55,6 +85,53 @@ def configuration(repository_path="."):
     return config
 
 
+class ConfigurationCache(object):
+    """
+    Keeps the result of `configuration` until one of its files changes.
+
+    The files are checked at most once per `check_interval` seconds, so that
+    long running processes (ie. the server) neither open nor parse them on
+    every call. `invalidate` forces a reload on the next call.
+    """
+
+    def __init__(self, repository_path=".", loader=None, check_interval=1.0):
+        self.repository_path = repository_path
+        self.loader = loader or configuration
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._config = None
+        self._stamps = None
+        self._checked = 0.0
+
+    def _read_stamps(self) -> tuple:
+        stamps = []
+        for path in configuration_paths(self.repository_path):
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def invalidate(self):
+        self._config = None
+
+    def get(self) -> dict:
+        now = time.monotonic()
+        config = self._config
+        if config is not None and now - self._checked < self.check_interval:
+            return config
+
+        with self._lock:
+            stamps = self._read_stamps()
+            if self._config is None or stamps != self._stamps:
+                logging.debug("Loading the configuration")
+                self._config = self.loader(self.repository_path)
+                self._stamps = stamps
+            self._checked = now
+            return self._config
+
+
 def get_output(command, working_folder=None):
     logging.debug("Executing %s in %s", command, working_folder)
 
@@ -66,58 +143,19 @@ def get_output(command, working_folder=None):
         raise
 
 
-class GitFileSystem(FileSystem):
-    def __init__(self, repo_folder, commit_id=None):
-        self.repository = repo_folder
-        self.commit_id = commit_id
-        self.repository_root = GitAdapter(repo_folder).get_root_path()
-        self.prefix = self.repository.replace(self.repository_root, "").lstrip("/")
-
-    def real_filename(self, filename):
-        prefix = "{}/".format(self.prefix) if self.prefix else ""
-        return "{p.commit_id}:{prefix}{filename}".format(
-            prefix=prefix, p=self, filename=filename
-        )
-
-    def has_file(self, filename):
-        command = "git --no-pager show {}".format(self.real_filename(filename))
-        return_code = subprocess.call(
-            command,
-            cwd=self.repository,
-            shell=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        logging.debug("%s: %d", command, return_code)
-        return not bool(return_code)
-
-    @contextmanager
-    def open(self, filename):
-        """
-        Yield a file-like object for file `filename`.
-
-        This function is a context manager.
-        """
-        filename = self.real_filename(filename)
-
-        try:
-            output = get_output(
-                "git --no-pager show {}".format(filename), self.repository
-            )
-        except Exception:
-            raise self.FileNotFound(filename)
-
-        yield io.StringIO(output)
+def _versioned():
+    try:
+        from . import ccguard_versioned
+    except ImportError:  # executed as a script
+        import ccguard_versioned
+    return ccguard_versioned
 
 
-class VersionedCobertura(Cobertura):
-    def __init__(self, report, source=None, commit_id=None):
-        super().__init__(report, source=source)
-        if source is None:
-            if isinstance(report, str):
-                # get the directory in which the coverage file lives
-                source = os.path.dirname(report)
-        self.filesystem = GitFileSystem(source, commit_id=commit_id)
+def __getattr__(name):
+    # these classes extend pycobertura's, which is only imported on first use
+    if name in ("GitFileSystem", "VersionedCobertura"):
+        return getattr(_versioned(), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 class GitAdapter(object):
@@ -158,6 +196,29 @@ class GitAdapter(object):
             logging.debug("Returning as previous revisions: %r", commits)
             yield commits
 
+    def iter_log(
+        self, limit: int = None, ref: str = "HEAD"
+    ) -> Iterator[Tuple[str, str]]:
+        """Stream the (commit id, subject) of the history of ref, the most recent first."""
+        command = ["git", "log", "--format=%H %s", ref]
+        if limit:
+            command.insert(2, "--max-count={}".format(limit))
+        logging.debug("Executing %s in %s", command, self.repository_folder)
+        process = subprocess.Popen(
+            command, cwd=self.repository_folder, stdout=subprocess.PIPE
+        )
+        try:
+            for line in process.stdout:
+                line = line.decode("utf-8", errors="replace").rstrip("\n")
+                commit_id, _, subject = line.partition(" ")
+                yield commit_id, subject
+        finally:
+            # when the caller stops early, git gets a broken pipe
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, command)
+
     def get_files(self):
         root_folder = self.get_root_path()
         command = "git ls-files"
@@ -201,14 +262,68 @@ class ReferenceAdapter(object):
     ) -> frozenset:
         raise NotImplementedError
 
-    def retrieve_cc_data(self, commit_id: str, subtype: str = None) -> Optional[bytes]:
+    def iter_cc_commits(self, branch=None, subtype: str = None) -> Iterator[str]:
+        """Iterate over the commit ids of the references, the most recent first."""
+        return iter(self.get_cc_commits(branch=branch, subtype=subtype))
+
+    def resolve_prefix(self, prefix: str, subtype: str = None) -> Optional[str]:
+        """Return the most recent commit id starting with prefix, if any."""
+        for commit_id in self.iter_cc_commits(subtype=subtype):
+            if commit_id.startswith(prefix):
+                return commit_id
+        return None
+
+    def list_references(
+        self,
+        branch: str = None,
+        subtype: str = None,
+        since: str = None,
+        until: str = None,
+        cursor: str = None,
+        limit: int = 100,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Return a page of references, the most recent first, and the cursor
+        of the next page (None on the last page).
+        """
+        raise NotImplementedError
+
+    def retrieve_cc_data(
+        self, commit_id: str, subtype: str = None, encoding: str = "xml"
+    ) -> Optional[bytes]:
         raise NotImplementedError
 
+    def retrieve_many(
+        self, commit_ids: Iterable[str], subtype: str = None, encoding: str = "xml"
+    ) -> Iterator[Tuple[str, bytes]]:
+        """Yield the (commit_id, data) of the references found among commit_ids."""
+        for commit_id in commit_ids:
+            data = self.retrieve_cc_data(commit_id, subtype=subtype, encoding=encoding)
+            if data:
+                yield commit_id, data
+
     def persist(
         self, commit_id: str, data: bytes, branch: str = None, subtype: str = None
     ):
         raise NotImplementedError
 
+    def persist_many(
+        self, references: Iterable[tuple], batch_size: int = None
+    ) -> List[str]:
+        """
+        Record (commit_id, data, branch, subtype) references, returning
+        the status of each one: recorded, duplicate or invalid. The adapters
+        recording them in batches take batch_size references at a time.
+        """
+        statuses = []
+        for commit_id, data, branch, subtype in references:
+            try:
+                self.persist(commit_id, data, branch=branch, subtype=subtype)
+                statuses.append("recorded")
+            except ValueError:
+                statuses.append("invalid")
+        return statuses
+
     def dump(self) -> list:
         raise NotImplementedError
 
@@ -217,63 +332,221 @@ class ReferenceAdapter(object):
     ) -> Tuple[float, int, int]:
         raise NotImplementedError
 
+    def list_summaries(
+        self, commit_ids: Iterable[str], subtype: str = None
+    ) -> Iterator[tuple]:
+        """
+        Yield the (commit_id, line_rate, lines_covered, lines_valid, branch,
+        subtype) of the references found among commit_ids.
+        """
+        for commit_id, data in self.retrieve_many(commit_ids, subtype=subtype):
+            line_rate, lines_covered, lines_valid = line_coverage(data)
+            yield commit_id, line_rate, lines_covered, lines_valid, None, subtype
+
+    def list_file_summaries(
+        self, commit_ids: Iterable[str], path: str = "", subtype: str = None
+    ) -> Iterator[Tuple[str, int, int]]:
+        """
+        Yield the (commit_id, lines_covered, lines_valid) of a file, or of
+        the files of a folder, for the references found among commit_ids.
+        """
+        for commit_id, data in self.retrieve_many(commit_ids, subtype=subtype):
+            summaries = [
+                summary
+                for filename, summary in file_coverage(data).items()
+                if in_path(filename, path)
+            ]
+            yield (
+                commit_id,
+                sum(covered for covered, _ in summaries),
+                sum(valid for _, valid in summaries),
+            )
+
+    def get_latest_reference(
+        self, branch: str, subtype: str = None
+    ) -> Optional[Tuple[str, float]]:
+        """Return the commit id and the line rate of the latest reference."""
+        commits = self.get_cc_commits(count=1, branch=branch, subtype=subtype)
+        if not commits:
+            return None
+        (commit_id,) = commits
+        info = self.get_commit_info(commit_id, subtype=subtype)
+        return (commit_id, info[0]) if info else None
+
 
 class SqliteAdapter(ReferenceAdapter):
     _table_name_pattern = "timestamped_{metric}_{repository_id}_v1"
+    _latest_table_name_pattern = "latest_{metric}_{repository_id}_v1"
+    _files_table_name_pattern = "files_{metric}_{repository_id}_v1"
+    # below the default limit of variables in a SQLite statement
+    _max_variables = 500
 
-    def __init__(self, repository_id, config, metric="coverage"):
+    def __init__(self, repository_id, config, metric="coverage", conn=None):
         super().__init__(repository_id, config)
         dbpath = str(config.get("sqlite.dbpath"))
         self.metric = metric
-        self.conn = sqlite3.connect(dbpath)
+        self.storage_format = config.get("sqlite.storage.format", "xml")
+        self.batch_size = config.get("sqlite.batch.size", 100)
+        # a connection given by the caller (ie. a writer thread) is not ours
+        self._owns_conn = conn is None
+        self.conn = conn or sqlite3.connect(dbpath)
         self._create_table()
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.conn.close()
+        if self._owns_conn:
+            self.conn.close()
 
     def _table_name(self):
         return self._table_name_pattern.format(
             metric=self.metric, repository_id=self.repository_id
         )
 
+    def _latest_table_name(self):
+        return self._latest_table_name_pattern.format(
+            metric=self.metric, repository_id=self.repository_id
+        )
+
+    def _files_table_name(self):
+        return self._files_table_name_pattern.format(
+            metric=self.metric, repository_id=self.repository_id
+        )
+
+    def _commits_query(self, branch: str = None, subtype: str = None) -> tuple:
+        conditions, parameters = [], []
+        if branch:
+            conditions.append("branch = ?")
+            parameters.append(branch)
+        if subtype:
+            conditions.append("type = ?")
+            parameters.append(subtype)
+        where_clause = "WHERE " + " and ".join(conditions) if conditions else ""
+        query = (
+            "SELECT commit_id FROM {table_name} {where_clause} "
+            "ORDER BY collected_at DESC, rowid DESC"
+        ).format(table_name=self._table_name(), where_clause=where_clause)
+        return query, parameters
+
     def get_cc_commits(
         self, count: int = -1, branch: str = None, subtype: str = None
     ) -> frozenset:
-        where_branch_clause = 'branch="{}"'.format(branch) if branch else ""
-        where_subtype_clause = "type={}".format(subtype or "default") if subtype else ""
-        conditions = [
-            cond for cond in (where_branch_clause, where_subtype_clause) if cond
+        query, parameters = self._commits_query(branch, subtype)
+        if count > 0:
+            query += " LIMIT ?"
+            parameters.append(count)
+        return frozenset(c for (c,) in self.conn.execute(query, parameters))
+
+    def iter_cc_commits(self, branch: str = None, subtype: str = None) -> Iterator[str]:
+        query, parameters = self._commits_query(branch, subtype)
+        # without a subtype, a commit may have several references
+        seen = None if subtype else set()
+        for (commit_id,) in self.conn.execute(query, parameters):
+            if seen is not None:
+                if commit_id in seen:
+                    continue
+                seen.add(commit_id)
+            yield commit_id
+
+    def resolve_prefix(self, prefix: str, subtype: str = None) -> Optional[str]:
+        if not prefix:
+            return None
+        # a range scan of the primary key: commit_id >= prefix < next prefix
+        upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        conditions = ["commit_id >= ?", "commit_id < ?"]
+        parameters = [prefix, upper_bound]
+        if subtype:
+            conditions.append("type = ?")
+            parameters.append(subtype)
+        query = (
+            "SELECT commit_id FROM {table_name} WHERE {conditions} "
+            "ORDER BY collected_at DESC, rowid DESC LIMIT 1"
+        ).format(table_name=self._table_name(), conditions=" and ".join(conditions))
+        row = self.conn.execute(query, parameters).fetchone()
+        return row[0] if row else None
+
+    def list_references(
+        self,
+        branch: str = None,
+        subtype: str = None,
+        since: str = None,
+        until: str = None,
+        cursor: str = None,
+        limit: int = 100,
+    ) -> Tuple[List[dict], Optional[str]]:
+        conditions, parameters = [], []
+        if branch:
+            conditions.append("branch = ?")
+            parameters.append(branch)
+        if subtype:
+            conditions.append("type = ?")
+            parameters.append(subtype)
+        if since:
+            conditions.append("collected_at >= ?")
+            parameters.append(parse_timestamp(since))
+        if until:
+            conditions.append("collected_at <= ?")
+            parameters.append(parse_timestamp(until))
+        if cursor:
+            # keyset pagination: the rows after the last one of the previous page
+            conditions.append("(collected_at, commit_id, type) < (?, ?, ?)")
+            parameters.extend(decode_cursor(cursor))
+        where_clause = "WHERE " + " and ".join(conditions) if conditions else ""
+        query = (
+            "SELECT collected_at, commit_id, type, branch "
+            "FROM {table_name} {where_clause} "
+            "ORDER BY collected_at DESC, commit_id DESC, type DESC "
+            "LIMIT ?"
+        ).format(table_name=self._table_name(), where_clause=where_clause)
+        rows = self.conn.execute(query, parameters + [limit + 1]).fetchall()
+
+        references = [
+            {
+                "commit_id": commit_id,
+                "subtype": subtype,
+                "branch": branch,
+                "collected_at": collected_at,
+            }
+            for collected_at, commit_id, subtype, branch in rows[:limit]
         ]
-        where_conditions = " and ".join(conditions)
-        where_clause = "WHERE {}".format(where_conditions) if where_conditions else ""
-        limit_clause = "LIMIT {}".format(count) if count > 0 else ""
-        commits_query = (
-            "SELECT commit_id "
-            "FROM  {table_name} "
-            "{where_clause} "
-            "ORDER BY collected_at DESC "
-            "{limit_clause}"
-        ).format(
-            where_clause=where_clause,
-            limit_clause=limit_clause,
-            table_name=self._table_name(),
-        )
-        return frozenset(
-            c for ct in self.conn.execute(commits_query).fetchall() for c in ct
-        )
+        next_cursor = encode_cursor(rows[limit - 1][:3]) if len(rows) > limit else None
+        return references, next_cursor
 
-    def get_commit_info(self, commit_id: str, subtype: str) -> Tuple[float, int, int]:
+    def get_commit_info(
+        self, commit_id: str, subtype: str = None
+    ) -> Tuple[float, int, int]:
         commit_query = (
             "SELECT line_rate, lines_covered, lines_valid "
             "FROM {table_name} "
-            "WHERE commit_id = '{commit_id}' and type='{type}'';"
-        ).format(
-            table_name=self._table_name(),
-            commit_id=commit_id,
-            type=subtype or "default",
-        )
-        one = self.conn.execute(commit_query).fetchone()
-        return one
+            "WHERE commit_id = ? and type = ?;"
+        ).format(table_name=self._table_name())
+        one = self.conn.execute(commit_query, (commit_id, subtype or "default"))
+        return one.fetchone()
+
+    def get_latest_reference(
+        self, branch: str, subtype: str = None
+    ) -> Optional[Tuple[str, float]]:
+        query = (
+            "SELECT commit_id, line_rate FROM {table_name} "
+            "WHERE branch = ? and type = ?;"
+        ).format(table_name=self._latest_table_name())
+        data_tuple = (branch, subtype or "default")
+        latest = self.conn.execute(query, data_tuple).fetchone()
+        if latest:
+            return latest
+
+        # the references recorded before the pointers existed
+        latest = super().get_latest_reference(branch, subtype or "default")
+        if latest:
+            self._update_latest(branch, subtype, *latest)
+            self.conn.commit()
+        return latest
+
+    def _update_latest(self, branch: str, subtype: str, commit_id, line_rate):
+        statement = (
+            "INSERT OR REPLACE INTO {table_name} "
+            "(branch, type, commit_id, line_rate) VALUES (?, ?, ?, ?)"
+        ).format(table_name=self._latest_table_name())
+        data_tuple = (branch, subtype or "default", commit_id, line_rate)
+        self.conn.execute(statement, data_tuple)
 
     def _update_lts(self, commit_id, path):
         query = (
@@ -284,7 +557,68 @@ class SqliteAdapter(ReferenceAdapter):
         self.conn.execute(query)
         self.conn.commit()
 
-    def retrieve_cc_data(self, commit_id: str, subtype: str = None) -> Optional[bytes]:
+    def retrieve_cc_data(
+        self, commit_id: str, subtype: str = None, encoding: str = "xml"
+    ) -> Optional[bytes]:
+        self._update_count(commit_id, subtype)
+        data = self._retrieve_stored_data(commit_id, subtype)
+        return ccguard_binary.convert(data, encoding) if data else None
+
+    def retrieve_many(
+        self, commit_ids: Iterable[str], subtype: str = None, encoding: str = "xml"
+    ) -> Iterator[Tuple[str, bytes]]:
+        for commit_ids, references in self._retrieve_many_stored(commit_ids, subtype):
+            self._update_counts(commit_ids, subtype)
+            for commit_id, data in references:
+                yield commit_id, ccguard_binary.convert(data, encoding)
+
+    def _retrieve_many_stored(
+        self, commit_ids: Iterable[str], subtype: str
+    ) -> Iterator[Tuple[List[str], List[Tuple[str, bytes]]]]:
+        """
+        Look up the references by chunks, with one query per chunk.
+        Yield each chunk, and its references in the order of the commit ids.
+        """
+        commit_ids = list(dict.fromkeys(commit_ids))
+        for position in range(0, len(commit_ids), self._max_variables):
+            end = position + self._max_variables
+            chunk = commit_ids[position:end]
+            query = (
+                "SELECT commit_id, data, lts FROM {table_name} "
+                "WHERE type = ? AND commit_id IN ({placeholders})"
+            ).format(
+                table_name=self._table_name(),
+                placeholders=", ".join("?" * len(chunk)),
+            )
+            rows = self.conn.execute(query, [subtype or "default"] + chunk)
+            found = {}
+            for commit_id, data, lts in rows:
+                if lts != 0:
+                    with open(data, "rb") as fd:
+                        data = fd.read()
+                found[commit_id] = data
+            references = [
+                (commit_id, found[commit_id])
+                for commit_id in chunk
+                if found.get(commit_id)
+            ]
+            yield chunk, references
+
+    def _update_counts(self, commit_ids: List[str], subtype: str):
+        query = (
+            "UPDATE {table_name} SET count = count + 1 "
+            "WHERE type = ? AND commit_id IN ({placeholders})"
+        ).format(
+            table_name=self._table_name(),
+            placeholders=", ".join("?" * len(commit_ids)),
+        )
+        try:
+            with self.conn:
+                self.conn.execute(query, [subtype or "default"] + commit_ids)
+        except sqlite3.IntegrityError:
+            logging.warning("Unable to update the commit counts.")
+
+    def _retrieve_stored_data(self, commit_id: str, subtype: str) -> Optional[bytes]:
         query = (
             "SELECT data, lts FROM {table_name} "
             'WHERE commit_id="{commit_id}" and type="{type}"'
@@ -294,8 +628,6 @@ class SqliteAdapter(ReferenceAdapter):
             type=subtype or "default",
         )
 
-        self._update_count(commit_id, subtype)
-
         result = self.conn.execute(query).fetchall()
 
         if result:
@@ -322,40 +654,196 @@ class SqliteAdapter(ReferenceAdapter):
         except sqlite3.IntegrityError:
             logging.warning("Unable to update the commit count.")
 
-    def _get_line_coverage(self, data: bytes) -> Tuple[float, int, int]:
-        try:
-            tree = ET.fromstring(data)
-            return (
-                float(tree.get("line-rate", 0.0)),
-                int(tree.get("lines-covered", 0)),
-                int(tree.get("lines-valid", 0)),
+    def list_summaries(
+        self, commit_ids: Iterable[str], subtype: str = None
+    ) -> Iterator[tuple]:
+        # the stored columns: the reports themselves are not read
+        commit_ids = list(dict.fromkeys(commit_ids))
+        for position in range(0, len(commit_ids), self._max_variables):
+            end = position + self._max_variables
+            chunk = commit_ids[position:end]
+            query = (
+                "SELECT commit_id, line_rate, lines_covered, lines_valid, branch, type "
+                "FROM {table_name} WHERE type = ? AND commit_id IN ({placeholders})"
+            ).format(
+                table_name=self._table_name(),
+                placeholders=", ".join("?" * len(chunk)),
             )
-        except ET.XMLSyntaxError:
-            return 0.0, 0, 0
+            rows = self.conn.execute(query, [subtype or "default"] + chunk)
+            found = {row[0]: row for row in rows}
+            for commit_id in chunk:
+                if commit_id in found:
+                    yield found[commit_id]
+
+    def _get_line_coverage(self, data: bytes) -> Tuple[float, int, int]:
+        return line_coverage(data)
 
     def persist(
         self, commit_id: str, data: bytes, branch: str = None, subtype: str = None
     ):
+        try:
+            with self.conn:
+                self._persist(commit_id, data, branch=branch, subtype=subtype)
+        except BaseException:
+            self._on_rollback()
+            raise
+        self._on_commit()
+
+    def persist_many(
+        self, references: Iterable[tuple], batch_size: int = None
+    ) -> List[str]:
+        statuses = []
+        references = iter(references)
+        while True:
+            # the source may be slow (ie. another server, when syncing): it is
+            # read outside of the write transactions, one batch at a time
+            batch = list(itertools.islice(references, batch_size or self.batch_size))
+            if not batch:
+                return statuses
+            statuses.extend(self._persist_batch(batch))
+
+    def _persist_batch(self, references: List[tuple]) -> List[str]:
+        """Record the references in a single transaction."""
+        statuses = []
+        try:
+            with self.conn:
+                if not self.conn.in_transaction:
+                    self.conn.execute("BEGIN")
+                for commit_id, data, branch, subtype in references:
+                    # an invalid reference is rolled back alone
+                    self.conn.execute("SAVEPOINT reference")
+                    try:
+                        recorded = self._persist(
+                            commit_id, data, branch=branch, subtype=subtype
+                        )
+                        statuses.append("recorded" if recorded else "duplicate")
+                    except ValueError:
+                        self.conn.execute("ROLLBACK TO reference")
+                        statuses.append("invalid")
+                    self.conn.execute("RELEASE reference")
+        except BaseException:
+            self._on_rollback()
+            raise
+        self._on_commit()
+        return statuses
+
+    def _on_commit(self):
+        """Called once the references recorded by _persist have been committed."""
+
+    def _on_rollback(self):
+        """Called when the references recorded by _persist have been rolled back."""
+
+    def _persist(
+        self, commit_id: str, data: bytes, branch: str = None, subtype: str = None
+    ) -> bool:
+        """
+        Record a reference in the current transaction, without committing it.
+        Return False when the reference had already been recorded.
+        """
         if not data or not isinstance(data, bytes):
             raise ValueError("Unwilling to persist invalid data.")
 
+        data = self._encode(data)
+
         query = (
             "INSERT INTO {table_name} "
             "(commit_id, data, branch, type, line_rate, lines_covered, lines_valid) "
             "VALUES (?, ?, ?, ?, ?, ?, ?) "
         ).format(table_name=self._table_name())
+        line_rate, lines_covered, lines_valid = self._get_line_coverage(data)
         data_tuple = (
             commit_id,
             data,
             branch,
             subtype or "default",
-            *self._get_line_coverage(data),
+            line_rate,
+            lines_covered,
+            lines_valid,
         )
         try:
             self.conn.execute(query, data_tuple)
-            self.conn.commit()
         except sqlite3.IntegrityError:
             logging.debug("This commit seems to have already been recorded.")
+            return False
+        if branch:
+            self._update_latest(branch, subtype, commit_id, line_rate)
+        self._index_files(commit_id, subtype, data)
+        return True
+
+    def _index_files(self, commit_id: str, subtype: str, data: bytes):
+        query = (
+            "INSERT OR REPLACE INTO {table_name} "
+            "(commit_id, type, filename, lines_covered, lines_valid) "
+            "VALUES (?, ?, ?, ?, ?)"
+        ).format(table_name=self._files_table_name())
+        self.conn.executemany(
+            query,
+            (
+                (commit_id, subtype or "default", filename, covered, valid)
+                for filename, (covered, valid) in file_coverage(data).items()
+            ),
+        )
+
+    def list_file_summaries(
+        self, commit_ids: Iterable[str], path: str = "", subtype: str = None
+    ) -> Iterator[Tuple[str, int, int]]:
+        path = path.strip("/")
+        commit_ids = list(dict.fromkeys(commit_ids))
+        for position in range(0, len(commit_ids), self._max_variables):
+            end = position + self._max_variables
+            chunk = commit_ids[position:end]
+            placeholders = ", ".join("?" * len(chunk))
+            query = (
+                "SELECT commit_id, EXISTS ("
+                "SELECT 1 FROM {files} f WHERE f.commit_id = r.commit_id "
+                "and f.type = r.type) "
+                "FROM {table_name} r WHERE type = ? AND commit_id IN ({placeholders})"
+            ).format(
+                table_name=self._table_name(),
+                files=self._files_table_name(),
+                placeholders=placeholders,
+            )
+            rows = self.conn.execute(query, [subtype or "default"] + chunk).fetchall()
+            recorded = {commit_id for commit_id, _ in rows}
+            # references recorded before the files were indexed
+            self._index_missing_files(
+                [commit_id for commit_id, indexed in rows if not indexed], subtype
+            )
+
+            conditions = ["type = ?", "commit_id IN ({})".format(placeholders)]
+            parameters = [subtype or "default"] + chunk
+            if path:
+                # the file itself, or a range scan of the files of the folder
+                conditions.append("(filename = ? OR (filename >= ? AND filename < ?))")
+                parameters.extend([path, path + "/", path + chr(ord("/") + 1)])
+            query = (
+                "SELECT commit_id, SUM(lines_covered), SUM(lines_valid) "
+                "FROM {files} WHERE {conditions} GROUP BY commit_id"
+            ).format(
+                files=self._files_table_name(), conditions=" and ".join(conditions)
+            )
+            totals = {
+                commit_id: (covered, valid)
+                for commit_id, covered, valid in self.conn.execute(query, parameters)
+            }
+            for commit_id in chunk:
+                if commit_id in recorded:
+                    yield (commit_id,) + totals.get(commit_id, (0, 0))
+
+    def _index_missing_files(self, commit_ids: List[str], subtype: str):
+        if not commit_ids:
+            return
+        with self.conn:
+            for _, references in self._retrieve_many_stored(commit_ids, subtype):
+                for commit_id, data in references:
+                    self._index_files(commit_id, subtype, data)
+
+    def _encode(self, data: bytes) -> bytes:
+        try:
+            return ccguard_binary.convert(data, self.storage_format)
+        except ET.XMLSyntaxError:
+            logging.debug("Persisting data that is not a valid report as is.")
+            return data
 
     def dump(self) -> list:
         query = (
@@ -380,6 +868,149 @@ class SqliteAdapter(ReferenceAdapter):
         )
         statement = ddl.format(table_name=self._table_name())
         self.conn.execute(statement)
+        ddl = (
+            "CREATE INDEX IF NOT EXISTS `{table_name}_collected_at` "
+            "ON `{table_name}` (`collected_at`, `commit_id`, `type`);"
+        )
+        self.conn.execute(ddl.format(table_name=self._table_name()))
+        ddl = (
+            "CREATE TABLE IF NOT EXISTS `{table_name}` ("
+            "`branch` varchar(70) NOT NULL, "
+            "`type` varchar(40) NOT NULL DEFAULT 'default', "
+            "`commit_id` varchar(40) NOT NULL, "
+            "`line_rate` REAL DEFAULT 0.0, "
+            "PRIMARY KEY  (`branch`, `type`) );"
+        )
+        statement = ddl.format(table_name=self._latest_table_name())
+        self.conn.execute(statement)
+        ddl = (
+            "CREATE TABLE IF NOT EXISTS `{table_name}` ("
+            "`commit_id` varchar(40) NOT NULL, "
+            "`type` varchar(40) NOT NULL DEFAULT 'default', "
+            "`filename` TEXT NOT NULL, "
+            "`lines_covered` INT DEFAULT 0, "
+            "`lines_valid` INT DEFAULT 0, "
+            "PRIMARY KEY  (`commit_id`, `type`, `filename`) );"
+        )
+        statement = ddl.format(table_name=self._files_table_name())
+        self.conn.execute(statement)
+
+
+class PackAdapter(SqliteAdapter):
+    """
+    Keeps the SQLite table as the catalogue of references, and serves their
+    data from an append-only pack, mapped in memory, without copying it.
+    The SQLite connection is only opened when the catalogue is needed: the
+    uses of the references (which cleanup relies on) are counted in memory,
+    and recorded at most every `pack.count.interval` seconds.
+    """
+
+    def __init__(self, repository_id, config, metric="coverage", conn=None):
+        ReferenceAdapter.__init__(self, repository_id, config)
+        self.dbpath = str(config.get("sqlite.dbpath"))
+        self.metric = metric
+        self.storage_format = config.get("sqlite.storage.format", "xml")
+        self.batch_size = config.get("sqlite.batch.size", 100)
+        self._owns_conn = conn is None
+        self._conn = conn
+        if conn is not None:
+            self._create_table()
+        pack_path = config.get("pack.path", HOME.joinpath(".ccguard-packs"))
+        pack_path = Path(os.path.expanduser(str(pack_path)))
+        self.pack = ccguard_pack.open_pack(pack_path.joinpath(self._table_name()))
+        self.count_interval = config.get("pack.count.interval", 60)
+        self._pending = []
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.dbpath)
+            self._create_table()
+        return self._conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._conn is not None and self._owns_conn:
+            # the connection is open anyway
+            self._record_uses(interval=0)
+            self._conn.close()
+
+    def _update_count(self, commit_id: str, subtype: str):
+        self._update_counts([commit_id], subtype)
+
+    def _update_counts(self, commit_ids: List[str], subtype: str):
+        self.pack.uses.add(commit_ids, subtype)
+        self._record_uses(self.count_interval)
+
+    def _record_uses(self, interval: float):
+        counts = self.pack.uses.take(interval)
+        if not counts:
+            return
+        query = (
+            "UPDATE {table_name} SET count = count + ? "
+            "WHERE commit_id = ? AND type = ?"
+        ).format(table_name=self._table_name())
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    query,
+                    [
+                        (uses, commit_id, subtype)
+                        for (commit_id, subtype), uses in counts.items()
+                    ],
+                )
+        except sqlite3.Error:
+            logging.warning("Unable to update the commit counts.")
+
+    def retrieve_cc_data(
+        self, commit_id: str, subtype: str = None, encoding: str = "xml"
+    ) -> Optional[bytes]:
+        self._update_count(commit_id, subtype)
+        data = self.pack.get(commit_id, subtype)
+        if data is None:
+            data = self._retrieve_stored_data(commit_id, subtype)
+            if not data:
+                return None
+            # references recorded before the pack existed are added lazily
+            self.pack.append(commit_id, data, subtype)
+        return ccguard_binary.convert(data, encoding)
+
+    def retrieve_many(
+        self, commit_ids: Iterable[str], subtype: str = None, encoding: str = "xml"
+    ) -> Iterator[Tuple[str, bytes]]:
+        commit_ids = list(dict.fromkeys(commit_ids))
+        self._update_counts(commit_ids, subtype)
+        found, missing = {}, []
+        for commit_id in commit_ids:
+            data = self.pack.get(commit_id, subtype)
+            if data is None:
+                missing.append(commit_id)
+            else:
+                found[commit_id] = data
+        for _, references in self._retrieve_many_stored(missing, subtype):
+            for commit_id, data in references:
+                self.pack.append(commit_id, data, subtype)
+                found[commit_id] = data
+
+        for commit_id in commit_ids:
+            if commit_id in found:
+                yield commit_id, ccguard_binary.convert(found[commit_id], encoding)
+
+    def _persist(
+        self, commit_id: str, data: bytes, branch: str = None, subtype: str = None
+    ) -> bool:
+        recorded = super()._persist(commit_id, data, branch=branch, subtype=subtype)
+        if recorded:
+            # the pack cannot be rolled back: it is written once committed
+            self._pending.append((commit_id, self._encode(data), subtype))
+        return recorded
+
+    def _on_commit(self):
+        pending, self._pending = self._pending, []
+        if pending:
+            self.pack.append_many(pending)
+
+    def _on_rollback(self):
+        self._pending = []
 
 
 class WebAdapter(ReferenceAdapter):
@@ -392,18 +1023,178 @@ class WebAdapter(ReferenceAdapter):
             self.server.rstrip("/") if self.server else "http://localhost:5000"
         )
         token = os.environ.get(token_key.replace(".", "_"), None)
-        self.token = token if token else config.get(conf_key, None)
+        self.token = token if token else config.get(token_key, None)
+        self.wire_format = config.get("ccguard.wire.format", "xml")
+        self.wire_compression = config.get("ccguard.wire.compression")
+        self.batch_size = config.get("ccguard.batch.size", 100)
+        self.page_size = config.get("ccguard.page.size", 100)
+        cache_path = config.get("web.cache.path")
+        cache_size = config.get("web.cache.size-mb", 256) * 1024 * 1024
+        self.cache = (
+            ccguard_cache.DiskCache(
+                os.path.expanduser(str(cache_path)), max_size=cache_size
+            )
+            if cache_path
+            else None
+        )
+        self.cache_revalidate = config.get("web.cache.revalidate", False)
         super().__init__(repository_id, config)
 
     def _query_string(self, items: dict):
-        optional_args = ["{}={}".format(k, v) for k, v in items.items() if v]
-        optargs_str = "&".join([arg for arg in optional_args])
+        optargs_str = urlencode([(k, v) for k, v in items.items() if v])
         return "?{}".format(optargs_str) if optargs_str else ""
 
+    def _cache_key(self, commit_id: str, subtype: str = None) -> tuple:
+        return (self.server, self.repository_id, commit_id, subtype or "default")
+
     def get_cc_commits(
         self, count: int = -1, branch=None, subtype: str = None
     ) -> frozenset:
-        options = {"branch": branch, "count": count, "subtype": subtype}
+        page_size = min(count, self.page_size) if count > 0 else self.page_size
+        commits = self.iter_cc_commits(branch, subtype, page_size=page_size)
+        if count > 0:
+            # the following pages are not requested
+            commits = itertools.islice(commits, count)
+        return frozenset(commits)
+
+    def list_references(
+        self,
+        branch: str = None,
+        subtype: str = None,
+        since: str = None,
+        until: str = None,
+        cursor: str = None,
+        limit: int = 100,
+    ) -> Tuple[List[dict], Optional[str]]:
+        options = {
+            "branch": branch,
+            "subtype": subtype,
+            "since": since,
+            "until": until,
+            "cursor": cursor,
+            "limit": limit,
+        }
+        uri = "{p.server}/api/v1/references/{p.repository_id}/list{options}"
+        r = requests.get(uri.format(p=self, options=self._query_string(options)))
+        if r.status_code == 404:
+            raise NotImplementedError("The server does not list references.")
+
+        try:
+            page = r.json()
+            return page["references"], page["next"]
+        except (ValueError, KeyError, TypeError):
+            logging.warning(
+                "Got unexpected server response. Is the server configuration correct?\n%s",
+                r.content.decode("utf-8"),
+            )
+            return [], None
+
+    def iter_cc_commits(
+        self, branch=None, subtype: str = None, page_size: int = None
+    ) -> Iterator[str]:
+        """Iterate over the commit ids, the most recent first, one page at a time."""
+        seen = set()
+        cursor = None
+        try:
+            while True:
+                references, cursor = self.list_references(
+                    branch, subtype, cursor=cursor, limit=page_size or self.page_size
+                )
+                for reference in references:
+                    # the same commit may have references of several subtypes
+                    if reference["commit_id"] not in seen:
+                        seen.add(reference["commit_id"])
+                        yield reference["commit_id"]
+                if not cursor:
+                    return
+        except NotImplementedError:
+            if seen:
+                raise
+            logging.debug("Listing all the references at once.")
+            yield from self._get_all_commits(branch, subtype)
+
+    def resolve_prefix(self, prefix: str, subtype: str = None) -> Optional[str]:
+        if not prefix:
+            return None
+        uri = "{p.server}/api/v1/references/{p.repository_id}/resolve/{prefix}{options}"
+        r = requests.get(
+            uri.format(
+                p=self, prefix=prefix, options=self._query_string({"subtype": subtype})
+            )
+        )
+        if r.status_code == 404:
+            logging.debug("Resolving %s among all the references.", prefix)
+            return super().resolve_prefix(prefix, subtype=subtype)
+
+        try:
+            return r.json()["commit_id"]
+        except (ValueError, KeyError, TypeError):
+            logging.warning(
+                "Got unexpected server response. Is the server configuration correct?\n%s",
+                r.content.decode("utf-8"),
+            )
+            return None
+
+    def list_summaries(
+        self, commit_ids: Iterable[str], subtype: str = None
+    ) -> Iterator[tuple]:
+        commit_ids = list(dict.fromkeys(commit_ids))
+        uri = "{p.server}/api/v1/references/{p.repository_id}/summaries{options}"
+        uri = uri.format(p=self, options=self._query_string({"subtype": subtype}))
+        for position in range(0, len(commit_ids), self.page_size):
+            end = position + self.page_size
+            r = requests.post(uri, json={"commit_ids": commit_ids[position:end]})
+            if r.status_code == 404:
+                logging.debug("Summarizing the references from their data.")
+                yield from super().list_summaries(commit_ids[position:], subtype)
+                return
+
+            try:
+                summaries = r.json()["summaries"]
+            except (ValueError, KeyError, TypeError):
+                logging.warning("Unable to summarize the references: %s", r.status_code)
+                return
+            for summary in summaries:
+                yield (
+                    summary["commit_id"],
+                    summary["line_rate"],
+                    summary["lines_covered"],
+                    summary["lines_valid"],
+                    summary["branch"],
+                    summary["subtype"],
+                )
+
+    def list_file_summaries(
+        self, commit_ids: Iterable[str], path: str = "", subtype: str = None
+    ) -> Iterator[Tuple[str, int, int]]:
+        commit_ids = list(dict.fromkeys(commit_ids))
+        uri = "{p.server}/api/v1/references/{p.repository_id}/file_summaries{options}"
+        options = self._query_string({"path": path, "subtype": subtype})
+        uri = uri.format(p=self, options=options)
+        for position in range(0, len(commit_ids), self.page_size):
+            end = position + self.page_size
+            r = requests.post(uri, json={"commit_ids": commit_ids[position:end]})
+            if r.status_code == 404:
+                logging.debug("Summarizing the files from the references data.")
+                yield from super().list_file_summaries(
+                    commit_ids[position:], path, subtype
+                )
+                return
+
+            try:
+                summaries = r.json()["summaries"]
+            except (ValueError, KeyError, TypeError):
+                logging.warning("Unable to summarize the files: %s", r.status_code)
+                return
+            for summary in summaries:
+                yield (
+                    summary["commit_id"],
+                    summary["lines_covered"],
+                    summary["lines_valid"],
+                )
+
+    def _get_all_commits(self, branch=None, subtype: str = None) -> frozenset:
+        options = {"branch": branch, "subtype": subtype}
 
         uri = "{p.server}/api/v1/references/{p.repository_id}/all{options}"
         uri = uri.format(p=self, options=self._query_string(options))
@@ -419,15 +1210,91 @@ class WebAdapter(ReferenceAdapter):
             )
             return frozenset()
 
-    def retrieve_cc_data(self, commit_id: str, subtype: str = None) -> Optional[bytes]:
-        optional_args = "?{}".format(subtype) if subtype else ""
+    def retrieve_cc_data(
+        self, commit_id: str, subtype: str = None, encoding: str = "xml"
+    ) -> Optional[bytes]:
+        wire_format = self.wire_format if self.wire_format != "xml" else None
+        options = {"subtype": subtype, "format": wire_format}
+        key = self._cache_key(commit_id, subtype)
+        cached = self.cache.get(key) if self.cache else None
+
+        headers = {}
+        if cached:
+            if not self.cache_revalidate:
+                # the data of a commit never changes once uploaded
+                logging.debug("Using the cached data for %s.", commit_id)
+                return ccguard_binary.convert(cached[0], encoding)
+            headers["If-None-Match"] = cached[1].get("etag")
+
         r = requests.get(
             "{p.server}/api/v1/references/"
             "{p.repository_id}/{commit_id}/data{optional_args}".format(
-                p=self, commit_id=commit_id, optional_args=optional_args
-            )
+                p=self,
+                commit_id=commit_id,
+                optional_args=self._query_string(options),
+            ),
+            headers=headers,
+        )
+
+        if cached and r.status_code == 304:
+            logging.debug("The cached data for %s is still valid.", commit_id)
+            return ccguard_binary.convert(cached[0], encoding)
+
+        if r.status_code == 404:
+            return None
+
+        if self.cache and r.status_code == 200 and r.content:
+            self.cache.put(key, r.content, {"etag": r.headers.get("ETag")})
+
+        return ccguard_binary.convert(r.content, encoding)
+
+    def retrieve_many(
+        self, commit_ids: Iterable[str], subtype: str = None, encoding: str = "xml"
+    ) -> Iterator[Tuple[str, bytes]]:
+        missing = list(dict.fromkeys(commit_ids))
+        if self.cache and not self.cache_revalidate:
+            # the data of a commit never changes once uploaded
+            cached = [
+                (commit_id, self.cache.get(self._cache_key(commit_id, subtype)))
+                for commit_id in missing
+            ]
+            missing = [commit_id for commit_id, entry in cached if not entry]
+            for commit_id, entry in cached:
+                if entry:
+                    yield commit_id, ccguard_binary.convert(entry[0], encoding)
+        if not missing:
+            return
+
+        wire_format = self.wire_format if self.wire_format != "xml" else None
+        options = {"subtype": subtype, "format": wire_format}
+        r = requests.post(
+            "{p.server}/api/v1/references/{p.repository_id}/download{options}".format(
+                p=self, options=self._query_string(options)
+            ),
+            json={"commit_ids": missing},
+            stream=True,
         )
-        return r.content
+        if r.status_code in (404, 405):
+            logging.debug("Downloading the references one at a time.")
+            yield from super().retrieve_many(missing, subtype, encoding)
+            return
+        if r.status_code != 200:
+            logging.warning("Unable to download the references: %s", r.status_code)
+            return
+
+        chunks = r.iter_content(ccguard_compression.CHUNK_SIZE)
+        for commit_id, _, data in ccguard_frames.iter_frames(chunks):
+            if self.cache:
+                self.cache.put(self._cache_key(commit_id, subtype), data)
+            yield commit_id, ccguard_binary.convert(data, encoding)
+
+    def _encode(self, data: bytes) -> bytes:
+        if self.wire_format == "binary":
+            try:
+                return ccguard_binary.encode(data)
+            except ET.XMLSyntaxError:
+                logging.debug("Sending data that is not a valid report as is.")
+        return data
 
     def persist(self, commit_id: str, data: bytes, branch=None, subtype: str = None):
         if not data or not isinstance(data, bytes):
@@ -437,6 +1304,14 @@ class WebAdapter(ReferenceAdapter):
         if self.token:
             headers["Authorization"] = self.token
 
+        data = self._encode(data)
+        if ccguard_binary.is_binary(data):
+            headers["Content-Type"] = ccguard_binary.MIMETYPE
+
+        if self.wire_compression:
+            data = ccguard_compression.compress(data, self.wire_compression)
+            headers["Content-Encoding"] = self.wire_compression
+
         options = {"branch": branch, "subtype": subtype}
         requests.put(
             "{p.server}/api/v1/references/"
@@ -449,20 +1324,119 @@ class WebAdapter(ReferenceAdapter):
             data=data,
         )
 
-    def dump(self) -> list:
-        references = requests.get(
-            "{p.server}/api/v1/references/{p.repository_id}/all".format(p=self)
-        )
-        if references.ok:
-            logging.debug("References: \n%r", references)
-            data = {
-                commit_id: self.retrieve_cc_data(commit_id)
-                for commit_id in references.json()[:30]
+    def persist_many(
+        self, references: Iterable[tuple], batch_size: int = None
+    ) -> List[str]:
+        batch_size = batch_size or self.batch_size
+        statuses, batch = [], []
+        for reference in references:
+            batch.append(reference)
+            if len(batch) >= batch_size:
+                statuses.extend(self._persist_batch(batch))
+                batch = []
+        if batch:
+            statuses.extend(self._persist_batch(batch))
+        return statuses
+
+    def _persist_batch(self, batch: List[tuple]) -> List[str]:
+        lines = []
+        for commit_id, data, branch, subtype in batch:
+            if not data or not isinstance(data, bytes):
+                # the server reports it as invalid, keeping the statuses aligned
+                data = b""
+            item = {
+                "commit_id": commit_id,
+                "branch": branch,
+                "subtype": subtype,
+                "data": base64.b64encode(self._encode(data)).decode("ascii"),
             }
-            return data.items()
+            lines.append(json.dumps(item))
+        body = "\n".join(lines).encode("utf-8")
+
+        headers = {"Content-Type": "application/x-ndjson"}
+        if self.token:
+            headers["Authorization"] = self.token
+        if self.wire_compression:
+            body = ccguard_compression.compress(body, self.wire_compression)
+            headers["Content-Encoding"] = self.wire_compression
+
+        r = requests.post(
+            "{p.server}/api/v1/references/{p.repository_id}/batch".format(p=self),
+            headers=headers,
+            data=body,
+        )
+        if r.status_code in (404, 405):
+            logging.debug("Uploading the references one at a time.")
+            return super().persist_many(batch)
+        try:
+            return [item["status"] for item in r.json()["items"]]
+        except (ValueError, KeyError, TypeError):
+            logging.warning(
+                "Unable to record %d references: %s", len(batch), r.status_code
+            )
+            return ["error"] * len(batch)
+
+    def dump(self) -> list:
+        # the 30 most recent references
+        commit_ids = list(itertools.islice(self.iter_cc_commits(page_size=30), 30))
+        logging.debug("References: \n%r", commit_ids)
+        return list(self.retrieve_many(commit_ids))
+
+
+def line_coverage(data: bytes) -> Tuple[float, int, int]:
+    """Return the line rate, the lines covered and the lines valid of a report."""
+    if ccguard_binary.is_binary(data):
+        report = ccguard_binary.BinaryCoverage(data)
+        return report.line_rate, report.lines_covered, report.lines_valid
+    try:
+        tree = ET.fromstring(bytes(data))
+        return (
+            float(tree.get("line-rate", 0.0)),
+            int(tree.get("lines-covered", 0)),
+            int(tree.get("lines-valid", 0)),
+        )
+    except ET.XMLSyntaxError:
+        return 0.0, 0, 0
+
+
+def file_coverage(data: bytes) -> Dict[str, Tuple[int, int]]:
+    """Return the lines covered and the lines valid of each file of a report."""
+    try:
+        if not ccguard_binary.is_binary(data):
+            data = ccguard_binary.encode(bytes(data))
+        report = ccguard_binary.BinaryCoverage(data)
+    except (ET.XMLSyntaxError, ValueError, OverflowError, struct.error):
+        # ie. hits the binary encoding cannot hold: the files are not indexed
+        logging.warning("Unable to summarize the files of a report.")
+        return {}
+    return {filename: report.summary(filename) for filename in report.files()}
+
+
+def in_path(filename: str, path: str) -> bool:
+    """Whether filename is path, or a file of the folder path."""
+    path = path.strip("/")
+    return not path or filename == path or filename.startswith(path + "/")
+
+
+def parse_timestamp(value: str) -> str:
+    """Normalize an ISO 8601 date to the format of the collected_at column (UTC)."""
+    timestamp = datetime.datetime.fromisoformat(value)
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def encode_cursor(values: tuple) -> str:
+    data = json.dumps(list(values)).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
 
-        logging.error("Unexpected failure on dump: %s", references.text)
-        return []
+def decode_cursor(cursor: str) -> list:
+    data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    values = json.loads(data)
+    if not isinstance(values, list) or len(values) != 3:
+        raise ValueError("Invalid cursor.")
+    return values
 
 
 def determine_parent_commit(
@@ -540,7 +1514,9 @@ def parse_args(args=None, parser=None):
 
     parse_common_args(parser)
 
-    parser.add_argument("report", help="the coverage report for the current commit ID")
+    parser.add_argument(
+        "report", nargs="?", help="the coverage report for the current commit ID"
+    )
     parser.add_argument(
         "--target-branch",
         dest="target_branch",
@@ -576,8 +1552,22 @@ def parse_args(args=None, parser=None):
         dest="hard_minimum",
         help="Define a hard miniùum threshold (percentage).",
     )
+    parser.add_argument(
+        "--daemon",
+        dest="daemon",
+        help="keep serving ccguard_client invocations on a local socket",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--socket",
+        dest="socket",
+        help="the socket on which the daemon listens (default: ~/.ccguard.sock)",
+    )
 
-    return parser.parse_args(args)
+    args = parser.parse_args(args)
+    if not args.report and not args.daemon:
+        parser.error("the following arguments are required: report")
+    return args
 
 
 def str_to_class(classname):
@@ -589,6 +1579,31 @@ def adapter_factory(adapter: str, config: dict) -> ReferenceAdapter:
     return str_to_class(KNOWN_ADAPTERS[selected])
 
 
+class Session(object):
+    """
+    Provides main with the state it needs. This one is created afresh on
+    each invocation; the daemon (see ccguard_daemon) keeps it warm.
+    """
+
+    def git(self, repository_folder, repository_desambiguate=None) -> GitAdapter:
+        return GitAdapter(repository_folder, repository_desambiguate)
+
+    def configuration(self, repository_path) -> dict:
+        return configuration(repository_path)
+
+    def adapter(self, adapter: str, repository_id: str, config: dict):
+        """Return a context manager yielding the reference adapter."""
+        return adapter_factory(adapter, config)(repository_id, config)
+
+    def reference(self, commit_id, subtype, source, data: bytes, config: dict = None):
+        data = normalized_reference(
+            commit_id, subtype, source, data, reference_cache(config or {})
+        )
+        return _versioned().VersionedCobertura(
+            io.BytesIO(data), source=source, commit_id=commit_id
+        )
+
+
 def iter_callable(git, ref):
     def call():
         return git.iter_git_commits([ref])
@@ -596,7 +1611,9 @@ def iter_callable(git, ref):
     return call
 
 
-def print_cc_report(challenger: Cobertura, report_file=None, log_function=print):
+def print_cc_report(
+    challenger: "pycobertura.Cobertura", report_file=None, log_function=print
+):
     if len(challenger.files()) > 5:
         log_function("Filename      Stmts    Miss  Cover")
         log_function("----------  -------  ------  -------")
@@ -610,15 +1627,19 @@ def print_cc_report(challenger: Cobertura, report_file=None, log_function=print)
             )
         )
     else:
-        log_function("{}{}".format(TextReporter(challenger).generate(), "\n"))
+        log_function(
+            "{}{}".format(pycobertura.TextReporter(challenger).generate(), "\n")
+        )
 
     if report_file and report_file.endswith("html"):
-        report = HtmlReporter(challenger)
+        report = reporters.HtmlReporter(challenger)
         with open(report_file, "w") as ccfile:
             ccfile.write(report.generate())
 
 
-def has_better_coverage(diff: CoberturaDiff, tolerance=0, hard_minimum=-1) -> bool:
+def has_better_coverage(
+    diff: "pycobertura.CoberturaDiff", tolerance=0, hard_minimum=-1
+) -> bool:
     if diff.has_better_coverage():
         return True
 
@@ -683,7 +1704,7 @@ def has_better_coverage(diff: CoberturaDiff, tolerance=0, hard_minimum=-1) -> bo
 
 
 def print_diff_message(
-    diff: CoberturaDiff, log_function=print, has_coverage_improved=False
+    diff: "pycobertura.CoberturaDiff", log_function=print, has_coverage_improved=False
 ):
     if has_coverage_improved:
         log_function(
@@ -705,11 +1726,11 @@ def print_diff_message(
 
 
 def print_delta_report(reference, challenger, report_file=None, log_function=print):
-    delta = TextReporterDelta(reference, challenger)
+    delta = pycobertura.TextReporterDelta(reference, challenger)
     log_function(delta.generate())
 
     if report_file and report_file.endswith(".html"):
-        delta = HtmlReporterDelta(reference, challenger)
+        delta = reporters.HtmlReporterDelta(reference, challenger)
         with open(report_file, "w") as diff_file:
             diff_file.write(delta.generate())
 
@@ -726,6 +1747,35 @@ def normalize_report_paths(report, repository_root):
     return tree
 
 
+def reference_cache(config: dict) -> Optional[ccguard_cache.DiskCache]:
+    path = config.get("reference.cache.path")
+    if not path:
+        return None
+    max_size = config.get("reference.cache.size-mb", 256) * 1024 * 1024
+    return ccguard_cache.DiskCache(os.path.expanduser(str(path)), max_size=max_size)
+
+
+def normalized_reference(
+    commit_id, subtype, source, data: bytes, cache: ccguard_cache.DiskCache = None
+) -> bytes:
+    """
+    Normalize the paths of a reference report, unless the same report has
+    already been normalized for this repository root.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    key = ("reference", commit_id, subtype or "default", source, digest)
+    entry = cache.get(key) if cache else None
+    if entry:
+        logging.debug("Normalized reference %s found in the cache.", commit_id)
+        return entry[0]
+
+    tree = normalize_report_paths(io.BytesIO(data), source)
+    normalized = ET.tostring(tree)
+    if cache:
+        cache.put(key, normalized)
+    return normalized
+
+
 def guess_relative_path(repository_root, abs_file_path, prefix=None):
     best_hypothesis_with_prefix = None
 
@@ -802,7 +1852,7 @@ def _normalize_report_paths(xml, repository_root):
     return xml
 
 
-def main(args=None, log_function=print, logging_module=logging):
+def main(args=None, log_function=print, logging_module=logging, session=None):
     args = parse_args(args)
 
     if args.debug:
@@ -810,7 +1860,15 @@ def main(args=None, log_function=print, logging_module=logging):
     else:
         logging_module.getLogger().setLevel(logging.INFO)
 
-    git = GitAdapter(args.repository, args.repository_id_modifier)
+    if args.daemon:
+        try:
+            from . import ccguard_daemon
+        except ImportError:  # executed as a script
+            import ccguard_daemon
+        return ccguard_daemon.serve(args.socket)
+
+    session = session or Session()
+    git = session.git(args.repository, args.repository_id_modifier)
     repository_id = git.get_repository_id()
     logging_module.info("Your repository ID is %s", repository_id)
     current_commit_id = git.get_current_commit_id()
@@ -831,11 +1889,11 @@ def main(args=None, log_function=print, logging_module=logging):
     tree.write(args.report)
 
     diff, reference = None, None
-    challenger = Cobertura(args.report, source=source)
+    challenger = pycobertura.Cobertura(args.report, source=source)
 
-    config = configuration(args.repository)
+    config = session.configuration(args.repository)
 
-    with adapter_factory(args.adapter, config)(repository_id, config) as adapter:
+    with session.adapter(args.adapter, repository_id, config) as adapter:
         reference_commits = adapter.get_cc_commits(subtype=args.subtype)
         logging_module.debug(
             "Found the following reference commits: %r", reference_commits
@@ -862,13 +1920,10 @@ def main(args=None, log_function=print, logging_module=logging):
             )
             logging_module.debug("Reference data: %r", cc_reference_data)
             if cc_reference_data:
-                reference_fd = io.BytesIO(cc_reference_data)
-                normalize_report_paths(reference_fd, source)
-                reference_fd.seek(0, 0)
-                reference = VersionedCobertura(
-                    reference_fd, source=source, commit_id=commit_id
+                reference = session.reference(
+                    commit_id, args.subtype, source, cc_reference_data, config
                 )
-                diff = CoberturaDiff(reference, challenger)
+                diff = pycobertura.CoberturaDiff(reference, challenger)
             else:
                 logging_module.error("No data for the selected reference.")
         else:
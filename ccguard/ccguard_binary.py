@@ -0,0 +1,232 @@
+"""
+A compact binary encoding of a Cobertura report.
+
+Layout (little endian):
+
+    header   magic, version, line rate, lines covered, lines valid,
+             number of files, length of the metadata block
+    metadata JSON object (sources, ccguard root source)
+    index    one entry per file: name, package, offset of its runs,
+             number of runs, lines covered, lines valid
+    runs     per file, (first line, run length, hits) triplets covering
+             consecutive lines with the same number of hits
+
+Only the header and the index are decoded when a report is opened, so
+reading the lines of a single file does not require parsing the whole
+report. Branch coverage is not preserved.
+"""
+
+import json
+import mmap
+import struct
+from typing import Dict, Iterator, List, Tuple, Union
+
+try:
+    from .ccguard_lazy import lazy_import
+except ImportError:  # executed as a script
+    from ccguard_lazy import lazy_import
+
+ET = lazy_import("lxml.etree")
+
+MAGIC = b"CCGB"
+VERSION = 2
+MIMETYPE = "application/vnd.ccguard.coverage"
+
+_HEADER = struct.Struct("<4sHdIIII")
+_ENTRY = struct.Struct("<HHIIII")
+_RUN = struct.Struct("<IIQ")
+# the runs of each version: the hits of version 1 are 32 bits wide
+_RUNS = {1: struct.Struct("<III"), VERSION: _RUN}
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+def is_binary(data) -> bool:
+    return bool(data) and bytes(data[: len(MAGIC)]) == MAGIC
+
+
+def _runs(lines: Dict[int, int]) -> List[Tuple[int, int, int]]:
+    runs = []
+    for number in sorted(lines):
+        hits = lines[number]
+        if runs:
+            start, length, previous = runs[-1]
+            if start + length == number and previous == hits:
+                runs[-1] = (start, length + 1, hits)
+                continue
+        runs.append((number, 1, hits))
+    return runs
+
+
+def encode(data: bytes) -> bytes:
+    """Encode a Cobertura XML report. Binary data is returned as is."""
+    if is_binary(data):
+        return bytes(data)
+
+    xml = ET.fromstring(data)
+
+    files, packages = {}, {}
+    for package in xml.iterfind("packages/package"):
+        for klass in package.iterfind("classes/class"):
+            filename = klass.get("filename")
+            lines = files.setdefault(filename, {})
+            packages.setdefault(filename, package.get("name", ""))
+            for line in klass.iterfind("lines/line"):
+                number, hits = int(line.get("number")), int(line.get("hits", 0))
+                lines[number] = max(hits, lines.get(number, 0))
+
+    sources, root = [], ""
+    for source in xml.iterfind("sources/source"):
+        if source.get("class") == "ccguard-meta-sources-root":
+            root = source.text or ""
+        else:
+            sources.append(source.text or "")
+    metadata = json.dumps({"sources": sources, "root": root}).encode("utf-8")
+
+    index, body = [], []
+    offset, total_covered, total_valid = 0, 0, 0
+    for filename, lines in files.items():
+        runs = _runs(lines)
+        covered = len([hits for hits in lines.values() if hits])
+        name = filename.encode("utf-8")
+        package = packages[filename].encode("utf-8")
+        index.append(
+            _ENTRY.pack(len(name), len(package), offset, len(runs), covered, len(lines))
+            + name
+            + package
+        )
+        body.extend(_RUN.pack(*run) for run in runs)
+        offset += len(runs) * _RUN.size
+        total_covered += covered
+        total_valid += len(lines)
+
+    line_rate = xml.get("line-rate")
+    line_rate = (
+        float(line_rate)
+        if line_rate is not None
+        else (total_covered / total_valid if total_valid else 0.0)
+    )
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        line_rate,
+        int(xml.get("lines-covered", total_covered)),
+        int(xml.get("lines-valid", total_valid)),
+        len(index),
+        len(metadata),
+    )
+    return b"".join([header, metadata, *index, *body])
+
+
+class BinaryCoverage(object):
+    def __init__(self, buffer: Buffer):
+        self.buffer = memoryview(buffer)
+        (
+            magic,
+            version,
+            self.line_rate,
+            self.lines_covered,
+            self.lines_valid,
+            files_count,
+            metadata_length,
+        ) = _HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version not in _RUNS:
+            raise ValueError("Not a ccguard binary coverage report.")
+        self._run = _RUNS[version]
+
+        position, end = _HEADER.size, _HEADER.size + metadata_length
+        self.metadata = json.loads(bytes(self.buffer[position:end]).decode("utf-8"))
+        position = end
+
+        entries = []
+        for _ in range(files_count):
+            name_length, package_length, *entry = _ENTRY.unpack_from(
+                self.buffer, position
+            )
+            position += _ENTRY.size
+            end = position + name_length
+            name = bytes(self.buffer[position:end])
+            position, end = end, end + package_length
+            package = bytes(self.buffer[position:end])
+            position = end
+            entries.append((name.decode("utf-8"), package.decode("utf-8"), entry))
+
+        self._index = {
+            name: (package, position + offset, runs, covered, valid)
+            for name, package, (offset, runs, covered, valid) in entries
+        }
+
+    def files(self) -> List[str]:
+        return list(self._index)
+
+    def package(self, filename: str) -> str:
+        return self._index[filename][0]
+
+    def summary(self, filename: str) -> Tuple[int, int]:
+        _, _, _, covered, valid = self._index[filename]
+        return covered, valid
+
+    def lines(self, filename: str) -> Iterator[Tuple[int, int]]:
+        _, offset, runs, _, _ = self._index[filename]
+        end = offset + runs * self._run.size
+        for start, length, hits in self._run.iter_unpack(self.buffer[offset:end]):
+            for number in range(start, start + length):
+                yield number, hits
+
+    def to_xml(self) -> bytes:
+        coverage = ET.Element("coverage")
+        coverage.set("branch-rate", "0")
+        coverage.set("branches-covered", "0")
+        coverage.set("branches-valid", "0")
+        coverage.set("line-rate", str(self.line_rate))
+        coverage.set("lines-covered", str(self.lines_covered))
+        coverage.set("lines-valid", str(self.lines_valid))
+
+        sources = ET.SubElement(coverage, "sources")
+        for path in self.metadata.get("sources", []):
+            ET.SubElement(sources, "source").text = path
+        if self.metadata.get("root"):
+            root = ET.SubElement(sources, "source")
+            root.set("class", "ccguard-meta-sources-root")
+            root.text = self.metadata["root"]
+
+        packages_elem = ET.SubElement(coverage, "packages")
+        packages = {}
+        for filename in self.files():
+            packages.setdefault(self.package(filename), []).append(filename)
+
+        for package, filenames in packages.items():
+            package_elem = ET.SubElement(packages_elem, "package")
+            package_elem.set("name", package)
+            classes_elem = ET.SubElement(package_elem, "classes")
+            for filename in filenames:
+                covered, valid = self.summary(filename)
+                class_elem = ET.SubElement(classes_elem, "class")
+                class_elem.set("filename", filename)
+                class_elem.set("name", filename)
+                class_elem.set("line-rate", str(covered / valid if valid else 0.0))
+                lines_elem = ET.SubElement(class_elem, "lines")
+                for number, hits in self.lines(filename):
+                    line_elem = ET.SubElement(lines_elem, "line")
+                    line_elem.set("number", str(number))
+                    line_elem.set("hits", str(hits))
+
+        return ET.tostring(coverage)
+
+
+def decode(data: Buffer) -> bytes:
+    """Decode a binary report to Cobertura XML. XML data is returned as is."""
+    if not is_binary(data):
+        return data
+    return BinaryCoverage(data).to_xml()
+
+
+def load(path: str) -> BinaryCoverage:
+    with open(path, "rb") as fd:
+        return BinaryCoverage(mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def convert(data: bytes, encoding: str = None) -> bytes:
+    if encoding == "binary":
+        return encode(data)
+    return decode(data)
@@ -0,0 +1,171 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+
+class DiskCache(object):
+    """
+    A folder of cache entries. Each entry holds a line of JSON metadata
+    (for example, the ETag the server returned) followed by the data.
+
+    Entries are written atomically, so that concurrent processes sharing the
+    folder never read a partial entry. When a maximum size is given, the least
+    recently used entries are evicted once the folder grows beyond it: the
+    size of the folder is kept in its `.size` file, so that the entries are
+    only listed when some have to be evicted.
+    """
+
+    def __init__(self, path, max_size: int = None):
+        self.path = Path(path)
+        self.max_size = max_size
+
+    def _entry_path(self, key: tuple) -> Path:
+        digest = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return self.path.joinpath(digest[:2], digest)
+
+    def get(self, key: tuple) -> Optional[Tuple[bytes, dict]]:
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as fd:
+                metadata = json.loads(fd.readline().decode("utf-8"))
+                data = fd.read()
+        except (FileNotFoundError, ValueError):
+            return None
+
+        try:
+            # the modification time tells the eviction which entries were used
+            os.utime(path)
+        except OSError:
+            pass
+        return data, metadata
+
+    def put(self, key: tuple, data: bytes, metadata: dict = None):
+        path = self._entry_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=path.parent, prefix=".tmp-", delete=False
+            ) as fd:
+                fd.write(json.dumps(metadata or {}).encode("utf-8") + b"\n")
+                fd.write(data)
+                size = fd.tell()
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(fd.name, path)
+        except OSError:
+            logging.warning("Unable to write the cache entry %s.", path)
+            return
+
+        if self.max_size is not None:
+            try:
+                self._grow(size - replaced)
+            except OSError:
+                logging.warning("Unable to update the size of the cache %s.", self.path)
+
+    def _grow(self, delta: int):
+        """Add delta to the size of the folder, evicting entries beyond max_size."""
+        fd = os.open(self.path.joinpath(".size"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            content = os.read(fd, 32)
+            try:
+                total = int(content) + delta
+            except ValueError:
+                # a new size file: the entries (this one included) are counted
+                total = self.size()
+            if total > self.max_size:
+                total = self.evict(self.max_size)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, str(total).encode("ascii"))
+        finally:
+            os.close(fd)
+
+    def _entries(self):
+        if not self.path.is_dir():
+            return
+        for folder in self.path.iterdir():
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder):
+                if entry.is_file() and not entry.name.startswith(".tmp-"):
+                    yield entry
+
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self, max_size: int) -> int:
+        """Evict the least recently used entries, and return the remaining size."""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            try:
+                os.unlink(path)
+                logging.debug("Evicted %s from the cache.", path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+class TTLCache(object):
+    """
+    A bounded, in-process cache whose entries expire after `ttl` seconds.
+    The least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl: float = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
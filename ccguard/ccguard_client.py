@@ -0,0 +1,64 @@
+"""
+A thin client for `ccguard --daemon`, for pre-commit hooks and editors.
+
+The arguments and the working directory are forwarded to the daemon,
+which runs ccguard and streams its output back. When no daemon listens,
+ccguard runs in this process instead.
+
+    ccguard --daemon &
+    ccguard_client --consider-uncommitted-changes coverage.xml
+
+Only the standard library is imported here, unless ccguard has to run in
+this process.
+"""
+
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".ccguard.sock")
+SOCKET_KEY = "ccguard.daemon.socket"
+
+
+def socket_path(path: str = None) -> str:
+    return path or os.environ.get(SOCKET_KEY.replace(".", "_")) or DEFAULT_SOCKET
+
+
+def send_message(stream, **message):
+    stream.write(json.dumps(message).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def forward(args, path: str = None, stdout=None, stderr=None) -> int:
+    """Run ccguard with `args` on the daemon, and return its exit code."""
+    outputs = {"stdout": stdout or sys.stdout, "stderr": stderr or sys.stderr}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path(path))
+        with client.makefile("rwb") as stream:
+            send_message(stream, args=list(args), cwd=os.getcwd())
+            for line in stream:
+                message = json.loads(line)
+                if "exit" in message:
+                    return message["exit"]
+                output = outputs[message["output"]]
+                output.write(message["data"])
+                output.flush()
+    raise ConnectionError("The daemon closed the connection.")
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    try:
+        code = forward(args)
+    except (FileNotFoundError, ConnectionRefusedError):
+        try:
+            from . import ccguard
+        except ImportError:  # executed as a script
+            import ccguard
+        code = ccguard.main(args)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import zlib
+from typing import Iterable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+class PayloadTooLarge(ValueError):
+    pass
+
+
+class InvalidPayload(ValueError):
+    pass
+
+
+def supported_encodings():
+    return ["zstd", "gzip"] if zstandard else ["gzip"]
+
+
+def _compressor(encoding: str):
+    if encoding == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if encoding == "zstd" and zstandard:
+        return zstandard.ZstdCompressor().compressobj()
+    raise UnsupportedEncoding(encoding)
+
+
+def _decompressor(encoding: str):
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "zstd" and zstandard:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise UnsupportedEncoding(encoding)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    return b"".join(compress_stream(data, encoding))
+
+
+def compress_stream(data, encoding: str) -> Iterator[bytes]:
+    compressor = _compressor(encoding)
+    view = memoryview(data)
+    for position in range(0, len(view), CHUNK_SIZE):
+        end = position + CHUNK_SIZE
+        chunk = compressor.compress(view[position:end])
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    compressor = _compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# a zstd block expands to at most 128 KB and takes at least 4 bytes: feeding
+# the decompressor 256 bytes at a time bounds the output of each step
+ZSTD_SLICE_SIZE = 256
+
+
+def _decompress_chunks(decompressor, encoding: str, chunks) -> Iterator[bytes]:
+    """Decompress the chunks, without expanding any of them at once."""
+    for chunk in chunks:
+        if encoding == "gzip":
+            data = chunk
+            while data:
+                yield decompressor.decompress(data, CHUNK_SIZE)
+                data = decompressor.unconsumed_tail
+        else:
+            view = memoryview(chunk)
+            for position in range(0, len(view), ZSTD_SLICE_SIZE):
+                end = position + ZSTD_SLICE_SIZE
+                yield decompressor.decompress(view[position:end])
+
+    if encoding == "gzip":
+        # the output still pending once the whole input has been consumed
+        while not decompressor.eof:
+            data = decompressor.decompress(b"", CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+
+def decompress_stream(
+    chunks: Iterable[bytes], encoding: str, max_size: int = None
+) -> bytes:
+    decompressor = _decompressor(encoding)
+    errors = (zlib.error, zstandard.ZstdError) if zstandard else (zlib.error,)
+    output, size = [], 0
+    try:
+        for data in _decompress_chunks(decompressor, encoding, chunks):
+            size += len(data)
+            if max_size is not None and size > max_size:
+                raise PayloadTooLarge(size)
+            output.append(data)
+    except errors as exception:
+        raise InvalidPayload(str(exception))
+    if not decompressor.eof:
+        raise InvalidPayload("The payload is truncated.")
+    if decompressor.unused_data:
+        raise InvalidPayload("The payload has trailing data.")
+    return b"".join(output)
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    return decompress_stream([data], encoding)
+
+
+def read_chunks(stream) -> Iterator[bytes]:
+    return iter(lambda: stream.read(CHUNK_SIZE), b"")
+
+
+def negotiate(accept_encoding) -> Optional[str]:
+    """Choose the preferred encoding among the ones the client accepts."""
+    for encoding in supported_encodings():
+        if accept_encoding[encoding]:
+            return encoding
+    return None
@@ -1,11 +1,14 @@
+import io
 import re
 import os
+import sys
 import time
 import argparse
 from collections import defaultdict
 import lxml.etree as ET
 from lxml import objectify
 import ccguard
+from ccguard import ccguard_binary
 from pycobertura import Cobertura
 from pycobertura.reporters import HtmlReporter
 from fnmatch import fnmatch
@@ -167,14 +170,14 @@ def parse_args(args=None):
         "-if",
         "--input-format",
         dest="input_format",
-        help="The format of the input report. (Supported: go, xml)",
+        help="The format of the input report. (Supported: go, xml, binary)",
     )
 
     parser.add_argument(
         "-of",
         "--output-format",
         dest="output_format",
-        help="The format of the input report. (Supported: xml, html)",
+        help="The format of the output report. (Supported: xml, html, binary)",
         default="xml",
     )
 
@@ -192,6 +195,8 @@ def main(args=None):
         xml = serialize(*convert_golang_report(args.report))
     if args.input_format == "xml":
         xml = ET.parse(args.report).getroot()
+    if args.input_format == "binary":
+        xml = ET.fromstring(ccguard_binary.load(args.report).to_xml())
     if xml is None:
         print("fatal: nothing to do")
         return
@@ -200,11 +205,17 @@ def main(args=None):
             print(ET.tostring(xml, pretty_print=True))
         else:
             write(args.output, ET.tostring(xml, pretty_print=True))
+    elif args.output_format == "binary":
+        data = ccguard_binary.encode(ET.tostring(xml))
+        if not args.output:
+            sys.stdout.buffer.write(data)
+        else:
+            write(args.output, data)
     elif args.output_format == "html":
         source = ccguard.GitAdapter(
             os.path.dirname(args.report) or ".", args.repository_id_modifier
         ).get_root_path()
-        challenger = Cobertura(args.report, source=source)
+        challenger = Cobertura(io.BytesIO(ET.tostring(xml)), source=source)
         report = HtmlReporter(challenger)
         if not args.output:
             print(report.generate())
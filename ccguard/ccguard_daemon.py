@@ -0,0 +1,205 @@
+"""
+`ccguard --daemon`: keeps ccguard warm for pre-commit hooks and editors.
+
+The daemon listens on a Unix socket, for ccguard_client. The invocations
+run one at a time in the daemon process, in the working directory of the
+client, and their output is streamed back. The repository ids and roots,
+the configurations, the reference adapters (with their database
+connections) and the parsed references are kept from one invocation to
+the next.
+
+The daemon keeps its own environment: the environment variables of the
+clients are not forwarded.
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import traceback
+from collections import OrderedDict
+
+try:
+    from . import ccguard, ccguard_client
+except ImportError:  # executed as a script
+    import ccguard
+    import ccguard_client
+
+
+class WarmGitAdapter(ccguard.GitAdapter):
+    """Remembers what does not change with the checked out commit."""
+
+    def __init__(self, repository_folder=".", repository_desambiguate=None):
+        super().__init__(repository_folder, repository_desambiguate)
+        self._repository_id = None
+        self._root_path = None
+
+    def get_repository_id(self):
+        if self._repository_id is None:
+            self._repository_id = super().get_repository_id()
+        return self._repository_id
+
+    def get_root_path(self):
+        if self._root_path is None:
+            self._root_path = super().get_root_path()
+        return self._root_path
+
+
+class WarmSession(ccguard.Session):
+    def __init__(self, max_references: int = 16):
+        self.max_references = max_references
+        self._git = {}
+        self._configurations = {}
+        self._adapters = {}
+        self._references = OrderedDict()
+
+    def git(self, repository_folder, repository_desambiguate=None):
+        key = (os.path.abspath(repository_folder), repository_desambiguate)
+        if key not in self._git:
+            self._git[key] = WarmGitAdapter(*key)
+        return self._git[key]
+
+    def configuration(self, repository_path) -> dict:
+        path = os.path.abspath(repository_path)
+        if path not in self._configurations:
+            self._configurations[path] = ccguard.ConfigurationCache(
+                path, check_interval=0
+            )
+        return self._configurations[path].get()
+
+    def adapter(self, adapter: str, repository_id: str, config: dict):
+        adapter_class = ccguard.adapter_factory(adapter, config)
+        key = (adapter_class, repository_id)
+        cached_config, manager, adapter = self._adapters.get(key, (None, None, None))
+        if cached_config is not config:
+            # the configuration has changed since the adapter has been created
+            if manager is not None:
+                manager.__exit__(None, None, None)
+            manager = adapter_class(repository_id, config)
+            adapter = manager.__enter__()
+            self._adapters[key] = (config, manager, adapter)
+        return contextlib.nullcontext(adapter)
+
+    def reference(self, commit_id, subtype, source, data: bytes, config: dict = None):
+        key = (commit_id, subtype, source, hashlib.sha256(data).hexdigest())
+        if key in self._references:
+            self._references.move_to_end(key)
+            return self._references[key]
+        reference = super().reference(commit_id, subtype, source, data, config)
+        self._references[key] = reference
+        while len(self._references) > self.max_references:
+            self._references.popitem(last=False)
+        return reference
+
+    def close(self):
+        for _, manager, _ in self._adapters.values():
+            manager.__exit__(None, None, None)
+        self._adapters.clear()
+        self._references.clear()
+
+
+class Output(io.TextIOBase):
+    """Forwards what is written to one of the outputs of the client."""
+
+    def __init__(self, stream, name: str):
+        self.stream = stream
+        self.name = name
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        ccguard_client.send_message(self.stream, output=self.name, data=text)
+        return len(text)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:  # ie. is_listening
+            return
+        request = json.loads(line)
+        code = self.server.run(request["args"], request["cwd"], self.wfile)
+        ccguard_client.send_message(self.wfile, exit=code)
+
+
+class Daemon(socketserver.UnixStreamServer):
+    def __init__(self, path: str, session: WarmSession = None):
+        self.path = path
+        self.session = session or WarmSession()
+        super().__init__(path, Handler)
+        os.chmod(path, 0o600)
+
+    def run(self, args, cwd, stream) -> int:
+        stdout, stderr = Output(stream, "stdout"), Output(stream, "stderr")
+        if "--daemon" in args:
+            stderr.write("ccguard_client cannot start a daemon.\n")
+            return 2
+
+        handler = logging.StreamHandler(stderr)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root = logging.getLogger()
+        handlers, level = root.handlers, root.level
+        root.handlers = [handler]
+        previous = os.getcwd()
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                ccguard.main(args, session=self.session)
+            return 0
+        except SystemExit as exception:
+            if exception.code is None or isinstance(exception.code, int):
+                return exception.code or 0
+            stderr.write("{}\n".format(exception.code))
+            return 1
+        except Exception:
+            stderr.write(traceback.format_exc())
+            return 1
+        finally:
+            os.chdir(previous)
+            root.handlers = handlers
+            root.setLevel(level)
+
+    def server_close(self):
+        super().server_close()
+        self.session.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+
+def is_listening(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(path: str = None, session: WarmSession = None) -> int:
+    path = ccguard_client.socket_path(path)
+    if os.path.exists(path):
+        if is_listening(path):
+            logging.error("A daemon is already listening on %s.", path)
+            return 1
+        os.unlink(path)  # left by a daemon that has been killed
+
+    daemon = Daemon(path, session)
+    signal.signal(signal.SIGTERM, _terminate)
+    logging.info("Listening on %s.", path)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+    return 0
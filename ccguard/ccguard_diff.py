@@ -83,16 +83,8 @@ def main(args=None, log_function=print):
     second = ccguard.get_output(command, args.repository).rstrip("\n")
 
     with adapter_class(repo_id, config) as adapter:
-        refs = adapter.get_cc_commits(subtype=args.subtype)
-        first_ref, second_ref = None, None
-
-        for ref in refs:
-            if first_ref and second_ref:
-                break
-            if ref.startswith(first):
-                first_ref = ref
-            if ref.startswith(second):
-                second_ref = ref
+        first_ref = adapter.resolve_prefix(first, subtype=args.subtype)
+        second_ref = adapter.resolve_prefix(second, subtype=args.subtype)
 
         if first_ref and second_ref:
             print_diff_report(
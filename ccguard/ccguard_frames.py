@@ -0,0 +1,49 @@
+"""
+Length-prefixed frames, to stream many references in a single response.
+
+Each frame is a header (the lengths of the commit id, of the subtype and of
+the data, big endian) followed by the commit id, the subtype and the data.
+"""
+
+import struct
+from typing import Iterable, Iterator, Tuple
+
+MIMETYPE = "application/vnd.ccguard.frames"
+
+_HEADER = struct.Struct(">HHI")
+
+
+class TruncatedFrame(ValueError):
+    pass
+
+
+def encode_frame(commit_id: str, subtype: str, data) -> bytes:
+    commit_id = commit_id.encode("utf-8")
+    subtype = (subtype or "default").encode("utf-8")
+    header = _HEADER.pack(len(commit_id), len(subtype), len(data))
+    return b"".join((header, commit_id, subtype, data))
+
+
+def iter_frames(chunks: Iterable[bytes]) -> Iterator[Tuple[str, str, bytes]]:
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        position = 0
+        while len(buffer) - position >= _HEADER.size:
+            id_length, subtype_length, data_length = _HEADER.unpack_from(
+                buffer, position
+            )
+            start = position + _HEADER.size
+            subtype_start = start + id_length
+            data_start = subtype_start + subtype_length
+            end = data_start + data_length
+            if len(buffer) < end:
+                break
+            commit_id = buffer[start:subtype_start].decode("utf-8")
+            subtype = buffer[subtype_start:data_start].decode("utf-8")
+            yield commit_id, subtype, bytes(buffer[data_start:end])
+            position = end
+        del buffer[:position]
+
+    if buffer:
+        raise TruncatedFrame(len(buffer))
@@ -0,0 +1,39 @@
+"""
+Deferred imports, to keep the command line tools quick to start.
+
+requests, lxml and pycobertura (and Jinja2, through its reporters) take
+hundreds of milliseconds to import, while most invocations only need some
+of them. A lazy module is imported the first time one of its attributes
+is accessed.
+"""
+
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        if self._module is None:
+            self.__dict__["_module"] = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attribute):
+        value = getattr(self._load(), attribute)
+        # next accesses do not go through __getattr__ anymore
+        self.__dict__[attribute] = value
+        return value
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return "<lazy module {!r} ({})>".format(self.__name__, state)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Return the module `name` if already imported, a lazy module otherwise."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
@@ -1,9 +1,7 @@
 # -*- coding: utf-8 -*-
-import git
 import argparse
 import ccguard
 import logging
-from xml.etree import ElementTree
 
 
 def dump(
@@ -17,21 +15,52 @@ def dump(
         return adapter.dump()
 
 
-class AnnotatedCommit(git.Commit):
-    def __init__(self, commit, data):
-        self.commit = commit
-        self.has_ref = bool(data)
-        if data:
-            tree = ElementTree.fromstring(data)
-            self.ccrate = float(tree.get("line-rate"))
+def summaries(
+    commit_ids,
+    repo_folder=".",
+    repository_id_modifier=None,
+    adapter_class=ccguard.SqliteAdapter,
+    subtype=None,
+):
+    config = ccguard.configuration(repo_folder)
+    repo_id = ccguard.GitAdapter(
+        repo_folder, repository_id_modifier
+    ).get_repository_id()
+    with adapter_class(repo_id, config) as adapter:
+        return list(adapter.list_summaries(commit_ids, subtype=subtype))
+
+
+def file_summaries(
+    commit_ids,
+    path,
+    repo_folder=".",
+    repository_id_modifier=None,
+    adapter_class=ccguard.SqliteAdapter,
+    subtype=None,
+):
+    config = ccguard.configuration(repo_folder)
+    repo_id = ccguard.GitAdapter(
+        repo_folder, repository_id_modifier
+    ).get_repository_id()
+    with adapter_class(repo_id, config) as adapter:
+        return list(adapter.list_file_summaries(commit_ids, path, subtype=subtype))
+
+
+class AnnotatedCommit(object):
+    def __init__(self, commit_id, subject, line_rate=None):
+        self.hexsha = commit_id
+        self.subject = subject
+        self.has_ref = line_rate is not None
+        if self.has_ref:
+            self.ccrate = float(line_rate)
 
     @property
     def shortsha(self):
-        return self.commit.hexsha[:7]
+        return self.hexsha[:7]
 
     @property
     def message(self):
-        return next(iter(self.commit.message.split("\n")))[:70]
+        return self.subject[:70]
 
     @property
     def ccrate_pretty(self):
@@ -56,28 +85,117 @@ class AnnotatedCommit(git.Commit):
         return self.pretty
 
 
-def detailed_references(
+class TimelineCommit(AnnotatedCommit):
+    def __init__(self, commit_id, subject, lines_covered=None, lines_valid=None):
+        # no lines (ie. the reference does not hold the followed file): no rate
+        line_rate = lines_covered / lines_valid if lines_valid else None
+        super().__init__(commit_id, subject, line_rate)
+        self.has_rate = self.has_ref
+        self.has_ref = lines_valid is not None
+        self.lines_covered = lines_covered
+        self.lines_valid = lines_valid
+        # the change since the previous commit with a rate
+        self.delta = None
+
+    @property
+    def ccrate_pretty(self):
+        if self.has_rate:
+            return super().ccrate_pretty
+        return "{:9}".format("")
+
+    @property
+    def delta_pretty(self):
+        if self.delta is None:
+            return "{:9}".format("")
+        return "{:+7.2f}% ".format(self.delta * 100)
+
+    @property
+    def lines_pretty(self):
+        lines = "{}/{}".format(self.lines_covered, self.lines_valid)
+        return "{:>13} ".format(lines if self.has_rate else "")
+
+    @property
+    def pretty(self):
+        return "{}  {}{}{}{} {}".format(
+            "✅" if self.has_ref else "❌",
+            self.ccrate_pretty,
+            self.delta_pretty,
+            self.lines_pretty,
+            self.shortsha,
+            self.message,
+        )
+
+
+def timeline(
     repo_folder=".",
     repository_id_modifier=None,
     limit=30,
     adapter_class=ccguard.SqliteAdapter,
+    subtype=None,
+    path=None,
 ):
-    repo = git.Repo(repo_folder, search_parent_directories=True)
-    dumps = dump(
+    git = ccguard.GitAdapter(repo_folder, repository_id_modifier)
+    commits = list(git.iter_log(limit=limit))
+    commit_ids = [commit_id for commit_id, _ in commits]
+    kwargs = dict(
         repo_folder=repo_folder,
         repository_id_modifier=repository_id_modifier,
         adapter_class=adapter_class,
+        subtype=subtype,
     )
-    references = {ref: data for ref, data in dumps}
-    logging.debug(references)
+    if path:
+        # answered from the per-file summaries, without parsing any report
+        path = path[2:] if path.startswith("./") else path
+        lines = {
+            commit_id: (covered, valid)
+            for commit_id, covered, valid in file_summaries(commit_ids, path, **kwargs)
+        }
+    else:
+        lines = {
+            commit_id: (covered, valid)
+            for commit_id, _, covered, valid, *_ in summaries(commit_ids, **kwargs)
+        }
+
+    entries = [
+        TimelineCommit(commit_id, subject, *lines.get(commit_id, (None, None)))
+        for commit_id, subject in commits
+    ]
+    previous = None
+    for entry in reversed(entries):
+        if not entry.has_rate:
+            continue
+        if previous:
+            entry.delta = entry.ccrate - previous.ccrate
+        previous = entry
+    return entries
 
-    def enrich_commit(commit):
-        logging.debug(commit.hexsha)
-        return AnnotatedCommit(commit, references.get(commit.hexsha, None))
+
+def detailed_references(
+    repo_folder=".",
+    repository_id_modifier=None,
+    limit=30,
+    adapter_class=ccguard.SqliteAdapter,
+    subtype=None,
+):
+    git = ccguard.GitAdapter(repo_folder, repository_id_modifier)
+    # a single git log, limited to the commits displayed
+    commits = list(git.iter_log(limit=limit))
+    # only their line rates
+    rates = {
+        commit_id: line_rate
+        for commit_id, line_rate, *_ in summaries(
+            [commit_id for commit_id, _ in commits],
+            repo_folder=repo_folder,
+            repository_id_modifier=repository_id_modifier,
+            adapter_class=adapter_class,
+            subtype=subtype,
+        )
+    }
+    logging.debug(rates)
 
     return [
-        enrich_commit(repo.commit(logEntry))
-        for logEntry in list(repo.iter_commits())[:limit]
+        AnnotatedCommit(commit_id, subject, rates.get(commit_id))
+        for commit_id, subject in commits
     ]
 
 
@@ -93,6 +211,17 @@ def parse_args(args=None):
         type=int,
         default=30,
     )
+    parser.add_argument(
+        "--timeline",
+        dest="timeline",
+        help="display the changes of coverage, and the lines covered and valid",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--path",
+        dest="path",
+        help="follow the coverage of this file or folder (implies --timeline)",
+    )
 
     return parser.parse_args(args)
 
@@ -106,12 +235,19 @@ def main(args=None, logging_function=print):
     config = ccguard.configuration(args.repository)
     adapter_class = ccguard.adapter_factory(args.adapter, config)
 
-    for ac in detailed_references(
+    kwargs = dict(
         repo_folder=args.repository,
         repository_id_modifier=args.repository_id_modifier,
         limit=args.limit,
         adapter_class=adapter_class,
-    ):
+        subtype=args.subtype,
+    )
+    if args.timeline or args.path:
+        commits = timeline(path=args.path, **kwargs)
+    else:
+        commits = detailed_references(**kwargs)
+
+    for ac in commits:
         logging_function(ac)
 
 
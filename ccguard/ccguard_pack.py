@@ -0,0 +1,154 @@
+"""
+An append-only, memory-mapped store for reference data.
+
+Each pack is made of two files: `<name>.pack`, the concatenation of the
+stored reports, and `<name>.idx`, one `[commit_id, subtype, offset,
+length]` JSON line per report (the subtypes may hold spaces). Reports are
+appended to the pack before their index line is written, so readers never
+see an entry whose data is not there yet.
+Readers map the pack in memory and hand out `memoryview` slices of it.
+The uses of the references are counted in memory, for the catalogue to
+record them in batches.
+"""
+
+import fcntl
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+_PACKS: Dict[str, "ReferencePack"] = {}
+_PACKS_LOCK = threading.Lock()
+
+
+class UseCounter(object):
+    """Counts the uses of references, and hands them out periodically."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._taken = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, commit_ids: Iterable[str], subtype: str = None):
+        with self._lock:
+            for commit_id in commit_ids:
+                self._counts[(commit_id, subtype or "default")] += 1
+
+    def take(self, interval: float = 0.0) -> Dict[Tuple[str, str], int]:
+        """
+        Return the uses counted since the last call, by (commit_id, subtype),
+        unless it was less than `interval` seconds ago.
+        """
+        with self._lock:
+            if not self._counts or time.monotonic() - self._taken < interval:
+                return {}
+            counts, self._counts = self._counts, Counter()
+            self._taken = time.monotonic()
+            return dict(counts)
+
+
+class ReferencePack(object):
+    def __init__(self, path):
+        self.pack_path = "{}.pack".format(path)
+        self.index_path = "{}.idx".format(path)
+        self.index: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self._index_position = 0
+        self._map = None
+        self._lock = threading.Lock()
+        self.uses = UseCounter()
+
+    def _refresh_index(self):
+        try:
+            with open(self.index_path, "rb") as fd:
+                fd.seek(self._index_position)
+                for line in fd:
+                    if not line.endswith(b"\n"):
+                        # an index line being written by someone else
+                        break
+                    self._index_position += len(line)
+                    try:
+                        commit_id, subtype, offset, length = json.loads(line)
+                    except ValueError:
+                        # its reference is served from the database instead
+                        logging.warning("Skipping a malformed index line: %r", line)
+                        continue
+                    self.index.setdefault(
+                        (commit_id, subtype), (int(offset), int(length))
+                    )
+        except FileNotFoundError:
+            pass
+
+    def _refresh_map(self, size):
+        if self._map is not None and len(self._map) >= size:
+            return
+        with open(self.pack_path, "rb") as fd:
+            # the previous map is released once its exported views are gone
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get(self, commit_id: str, subtype: str = None) -> Optional[memoryview]:
+        key = (commit_id, subtype or "default")
+        with self._lock:
+            if key not in self.index:
+                self._refresh_index()
+            if key not in self.index:
+                return None
+            offset, length = self.index[key]
+            end = offset + length
+            self._refresh_map(end)
+            return memoryview(self._map)[offset:end]
+
+    def append(self, commit_id: str, data: bytes, subtype: str = None) -> bool:
+        return bool(self.append_many([(commit_id, data, subtype)]))
+
+    def append_many(self, references: Iterable[Tuple[str, bytes, str]]) -> int:
+        """
+        Append the (commit_id, data, subtype) missing from the pack, with a
+        single fsync. Return the number of references appended.
+        """
+        with self._lock:
+            Path(self.pack_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.pack_path, "ab") as pack_fd:
+                fcntl.flock(pack_fd, fcntl.LOCK_EX)
+                try:
+                    self._refresh_index()
+                    offset = os.fstat(pack_fd.fileno()).st_size
+                    lines, seen = [], set()
+                    for commit_id, data, subtype in references:
+                        key = (commit_id, subtype or "default")
+                        if key in self.index or key in seen:
+                            logging.debug("%s is already present in the pack.", key)
+                            continue
+                        seen.add(key)
+                        pack_fd.write(data)
+                        line = json.dumps([*key, offset, len(data)])
+                        lines.append(line + "\n")
+                        offset += len(data)
+                    if lines:
+                        pack_fd.flush()
+                        os.fsync(pack_fd.fileno())
+                        with open(self.index_path, "ab") as index_fd:
+                            index_fd.write("".join(lines).encode("utf-8"))
+                finally:
+                    fcntl.flock(pack_fd, fcntl.LOCK_UN)
+            self._refresh_index()
+            return len(lines)
+
+
+def open_pack(path) -> ReferencePack:
+    path = str(path)
+    with _PACKS_LOCK:
+        if path not in _PACKS:
+            _PACKS[path] = ReferencePack(path)
+        return _PACKS[path]
+
+
+def close_packs():
+    """Forget the opened packs (ie. in a forked worker, which maps its own)."""
+    global _PACKS_LOCK
+    _PACKS.clear()
+    _PACKS_LOCK = threading.Lock()
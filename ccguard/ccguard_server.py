@@ -1,5 +1,7 @@
 import argparse
 import logging
+import queue
+import signal
 import threading
 
 import json
@@ -8,17 +10,19 @@ import requests
 
 import ccguard
 
+from . import ccguard_pack, ccguard_writer
 from .ccguard_server_blueprints import (
     _prepare_event,
     api_home,
     api_v1,
     api_v2,
     record_telemetry_event,
+    reload_configuration,
+    reset_caches,
     web,
 )
 
 app = flask.Flask(__name__)
-app.config["DEBUG"] = True
 
 
 def parse_args(args=None):
@@ -54,6 +58,30 @@ def parse_args(args=None):
         help="the port to listen on",
         type=int,
     )
+    parser.add_argument(
+        "--production",
+        dest="production",
+        help="serve with gunicorn, with several worker processes",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="the number of worker processes (production mode)",
+        type=int,
+    )
+    parser.add_argument(
+        "--threads",
+        dest="threads",
+        help="the number of threads per worker process (production mode)",
+        type=int,
+    )
+    parser.add_argument(
+        "--keep-alive",
+        dest="keep_alive",
+        help="the seconds to wait for requests on a keep-alive connection",
+        type=int,
+    )
 
     return parser.parse_args(args)
 
@@ -81,6 +109,44 @@ def send_telemetry_event(config: dict = None):
     return data
 
 
+class Prerenderer(object):
+    """
+    Runs the jobs it is given (ie. rendering the pages of a new reference)
+    on a few background threads. The queue is bounded: when it is full, the
+    new jobs are dropped, and the pages are rendered on their first visit.
+    """
+
+    def __init__(self, workers=1, queue_size=64):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = [
+            threading.Thread(target=self._work, name="prerender-%d" % i, daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, func, *args) -> bool:
+        try:
+            self.queue.put_nowait((func, args))
+            return True
+        except queue.Full:
+            logging.warning("The prerender queue is full, dropping %s.", args)
+            return False
+
+    def join(self):
+        self.queue.join()
+
+    def _work(self):
+        while True:
+            func, args = self.queue.get()
+            try:
+                func(*args)
+            except Exception:
+                logging.exception("Unable to prerender %s.", args)
+            finally:
+                self.queue.task_done()
+
+
 def _register_blueprints(host_app):
     host_app.register_blueprint(api_home)
     host_app.register_blueprint(api_v1)
@@ -97,10 +163,81 @@ def load_app(token, config=None):
     return app
 
 
+def init_worker(host_app, config=None):
+    """Prepare the state of a serving process (ie. a freshly forked worker)."""
+    config = config or ccguard.configuration()
+    reload_configuration(host_app)
+    reset_caches()
+    ccguard_pack.close_packs()
+
+    # threads do not survive a fork: each worker runs its own
+    workers = config.get("server.prerender.workers", 0)
+    if workers:
+        queue_size = config.get("server.prerender.queue-size", 64)
+        host_app.extensions["ccguard.prerender"] = Prerenderer(workers, queue_size)
+    if config.get("server.writer.group-commit", False):
+        writer = ccguard_writer.GroupCommitWriter.from_config(config)
+        host_app.extensions["ccguard.writer"] = writer
+
+
+def production_options(args, config=None, host_app=app) -> dict:
+    config = config or {}
+    options = {
+        "bind": "{}:{}".format(args.host, args.port or 5000),
+        "workers": args.workers or config.get("server.workers", 4),
+        "threads": args.threads or config.get("server.threads", 4),
+        "keepalive": args.keep_alive or config.get("server.keep-alive", 5),
+        "post_fork": lambda server, worker: init_worker(host_app, config),
+    }
+    if args.certificate and args.private_key:
+        options["certfile"] = args.certificate
+        options["keyfile"] = args.private_key
+    return options
+
+
+def run_production(host_app, options: dict):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logging.error(
+            "The production mode requires gunicorn: pip install ccguard[production]"
+        )
+        return 1
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return host_app
+
+    Application().run()
+
+
+def install_reload_handler(host_app):
+    if not hasattr(signal, "SIGHUP"):
+        return
+
+    def handler(signum, frame):
+        logging.info("Reloading the configuration")
+        reload_configuration(host_app)
+
+    signal.signal(signal.SIGHUP, handler)
+
+
 def main(args=None, app=app, config=None):
-    logging.basicConfig(level=logging.DEBUG)
     args = parse_args(args)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
     load_app(args.token, config)
+    app.config["DEBUG"] = args.debug
+
+    if args.production:
+        options = production_options(args, config or ccguard.configuration(), app)
+        return run_production(app, options)
+
+    init_worker(app, config)
+    install_reload_handler(app)
     ssl_context = (
         (args.certificate, args.private_key)
         if args.certificate and args.private_key
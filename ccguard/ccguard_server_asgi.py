@@ -0,0 +1,335 @@
+"""
+An ASGI entry point for ccguard_server, for many concurrent uploads.
+
+The uploads are handled natively: their bodies are received without
+holding a thread, decompressed on the thread pool, and recorded by the
+group commit writer. Every other route is served by the Flask application
+of ccguard_server, called on the thread pool.
+
+    ccguard_server_asgi --token <token>
+
+When launched by another ASGI server, each worker reads the configuration
+on startup, and the access token from the ccguard_server_token variable.
+
+    ccguard_server_token=<token> uvicorn ccguard.ccguard_server_asgi:app
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import re
+import sys
+import types
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import parse_qs
+
+import ccguard
+
+from . import ccguard_compression, ccguard_server, ccguard_writer
+from .ccguard_server_blueprints import (
+    check_auth,
+    persist_reference,
+    prerender_upload,
+    server_configuration,
+)
+
+UPLOAD_PATH = re.compile(
+    r"^/api/v1/references/(?P<repository_id>[^/]+)/(?P<commit_id>[^/]+)/data$"
+)
+TOKEN_KEY = "ccguard.server.token"
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+async def send_response(send, status: int, body: bytes, headers=None):
+    headers = list(headers or [])
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_chunks(send, status: int, chunks, headers=None):
+    """Send a response whose body is produced one chunk at a time."""
+    try:
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        async for chunk in chunks:
+            message = {"type": "http.response.body", "body": chunk, "more_body": True}
+            await send(message)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        await chunks.aclose()
+
+
+async def read_body(receive, max_size: int = None) -> bytes:
+    chunks, size = [], 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected.")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise HTTPError(413, "Payload too large.")
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+def upload_max_size(config) -> int:
+    return config.get("server.upload.max-size-mb", 100) * 1024 * 1024
+
+
+class AsgiApplication(object):
+    def __init__(self, flask_app, writer=None, threads: int = 16):
+        self.flask_app = flask_app
+        self.writer = writer or ccguard_writer.GroupCommitWriter()
+        self.config = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="ccguard-asgi"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        match = UPLOAD_PATH.match(scope["path"])
+        if scope["method"] == "PUT" and match:
+            handler = self.upload(scope, receive, **match.groupdict())
+        else:
+            handler = self.wsgi(scope, receive)
+
+        try:
+            status, body, headers = await handler
+        except HTTPError as error:
+            status, body = error.status, error.message.encode("utf-8")
+            headers = [(b"content-type", b"text/plain; charset=utf-8")]
+        if isinstance(body, bytes):
+            await send_response(send, status, body, headers)
+        else:
+            await send_chunks(send, status, body, headers)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.config is None:
+                    # launched by another ASGI server, rather than by main()
+                    self.flask_app.config["TOKEN"] = os.environ.get(
+                        TOKEN_KEY.replace(".", "_")
+                    )
+                    self.configure()
+                await self.run(ccguard_server.init_worker, self.flask_app, self.config)
+                self.writer.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.run(self.writer.stop)
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def configure(self, config=None):
+        """Apply the configuration of the server (ie. the settings of the writer)."""
+        self.config = config or ccguard.configuration()
+        self.writer = ccguard_writer.GroupCommitWriter.from_config(self.config)
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _check_auth(self, headers: dict):
+        with self.flask_app.app_context():
+            halt = check_auth(headers, self.flask_app.config, types.SimpleNamespace())
+            return halt, server_configuration()
+
+    def _max_size(self) -> int:
+        # the configuration is cached by the Flask application, if any
+        context = getattr(self.flask_app, "app_context", contextlib.nullcontext)
+        with context():
+            return upload_max_size(server_configuration())
+
+    async def upload(self, scope, receive, repository_id, commit_id):
+        headers = {
+            key.decode("latin-1").lower(): value.decode("latin-1")
+            for key, value in scope["headers"]
+        }
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        subtype = query.get("subtype", [None])[0]
+        branch = query.get("branch", [None])[0]
+
+        halt, config = await self.run(self._check_auth, headers)
+        if halt:
+            raise HTTPError(*halt)
+
+        max_size = upload_max_size(config)
+        data = await read_body(receive, max_size)
+        content_encoding = headers.get("content-encoding")
+        if content_encoding and content_encoding != "identity":
+            data = await self.run(self._decompress, data, content_encoding, max_size)
+
+        adapter_class = ccguard.adapter_factory(None, config)
+        prerender = await self.run(
+            prerender_upload,
+            self.flask_app,
+            adapter_class,
+            config,
+            repository_id,
+            branch,
+            subtype,
+        )
+
+        args = (adapter_class, config, repository_id, commit_id, data, branch, subtype)
+        try:
+            if self.writer.supports(adapter_class):
+                await asyncio.wrap_future(self.writer.submit(*args))
+            else:
+                await self.run(persist_reference, *args)
+        except Exception:
+            logging.exception("Unexpected exception on persist.")
+            raise HTTPError(400, "Invalid request.")
+        if prerender:
+            prerender(commit_id)
+
+        body = "{} bytes ({}) received".format(len(data), type(data).__name__)
+        return (
+            200,
+            body.encode("utf-8"),
+            [(b"content-type", b"text/html; charset=utf-8")],
+        )
+
+    @staticmethod
+    def _decompress(data: bytes, content_encoding: str, max_size: int) -> bytes:
+        try:
+            return ccguard_compression.decompress_stream(
+                [data], content_encoding, max_size=max_size
+            )
+        except ccguard_compression.UnsupportedEncoding:
+            raise HTTPError(415, "Unsupported content encoding.")
+        except ccguard_compression.PayloadTooLarge:
+            raise HTTPError(413, "Payload too large.")
+        except ccguard_compression.InvalidPayload:
+            raise HTTPError(400, "Invalid request.")
+
+    async def wsgi(self, scope, receive):
+        max_size = await self.run(self._max_size)
+        body = await read_body(receive, max_size)
+        environ = wsgi_environ(scope, body)
+        status, response, headers = await self.run(self._call_wsgi, environ)
+        return status, self._wsgi_chunks(*response), headers
+
+    def _call_wsgi(self, environ: dict):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (key.lower().encode("latin-1"), value.encode("latin-1"))
+                for key, value in headers
+            ]
+
+        result = self.flask_app(environ, start_response)
+        try:
+            chunks = iter(result)
+            # start_response may be deferred until the first chunk
+            first = self._next_chunk(chunks)
+        except BaseException:
+            self._close(result)
+            raise
+        return response["status"], (result, chunks, first), response["headers"]
+
+    async def _wsgi_chunks(self, result, chunks, chunk: bytes):
+        """Yield the chunks of a WSGI response, each read on the thread pool."""
+        try:
+            while chunk is not None:
+                if chunk:
+                    yield chunk
+                chunk = await self.run(self._next_chunk, chunks)
+        finally:
+            await self.run(self._close, result)
+
+    @staticmethod
+    def _next_chunk(chunks) -> Optional[bytes]:
+        chunk = next(chunks, None)
+        return None if chunk is None else bytes(chunk)
+
+    @staticmethod
+    def _close(result):
+        if hasattr(result, "close"):
+            result.close()
+
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/{}".format(scope.get("http_version", "1.1")),
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    for key, value in scope["headers"]:
+        name = key.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+        name = "HTTP_" + name
+        environ[name] = (
+            "{},{}".format(environ[name], value) if name in environ else value
+        )
+    return environ
+
+
+app = AsgiApplication(ccguard_server.app)
+
+
+def main(args=None, config=None):
+    try:
+        import uvicorn
+    except ImportError:
+        logging.error("The ASGI server requires uvicorn: pip install ccguard[asgi]")
+        return 1
+
+    args = ccguard_server.parse_args(args)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    ccguard_server.load_app(args.token, config)
+    app.configure(config)
+    uvicorn.run(
+        app,
+        host=args.host,
+        port=args.port or 5000,
+        ssl_certfile=args.certificate,
+        ssl_keyfile=args.private_key,
+        timeout_keep_alive=args.keep_alive or 5,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,18 @@
 #! /usr/bin/env python3
 
+import base64
 import datetime
+import functools
 import hashlib
 import io
+import json
 import re
 import logging
+import os
 import socket
 import sqlite3
 import uuid
-from typing import Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
 import lxml
 from colour import Color
@@ -17,15 +21,19 @@ from flask import (
     abort,
     current_app,
     g,
+    has_app_context,
     jsonify,
+    make_response,
     render_template,
     request,
     Response,
+    stream_with_context,
 )
 from pycobertura import Cobertura, CoberturaDiff
 from pycobertura.reporters import HtmlReporter, HtmlReporterDelta
 
 import ccguard
+from ccguard import ccguard_binary, ccguard_cache, ccguard_compression, ccguard_frames
 
 api_v1 = Blueprint("api_v1", __name__, url_prefix="/api/v1")
 api_v2 = Blueprint("api_v2", __name__, url_prefix="/api/v2")
@@ -36,6 +44,29 @@ web = Blueprint("web_reports", __name__, url_prefix="/web")
 ADMIN = "admin@local"
 
 
+def server_configuration() -> dict:
+    """Return the configuration, loaded once per application."""
+    if not has_app_context():
+        return ccguard.configuration()
+
+    cache = current_app.extensions.get("ccguard.configuration")
+    if cache is None:
+        cache = ccguard.ConfigurationCache(loader=ccguard.configuration)
+        current_app.extensions["ccguard.configuration"] = cache
+    return cache.get()
+
+
+def reload_configuration(host_app):
+    cache = host_app.extensions.get("ccguard.configuration")
+    if cache:
+        cache.invalidate()
+
+
+def reset_caches():
+    PersonalAccessToken._cache.clear()
+    badge_cache.clear()
+
+
 def authenticated(func):
     def inner(*args, **kwargs):
         halt = check_auth(request.headers, current_app.config, g)
@@ -61,6 +92,14 @@ def admin_required(func):
 
 
 class PersonalAccessToken(object):
+    # validated tokens, by (dbpath, value), with the revocation generation
+    # they were read at: a deletion or a revocation in any process (ie. a
+    # worker) replaces the `<dbpath>-tokens` file, which is checked with a
+    # stat on each use
+    _cache = ccguard_cache.TTLCache(max_entries=1024, ttl=30)
+    # databases where the table (and its index) is known to exist
+    _prepared = set()
+
     def __init__(self, user_id, name, value=None, revoked=False):
         super().__init__()
         self.user_id = user_id
@@ -70,15 +109,25 @@ class PersonalAccessToken(object):
 
     @staticmethod
     def get_by_value(value: str, config=None):
-        return PersonalAccessToken._get_by_value(value, config)
+        config = config or server_configuration()
+        key = (str(config.get("sqlite.dbpath")), value)
+        generation = PersonalAccessToken._generation(config)
+        pat, cached_generation = PersonalAccessToken._cache.get(key, (None, None))
+        if pat is None or cached_generation != generation:
+            pat = PersonalAccessToken._get_by_value(value, config)
+            if pat:
+                PersonalAccessToken._cache.put(key, (pat, generation))
+        return pat
 
     def commit(self, config=None) -> None:
         if not self.value:
             raise ValueError("Unwilling to persist invalid token.")
 
+        config = config or server_configuration()
         with PersonalAccessToken._get_connection(config) as conn:
             self._create_table(conn)
             self._persist(conn)
+        PersonalAccessToken._cache.pop((str(config.get("sqlite.dbpath")), self.value))
 
     @staticmethod
     def generate_value(config=None):
@@ -127,17 +176,62 @@ class PersonalAccessToken(object):
                 conn.execute(query, data_tuple)
             except sqlite3.OperationalError:
                 logging.exception("Unable to delete the token %s, %s", user_id, name)
+        PersonalAccessToken._next_generation(config)
+
+    @staticmethod
+    def revoke(user_id, name, config=None):
+        with PersonalAccessToken._get_connection(config) as conn:
+            query = (
+                "UPDATE ccguard_server_tokens "
+                "SET revoked = 1 "
+                "WHERE user_id = ? and name = ?"
+            )
+            try:
+                conn.execute(query, (user_id, name))
+            except sqlite3.OperationalError:
+                logging.exception("Unable to revoke the token %s, %s", user_id, name)
+        PersonalAccessToken._next_generation(config)
+
+    @staticmethod
+    def _generation_path(config=None) -> str:
+        config = config or server_configuration()
+        return "{}-tokens".format(config.get("sqlite.dbpath"))
+
+    @staticmethod
+    def _generation(config=None) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(PersonalAccessToken._generation_path(config))
+        except FileNotFoundError:
+            return None
+        # replaced, never rewritten: a new generation is a new inode
+        return stat.st_ino, stat.st_mtime_ns
+
+    @staticmethod
+    def _next_generation(config=None):
+        path = PersonalAccessToken._generation_path(config)
+        temporary = "{}.{}".format(path, uuid.uuid4().hex)
+        with open(temporary, "w") as fd:
+            fd.write(temporary)
+        os.replace(temporary, path)
+        # the cache is keyed by value, which is unknown here
+        PersonalAccessToken._cache.clear()
 
     @staticmethod
     def _get_connection(config=None) -> sqlite3.Connection:
-        config = config or ccguard.configuration()
+        config = config or server_configuration()
         dbpath = str(config.get("sqlite.dbpath"))
         logging.debug("PersonalAccessToken: dbpath %s", dbpath)
         return sqlite3.connect(dbpath)
 
     @staticmethod
     def _get_by_value(value: str, config=None):
+        config = config or server_configuration()
         with PersonalAccessToken._get_connection(config) as conn:
+            dbpath = str(config.get("sqlite.dbpath"))
+            if dbpath not in PersonalAccessToken._prepared:
+                PersonalAccessToken._create_table(conn)
+                PersonalAccessToken._prepared.add(dbpath)
+
             query = (
                 "SELECT user_id, name, revoked "
                 "FROM ccguard_server_tokens "
@@ -185,6 +279,11 @@ class PersonalAccessToken(object):
             "PRIMARY KEY  (`user_id`, `name`) );"
         )
         conn.execute(statement)
+        statement = (
+            "CREATE INDEX IF NOT EXISTS `ccguard_server_tokens_value` "
+            "ON `ccguard_server_tokens` (`value`);"
+        )
+        conn.execute(statement)
 
 
 def _is_admin(app_config, flask_global):
@@ -229,7 +328,7 @@ def home():
 
 class SqliteServerAdapter(object):
     def __init__(self, config):
-        config = config or ccguard.configuration()
+        config = config or server_configuration()
         dbpath = str(config.get("sqlite.dbpath"))
         logging.debug("SqliteServerAdapter: dbpath %s", dbpath)
         self.conn = sqlite3.connect(dbpath)
@@ -398,6 +497,22 @@ def api_personal_access_token_delete(user_id):
     return {"status": "success"}
 
 
+@api_v1.route("/personal_access_token/<string:user_id>/revoke", methods=["POST"])
+@authenticated
+def api_personal_access_token_revoke(user_id):
+    if not (g.user == ADMIN or g.user == user_id):
+        abort(403)
+
+    data = request.get_json()
+    name = data.get("name", None) if data else None
+
+    if not name:
+        abort(400)
+
+    PersonalAccessToken.revoke(user_id, name)
+    return {"status": "success"}
+
+
 @api_v1.route("/personal_access_tokens/<string:user_id>", methods=["GET"])
 @authenticated
 def api_personal_access_tokens_list(user_id):
@@ -435,14 +550,14 @@ def api_telemetry_collect():
 
 @api_v1.route("/telemetry", methods=["GET"])
 def api_telemetry_get():
-    config = ccguard.configuration()
+    config = server_configuration()
     with SqliteServerAdapter(config) as server_adapter:
         data = server_adapter.totals()
     return jsonify(data)
 
 
 def api_repositories_debug_common():
-    config = ccguard.configuration()
+    config = server_configuration()
     with SqliteServerAdapter(config) as adapter:
         return adapter.list_repositories()
 
@@ -464,7 +579,7 @@ def api_repositories_debug_v2():
 
 
 def api_references_all_common(repository_id, subtype):
-    config = ccguard.configuration()
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
         return adapter.get_cc_commits(subtype=subtype)
@@ -484,6 +599,84 @@ def api_references_all_v2(repository_id):
     return jsonify({"references": list(commits)})
 
 
+MAX_PAGE_SIZE = 500
+
+
+@api_v1.route("/references/<string:repository_id>/list", methods=["GET"])
+def api_references_list(repository_id):
+    limit = min(max(request.args.get("limit", 100, type=int), 1), MAX_PAGE_SIZE)
+    config = server_configuration()
+    adapter_class = ccguard.adapter_factory(None, config)
+    with adapter_class(repository_id, config) as adapter:
+        try:
+            references, cursor = adapter.list_references(
+                branch=request.args.get("branch"),
+                subtype=request.args.get("subtype"),
+                since=request.args.get("since"),
+                until=request.args.get("until"),
+                cursor=request.args.get("cursor"),
+                limit=limit,
+            )
+        except ValueError:
+            abort(400, "Invalid request.")
+    return jsonify({"references": references, "next": cursor})
+
+
+@api_v1.route(
+    "/references/<string:repository_id>/resolve/<string:prefix>", methods=["GET"]
+)
+def api_references_resolve(repository_id, prefix):
+    subtype = request.args.get("subtype")
+    config = server_configuration()
+    adapter_class = ccguard.adapter_factory(None, config)
+    with adapter_class(repository_id, config) as adapter:
+        commit_id = adapter.resolve_prefix(prefix, subtype=subtype)
+    # a missing route (ie. an older server) is the only 404
+    return jsonify({"commit_id": commit_id})
+
+
+@api_v1.route("/references/<string:repository_id>/summaries", methods=["POST"])
+def api_references_summaries(repository_id):
+    subtype = request.args.get("subtype")
+    payload = request.get_json(silent=True)
+    commit_ids = payload.get("commit_ids") if isinstance(payload, dict) else None
+    if not isinstance(commit_ids, list) or len(commit_ids) > MAX_PAGE_SIZE:
+        abort(400, "Invalid request.")
+    config = server_configuration()
+    adapter_class = ccguard.adapter_factory(None, config)
+    with adapter_class(repository_id, config) as adapter:
+        summaries = adapter.list_summaries(
+            [str(commit_id) for commit_id in commit_ids], subtype=subtype
+        )
+        keys = (
+            "commit_id",
+            "line_rate",
+            "lines_covered",
+            "lines_valid",
+            "branch",
+            "subtype",
+        )
+        return jsonify({"summaries": [dict(zip(keys, row)) for row in summaries]})
+
+
+@api_v1.route("/references/<string:repository_id>/file_summaries", methods=["POST"])
+def api_references_file_summaries(repository_id):
+    subtype = request.args.get("subtype")
+    path = request.args.get("path") or ""
+    payload = request.get_json(silent=True)
+    commit_ids = payload.get("commit_ids") if isinstance(payload, dict) else None
+    if not isinstance(commit_ids, list) or len(commit_ids) > MAX_PAGE_SIZE:
+        abort(400, "Invalid request.")
+    config = server_configuration()
+    adapter_class = ccguard.adapter_factory(None, config)
+    with adapter_class(repository_id, config) as adapter:
+        summaries = adapter.list_file_summaries(
+            [str(commit_id) for commit_id in commit_ids], path, subtype=subtype
+        )
+        keys = ("commit_id", "lines_covered", "lines_valid")
+        return jsonify({"summaries": [dict(zip(keys, row)) for row in summaries]})
+
+
 def iter_callable(refs):
     def call():
         local = refs if isinstance(refs, str) else refs.decode("utf-8")
@@ -496,7 +689,7 @@ def iter_callable(refs):
 def api_references_choose_v1(repository_id):
     subtype = request.args.get("subtype")
     commits = request.data
-    config = ccguard.configuration()
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
         references = adapter.get_cc_commits(subtype=subtype)
@@ -508,7 +701,7 @@ def api_references_choose_v1(repository_id):
 
 
 def dump_data(repository_id):
-    config = ccguard.configuration()
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
         return adapter.dump()
@@ -586,14 +779,37 @@ def minimize_xml(xml):
     return lxml.etree.tostring(elem)
 
 
-def get_last_commit(adapter, branch=None, subtype=None):
-    commit_id = adapter.get_cc_commits(branch=branch, count=1, subtype=subtype)
+# minimized once, the placeholders survive as attribute values and text
+BADGE_TEMPLATE = minimize_xml(BADGE_FORMAT).decode("utf-8")
+BADGE_UNKNOWN_SVG = minimize_xml(BADGE_UNKNOWN)
+
+# rendered badges, by (repository_id, branch, subtype, commit_id, red, green):
+# a new reference is a new key, in every process
+badge_cache = ccguard_cache.TTLCache(max_entries=4096, ttl=300)
+
+
+@functools.lru_cache(maxsize=64)
+def color_ramp(red: str, green: str) -> Tuple[str, ...]:
+    # one color per percentage, from 0 to 100
+    return tuple(str(color) for color in Color(red).range_to(Color(green), 101))
 
-    if not commit_id:
-        return None
 
-    (commit_id,) = commit_id
-    return commit_id
+def render_badge(rate: Optional[float], red: str, green: str) -> bytes:
+    if rate is None:
+        return BADGE_UNKNOWN_SVG
+
+    rate = int(rate) if rate > 1 else int(rate * 100)
+    rate = 100 if rate > 100 else rate
+    color = color_ramp(red, green)[rate]
+    return BADGE_TEMPLATE.format(color=color, pct="{:d}%".format(rate)).encode("utf-8")
+
+
+def get_last_commit(adapter, branch=None, subtype=None):
+    if branch:
+        latest = adapter.get_latest_reference(branch, subtype)
+        return latest[0] if latest else None
+
+    return next(iter(adapter.iter_cc_commits(subtype=subtype)), None)
 
 
 @api_v1.route("/repositories/<string:repository_id>/status_badge.svg", methods=["GET"])
@@ -603,24 +819,21 @@ def api_status_badge(repository_id):
     red = request.args.get("red") or "red"
     green = request.args.get("green") or "green"
     subtype = request.args.get("subtype")
-    config = ccguard.configuration()
+
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
-        commit_id = get_last_commit(adapter, branch, subtype)
-        if not commit_id:
-            return Response(minimize_xml(BADGE_UNKNOWN), mimetype="image/svg+xml")
+        # a primary key lookup
+        latest = adapter.get_latest_reference(branch, subtype)
+    commit_id, rate = latest if latest else (None, None)
 
-        rate, *_ = adapter.get_commit_info(commit_id, subtype=subtype)
-        rate = int(rate) if rate > 1 else int(rate * 100)
-        rate = 100 if rate > 100 else rate
+    key = (repository_id, branch, subtype, commit_id, red, green)
+    response = badge_cache.get(key)
+    if response is None:
+        response = render_badge(rate, red, green)
+        badge_cache.put(key, response)
 
-        red, green = Color(red), Color(green)
-        colors = list(red.range_to(green, 100))
-
-        response = minimize_xml(
-            BADGE_FORMAT.format(color=colors[rate], pct="{:d}%".format(rate))
-        )
-        return Response(response, mimetype="image/svg+xml")
+    return Response(response, mimetype="image/svg+xml")
 
 
 @api_v1.route(
@@ -628,13 +841,174 @@ def api_status_badge(repository_id):
     methods=["GET"],
 )
 def api_reference_download_data(repository_id, commit_id):
-    config = ccguard.configuration()
+    subtype = request.args.get("subtype")
+    data_format = request.args.get("format") or "xml"
+    content_encoding = ccguard_compression.negotiate(request.accept_encodings)
+    etag = reference_etag("data", repository_id, commit_id, subtype, data_format)
+    if content_encoding:
+        etag = "{}-{}".format(etag, content_encoding)
+    if not_modified(etag):
+        return cacheable(Response(status=304), etag)
+
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
-        response = adapter.retrieve_cc_data(commit_id)
+        response = adapter.retrieve_cc_data(
+            commit_id, subtype=subtype, encoding=data_format
+        )
         if not response:
             abort(404)
-        return response
+        mimetype = ccguard_binary.MIMETYPE if data_format == "binary" else None
+        response = data_response(response, mimetype, content_encoding)
+        return cacheable(response, etag)
+
+
+@api_v1.route("/references/<string:repository_id>/download", methods=["POST"])
+def api_references_download(repository_id):
+    subtype = request.args.get("subtype")
+    data_format = request.args.get("format") or "xml"
+    payload = request.get_json(silent=True)
+    commit_ids = payload.get("commit_ids") if isinstance(payload, dict) else None
+    if not isinstance(commit_ids, list):
+        abort(400, "Invalid request.")
+    config = server_configuration()
+    adapter_class = ccguard.adapter_factory(None, config)
+
+    def frames():
+        with adapter_class(repository_id, config) as adapter:
+            references = adapter.retrieve_many(
+                [str(commit_id) for commit_id in commit_ids],
+                subtype=subtype,
+                encoding=data_format,
+            )
+            for commit_id, data in references:
+                yield ccguard_frames.encode_frame(commit_id, subtype, data)
+
+    chunks = stream_with_context(frames())
+    content_encoding = ccguard_compression.negotiate(request.accept_encodings)
+    if content_encoding:
+        chunks = ccguard_compression.compress_chunks(chunks, content_encoding)
+    response = Response(chunks, mimetype=ccguard_frames.MIMETYPE)
+    if content_encoding:
+        response.headers["Content-Encoding"] = content_encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+NOT_FOUND = b"<html><h1>Huh-oh</h1><p>Sorry, no data found.</p></html>"
+
+
+def content_etag(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (bytes, memoryview)):
+            part = str(part).encode("utf-8")
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def reference_etag(kind: str, repository_id: str, *keys) -> str:
+    """
+    The ETag of a resource computed from references: a reference never
+    changes once recorded, the ETag is derived from its key without reading it.
+    """
+    return content_etag(kind, ccguard.__version__, repository_id, *keys)
+
+
+def not_modified(etag: str) -> bool:
+    return request.if_none_match.contains(etag)
+
+
+def not_modified_page(etag: str, immutable: bool = True) -> Optional[Response]:
+    # the pages are served compressed as they are cached, when accepted
+    for candidate in (etag, "{}-gzip".format(etag)):
+        if not_modified(candidate):
+            response = cacheable(Response(status=304), candidate, immutable)
+            response.vary.add("Accept-Encoding")
+            return response
+    return None
+
+
+def cacheable(response, etag: str, immutable: bool = True) -> Response:
+    # references never change once uploaded: commit-addressed resources
+    # can be cached forever, the others have to be revalidated
+    response = make_response(response)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = IMMUTABLE if immutable else "no-cache"
+    return response
+
+
+def data_response(data, mimetype=None, content_encoding=None) -> Response:
+    if content_encoding:
+        # compressed chunk by chunk, while being sent
+        chunks = ccguard_compression.compress_stream(data, content_encoding)
+        response = Response(chunks, mimetype=mimetype)
+        response.headers["Content-Encoding"] = content_encoding
+    else:
+        # memoryviews (see PackAdapter) are handed to the WSGI server as they are
+        response = Response([data], mimetype=mimetype)
+        response.content_length = len(data)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def render_cache(config) -> Optional[ccguard_cache.DiskCache]:
+    path = config.get("server.render.cache.path")
+    if not path:
+        return None
+    max_size = config.get("server.render.cache.size-mb", 512) * 1024 * 1024
+    return ccguard_cache.DiskCache(os.path.expanduser(str(path)), max_size=max_size)
+
+
+def cached_page(cache, key: tuple, immutable: bool = True) -> Optional[Response]:
+    entry = cache.get(key) if cache else None
+    if not entry:
+        return None
+
+    data, metadata = entry
+    etag, encoding = metadata.get("etag"), metadata.get("encoding")
+    accepted = bool(request.accept_encodings[encoding])
+    if accepted:
+        etag = "{}-{}".format(etag, encoding)
+    if not_modified(etag):
+        return cacheable(Response(status=304), etag, immutable)
+
+    if accepted:
+        # served as stored, without decompressing it
+        response = Response(data, mimetype="text/html")
+        response.headers["Content-Encoding"] = encoding
+    else:
+        data = ccguard_compression.decompress(data, encoding)
+        response = Response(data, mimetype="text/html")
+    response.vary.add("Accept-Encoding")
+    return cacheable(response, etag, immutable)
+
+
+def cache_page(cache, key: tuple, page: str, etag: str):
+    if cache:
+        data = ccguard_compression.compress(page.encode("utf-8"), "gzip")
+        cache.put(key, data, {"etag": etag, "encoding": "gzip"})
+
+
+def request_body(config) -> bytes:
+    content_encoding = request.headers.get("Content-Encoding")
+    if not content_encoding or content_encoding == "identity":
+        return request.get_data()
+
+    max_size = config.get("server.upload.max-size-mb", 100) * 1024 * 1024
+    chunks = ccguard_compression.read_chunks(request.stream)
+    try:
+        return ccguard_compression.decompress_stream(
+            chunks, content_encoding, max_size=max_size
+        )
+    except ccguard_compression.UnsupportedEncoding:
+        abort(415, "Unsupported content encoding.")
+    except ccguard_compression.PayloadTooLarge:
+        abort(413, "Payload too large.")
+    except ccguard_compression.InvalidPayload:
+        abort(400, "Invalid request.")
 
 
 @api_v1.route(
@@ -645,7 +1019,7 @@ def api_reference_download_data(repository_id, commit_id):
 @admin_required
 def api_reference_download_data_debug(repository_id, commit_id):
     subtype = request.args.get("subtype")
-    config = ccguard.configuration()
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
         cc_reference_data = adapter.retrieve_cc_data(commit_id, subtype=subtype)
@@ -663,16 +1037,104 @@ def api_reference_download_data_debug(repository_id, commit_id):
 def api_upload_reference(repository_id, commit_id):
     subtype = request.args.get("subtype")
     branch = request.args.get("branch")
-    config = ccguard.configuration()
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
+    writer = current_app.extensions.get("ccguard.writer")
+    data = request_body(config)
+    prerender = prerender_upload(
+        current_app, adapter_class, config, repository_id, branch, subtype
+    )
+
+    args = (adapter_class, config, repository_id, commit_id, data, branch, subtype)
+    try:
+        if writer and writer.supports(adapter_class):
+            # acknowledged once the group of this reference is committed
+            writer.persist(*args)
+        else:
+            persist_reference(*args)
+    except Exception:
+        logging.exception("Unexpected exception on persist.")
+        abort(400, "Invalid request.")
+
+    if prerender:
+        prerender(commit_id)
+    return "{} bytes ({}) received".format(len(data), type(data).__name__)
+
+
+def prerender_upload(
+    host_app, adapter_class, config, repository_id, branch=None, subtype=None
+) -> Optional[Callable[[str], bool]]:
+    """
+    Prepare the prerendering of the pages of an upload: returns the function
+    to call with the commit id once the reference is persisted, or None when
+    the pages are not prerendered.
+    """
+    prerenderer = host_app.extensions.get("ccguard.prerender")
+    if not prerenderer or not render_cache(config):
+        return None
+
+    previous = None
+    if branch:
+        # the diff is rendered against the reference this one supersedes
+        with adapter_class(repository_id, config) as adapter:
+            previous = get_last_commit(adapter, branch, subtype)
+
+    def submit(commit_id):
+        return prerenderer.submit(
+            prerender_pages, config, repository_id, commit_id, previous, subtype
+        )
+
+    return submit
+
+
+def persist_reference(
+    adapter_class, config, repository_id, commit_id, data, branch=None, subtype=None
+):
     with adapter_class(repository_id, config) as adapter:
-        data = request.get_data()
-        try:
-            adapter.persist(commit_id, data, branch=branch, subtype=subtype)
-        except Exception:
-            logging.exception("Unexpected exception on persist.")
-            abort(400, "Invalid request.")
-        return "{} bytes ({}) received".format(len(data), type(data).__name__)
+        adapter.persist(commit_id, data, branch=branch, subtype=subtype)
+
+
+def parse_batch(body: bytes) -> List[tuple]:
+    """Parse the NDJSON lines of a batch upload into references."""
+    references = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        references.append(
+            (
+                str(item["commit_id"]),
+                base64.b64decode(item["data"], validate=True),
+                item.get("branch"),
+                item.get("subtype"),
+            )
+        )
+    return references
+
+
+@api_v1.route("/references/<string:repository_id>/batch", methods=["POST"])
+@authenticated
+def api_upload_references(repository_id):
+    config = server_configuration()
+    adapter_class = ccguard.adapter_factory(None, config)
+    try:
+        references = parse_batch(request_body(config))
+    except (ValueError, KeyError, TypeError):
+        abort(400, "Invalid request.")
+
+    try:
+        with adapter_class(repository_id, config) as adapter:
+            # a single transaction for the whole batch: all or nothing
+            statuses = adapter.persist_many(references, batch_size=len(references))
+    except Exception:
+        logging.exception("Unexpected exception on persist.")
+        abort(400, "Invalid request.")
+
+    items = [
+        {"commit_id": commit_id, "subtype": subtype, "status": status}
+        for (commit_id, _, _, subtype), status in zip(references, statuses)
+    ]
+    return jsonify({"items": items})
 
 
 @api_v1.route(
@@ -684,18 +1146,34 @@ def api_compare(repository_id, commit_id1, commit_id2):
     subtype = request.args.get("subtype")
     tolerance = int(request.args.get("tolerance") or 0)
     hard_minimum = int(request.args.get("hard_minimum") or 0)
-    config = ccguard.configuration()
+    etag = reference_etag(
+        "comparison",
+        repository_id,
+        commit_id1,
+        commit_id2,
+        subtype,
+        tolerance,
+        hard_minimum,
+    )
+    if not_modified(etag):
+        return cacheable(Response(status=304), etag)
+
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
-        reference = retrieve(adapter, commit_id1, subtype=subtype)
-        challenger = retrieve(adapter, commit_id2, subtype=subtype)
+        reference_data = adapter.retrieve_cc_data(commit_id1, subtype=subtype)
+        challenger_data = adapter.retrieve_cc_data(commit_id2, subtype=subtype)
+        if not reference_data or not challenger_data:
+            abort(404, NOT_FOUND)
+        reference = parse_reference(reference_data)
+        challenger = parse_reference(challenger_data)
         if not reference or not challenger:
-            abort(404, b"<html><h1>Huh-oh</h1><p>Sorry, no data found.</p></html>")
+            abort(404, NOT_FOUND)
         diff = CoberturaDiff(reference, challenger)
         has_coverage_improved = ccguard.has_better_coverage(
             diff, tolerance=tolerance, hard_minimum=hard_minimum
         )
-        return str(255 if not has_coverage_improved else 0)
+        return cacheable(str(255 if not has_coverage_improved else 0), etag)
 
 
 @web.route("/report/<string:repository_id>/<string:commit_id>", methods=["GET"])
@@ -731,25 +1209,102 @@ preElement.innerHTML = "ccguard_server_address=" + serverAddress + " ccguard_sho
 
 
 def report(repository_id, commit_id=None, branch=None, subtype=None):
-    config = ccguard.configuration()
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
+        # the main report of a branch changes with every new reference
+        immutable = bool(commit_id)
         commit_id = commit_id or get_last_commit(adapter, branch, subtype)
-        reference = retrieve(adapter, commit_id, subtype=subtype)
-        if not reference:
-            abort(404, b"<html><h1>Huh-oh</h1><p>Sorry, no data found.</p></html>")
-        # sources_message = SOURCES_MESSAGE.format(commit_id=commit_id)
-        report = HtmlReporter(
-            reference,
-            # title="Coverage report for commit {commit_id}".format(commit_id=commit_id),
-            # render_file_sources=False,
-            # no_file_sources_message=sources_message.format(commit_id),
-        )
-        return report.generate()
+        if not commit_id:
+            abort(404, NOT_FOUND)
+        etag = reference_etag("report", repository_id, commit_id, subtype)
+        unmodified = not_modified_page(etag, immutable)
+        if unmodified:
+            return unmodified
+        cache = render_cache(config)
+        key = report_key(repository_id, commit_id, subtype)
+        cached = cached_page(cache, key, immutable)
+        if cached:
+            return cached
+        data = adapter.retrieve_cc_data(commit_id, subtype=subtype)
+        if not data:
+            abort(404, NOT_FOUND)
+        page = render_report(data)
+        if page is None:
+            abort(404, NOT_FOUND)
+        cache_page(cache, key, page, etag)
+        return cacheable(page, etag, immutable)
+
+
+def report_key(repository_id, commit_id, subtype=None) -> tuple:
+    return ("report", ccguard.__version__, repository_id, commit_id, subtype)
+
+
+def diff_key(repository_id, commit_id1, commit_id2, subtype=None) -> tuple:
+    return (
+        "diff",
+        ccguard.__version__,
+        repository_id,
+        commit_id1,
+        commit_id2,
+        subtype,
+    )
+
+
+def render_report(data) -> Optional[str]:
+    reference = parse_reference(data)
+    if not reference:
+        return None
+    # sources_message = SOURCES_MESSAGE.format(commit_id=commit_id)
+    report = HtmlReporter(
+        reference,
+        # title="Coverage report for commit {commit_id}".format(commit_id=commit_id),
+        # render_file_sources=False,
+        # no_file_sources_message=sources_message.format(commit_id),
+    )
+    return report.generate()
+
+
+def render_diff(reference_data, challenger_data) -> Optional[str]:
+    reference = parse_reference(reference_data)
+    challenger = parse_reference(challenger_data)
+    if not reference or not challenger:
+        return None
+    delta = HtmlReporterDelta(reference, challenger)
+    return delta.generate()
+
+
+def prerender_pages(config, repository_id, commit_id, previous=None, subtype=None):
+    """Render the report of a new reference, and its diff with the previous one."""
+    cache = render_cache(config)
+    adapter_class = ccguard.adapter_factory(None, config)
+    with adapter_class(repository_id, config) as adapter:
+        data = adapter.retrieve_cc_data(commit_id, subtype=subtype)
+        if not data:
+            return
+        page = render_report(data)
+        if page is not None:
+            etag = reference_etag("report", repository_id, commit_id, subtype)
+            cache_page(cache, report_key(repository_id, commit_id, subtype), page, etag)
+
+        if not previous or previous == commit_id:
+            return
+        previous_data = adapter.retrieve_cc_data(previous, subtype=subtype)
+        if not previous_data:
+            return
+        page = render_diff(previous_data, data)
+        if page is not None:
+            etag = reference_etag("diff", repository_id, previous, commit_id, subtype)
+            key = diff_key(repository_id, previous, commit_id, subtype)
+            cache_page(cache, key, page, etag)
 
 
 def retrieve(adapter, commit_id, source="ccguard", subtype=None):
     cc_reference_data = adapter.retrieve_cc_data(commit_id, subtype=subtype)
+    return parse_reference(cc_reference_data, source=source)
+
+
+def parse_reference(cc_reference_data, source="ccguard"):
     reference_fd = io.BytesIO(cc_reference_data)
 
     try:
@@ -764,15 +1319,28 @@ def retrieve(adapter, commit_id, source="ccguard", subtype=None):
 )
 def web_generate_diff(repository_id, commit_id1, commit_id2):
     subtype = request.args.get("subtype")
-    config = ccguard.configuration()
+    etag = reference_etag("diff", repository_id, commit_id1, commit_id2, subtype)
+    unmodified = not_modified_page(etag)
+    if unmodified:
+        return unmodified
+
+    config = server_configuration()
     adapter_class = ccguard.adapter_factory(None, config)
     with adapter_class(repository_id, config) as adapter:
-        reference = retrieve(adapter, commit_id1, subtype=subtype)
-        challenger = retrieve(adapter, commit_id2, subtype=subtype)
-        if not reference or not challenger:
-            abort(404, b"<html><h1>Huh-oh</h1><p>Sorry, no data found.</p></html>")
-        delta = HtmlReporterDelta(reference, challenger)
-        return delta.generate()
+        cache = render_cache(config)
+        key = diff_key(repository_id, commit_id1, commit_id2, subtype)
+        cached = cached_page(cache, key)
+        if cached:
+            return cached
+        reference_data = adapter.retrieve_cc_data(commit_id1, subtype=subtype)
+        challenger_data = adapter.retrieve_cc_data(commit_id2, subtype=subtype)
+        if not reference_data or not challenger_data:
+            abort(404, NOT_FOUND)
+        page = render_diff(reference_data, challenger_data)
+        if page is None:
+            abort(404, NOT_FOUND)
+        cache_page(cache, key, page, etag)
+        return cacheable(page, etag)
 
 
 def _prepare_event(config=None):
@@ -78,13 +78,7 @@ def main(args=None, log_function=print):
     args.commit_id = ccguard.get_output(command, args.repository).rstrip("\n")
 
     with adapter_class(repo_id, config) as adapter:
-        refs = adapter.get_cc_commits(subtype=args.subtype)
-
-        first_ref = None
-        for ref in refs:
-            if ref.startswith(args.commit_id):
-                first_ref = ref
-                break
+        first_ref = adapter.resolve_prefix(args.commit_id, subtype=args.subtype)
 
         if first_ref:
             print_report(
@@ -34,17 +34,26 @@ def prepare_inner_callable(commit_id):
 
     else:
 
+        def iter_references(source_adapter, log_function):
+            commit_ids = source_adapter.get_cc_commits()
+            log_function("⌛ Start retrieving data for %d commits...", len(commit_ids))
+            # one round trip for all the references
+            for commit_id, data in source_adapter.retrieve_many(commit_ids):
+                log_function("✅ (%s) data retrieved!", commit_id)
+                yield commit_id, data, None, None
+
         def inner_callable(
             source_adapter: ccguard.ReferenceAdapter,
             dest_adapter: ccguard.ReferenceAdapter,
             log_function=logging.debug,
         ):
             log_function("Start retrieving data...")
-            for commit_id in source_adapter.get_cc_commits():
-                log_function("⌛ Start retrieving data for %s...", commit_id)
-                data = source_adapter.retrieve_cc_data(commit_id)
-                log_function("✅ (%s) data retrieved!", commit_id)
-                dest_adapter.persist(commit_id, data)
+            # the destination records the references in batches
+            statuses = dest_adapter.persist_many(
+                iter_references(source_adapter, log_function)
+            )
+            for status in sorted(set(statuses)):
+                log_function("%d references %s.", statuses.count(status), status)
 
     return inner_callable
 
@@ -0,0 +1,71 @@
+"""
+Cobertura reports whose sources are read from a given git commit.
+"""
+
+import io
+import logging
+import os
+import subprocess
+from contextlib import contextmanager
+
+from pycobertura import Cobertura
+from pycobertura.filesystem import FileSystem
+
+try:
+    from .ccguard import GitAdapter, get_output
+except ImportError:  # executed as a script
+    from ccguard import GitAdapter, get_output
+
+
+class GitFileSystem(FileSystem):
+    def __init__(self, repo_folder, commit_id=None):
+        self.repository = repo_folder
+        self.commit_id = commit_id
+        self.repository_root = GitAdapter(repo_folder).get_root_path()
+        self.prefix = self.repository.replace(self.repository_root, "").lstrip("/")
+
+    def real_filename(self, filename):
+        prefix = "{}/".format(self.prefix) if self.prefix else ""
+        return "{p.commit_id}:{prefix}{filename}".format(
+            prefix=prefix, p=self, filename=filename
+        )
+
+    def has_file(self, filename):
+        command = "git --no-pager show {}".format(self.real_filename(filename))
+        return_code = subprocess.call(
+            command,
+            cwd=self.repository,
+            shell=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        logging.debug("%s: %d", command, return_code)
+        return not bool(return_code)
+
+    @contextmanager
+    def open(self, filename):
+        """
+        Yield a file-like object for file `filename`.
+
+        This function is a context manager.
+        """
+        filename = self.real_filename(filename)
+
+        try:
+            output = get_output(
+                "git --no-pager show {}".format(filename), self.repository
+            )
+        except Exception:
+            raise self.FileNotFound(filename)
+
+        yield io.StringIO(output)
+
+
+class VersionedCobertura(Cobertura):
+    def __init__(self, report, source=None, commit_id=None):
+        super().__init__(report, source=source)
+        if source is None:
+            if isinstance(report, str):
+                # get the directory in which the coverage file lives
+                source = os.path.dirname(report)
+        self.filesystem = GitFileSystem(source, commit_id=commit_id)
@@ -0,0 +1,204 @@
+"""
+A single writer thread, recording the uploaded references in groups.
+
+Concurrent uploads would otherwise each commit their own transaction (and
+wait for their own fsync), serialized on the database lock. The writer
+drains its queue for a few milliseconds, records every pending reference
+in one transaction per database, and commits them together. The future
+of each reference is resolved once its group has been committed.
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List
+
+import ccguard
+
+_STOP = object()
+
+
+class _Job(object):
+    def __init__(
+        self, adapter_class, config, repository_id, commit_id, data, branch, subtype
+    ):
+        self.adapter_class = adapter_class
+        self.config = config
+        self.repository_id = repository_id
+        self.commit_id = commit_id
+        self.data = data
+        self.branch = branch
+        self.subtype = subtype
+        self.future = Future()
+
+    @property
+    def dbpath(self) -> str:
+        return str(self.config.get("sqlite.dbpath"))
+
+
+class GroupCommitWriter(object):
+    def __init__(
+        self, max_batch: int = 256, max_delay: float = 0.005, busy_timeout: float = 30
+    ):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        # other processes (ie. other workers) may hold the database lock
+        self.busy_timeout = busy_timeout
+        self.queue = queue.Queue()
+        self._connections: Dict[str, sqlite3.Connection] = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "GroupCommitWriter":
+        return cls(
+            max_batch=config.get("server.writer.max-batch", 256),
+            max_delay=config.get("server.writer.max-delay-ms", 5) / 1000,
+            busy_timeout=config.get("server.writer.busy-timeout", 30),
+        )
+
+    @staticmethod
+    def supports(adapter_class) -> bool:
+        """Whether the references of this adapter can be committed in groups."""
+        return isinstance(adapter_class, type) and issubclass(
+            adapter_class, ccguard.SqliteAdapter
+        )
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="ccguard-writer", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self.queue.put(_STOP)
+            thread.join()
+
+    def submit(
+        self,
+        adapter_class,
+        config,
+        repository_id,
+        commit_id,
+        data,
+        branch=None,
+        subtype=None,
+    ) -> Future:
+        self.start()
+        job = _Job(
+            adapter_class, config, repository_id, commit_id, data, branch, subtype
+        )
+        self.queue.put(job)
+        return job.future
+
+    def persist(self, *args, **kwargs):
+        """Submit a reference, and wait for its group to be committed."""
+        return self.submit(*args, **kwargs).result()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            job = self.queue.get()
+            if job is _STOP:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        job = self.queue.get(timeout=timeout)
+                    else:
+                        job = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stop = True
+                    break
+                batch.append(job)
+
+            try:
+                self._write(batch)
+            except Exception as exception:
+                logging.exception("Unable to write %d references.", len(batch))
+                for conn in self._connections.values():
+                    if conn.in_transaction:
+                        conn.rollback()
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(exception)
+
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+    def _connection(self, dbpath: str) -> sqlite3.Connection:
+        if dbpath not in self._connections:
+            self._connections[dbpath] = sqlite3.connect(
+                dbpath, timeout=self.busy_timeout
+            )
+        return self._connections[dbpath]
+
+    def _write(self, batch: List[_Job]):
+        by_database: Dict[str, List[_Job]] = {}
+        for job in batch:
+            by_database.setdefault(job.dbpath, []).append(job)
+
+        for dbpath, jobs in by_database.items():
+            try:
+                conn = self._connection(dbpath)
+                conn.execute("BEGIN")
+            except sqlite3.Error as exception:
+                for job in jobs:
+                    job.future.set_exception(exception)
+                continue
+
+            recorded, adapters = [], {}
+            for job in jobs:
+                # a failing reference is rolled back alone
+                conn.execute("SAVEPOINT reference")
+                try:
+                    key = (job.adapter_class, job.repository_id, id(job.config))
+                    if key not in adapters:
+                        adapters[key] = job.adapter_class(
+                            job.repository_id, job.config, conn=conn
+                        )
+                    adapters[key]._persist(
+                        job.commit_id, job.data, branch=job.branch, subtype=job.subtype
+                    )
+                    conn.execute("RELEASE reference")
+                    recorded.append(job)
+                except Exception as exception:
+                    conn.execute("ROLLBACK TO reference")
+                    conn.execute("RELEASE reference")
+                    job.future.set_exception(exception)
+
+            try:
+                conn.commit()
+            except sqlite3.Error as exception:
+                logging.exception("Unable to commit %d references.", len(recorded))
+                conn.rollback()
+                for adapter in adapters.values():
+                    adapter._on_rollback()
+                for job in recorded:
+                    job.future.set_exception(exception)
+                continue
+
+            for adapter in adapters.values():
+                try:
+                    adapter._on_commit()
+                except OSError:
+                    # the pack is filled from the database when read
+                    logging.exception("Unable to write the pack of %r.", adapter)
+
+            logging.debug("Committed %d references to %s.", len(recorded), dbpath)
+            for job in recorded:
+                job.future.set_result(None)
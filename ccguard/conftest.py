@@ -0,0 +1,11 @@
+import pytest
+
+from . import ccguard_server
+
+
+@pytest.fixture(autouse=True)
+def fresh_server_configuration():
+    # the tests replace ccguard.configuration: the server loads it anew in each
+    ccguard_server.app.extensions.pop("ccguard.configuration", None)
+    yield
+    ccguard_server.app.extensions.pop("ccguard.configuration", None)
@@ -1,8 +1,10 @@
 import io
 import os
 import re
+import shutil
 from . import ccguard
 from unittest.mock import MagicMock, patch
+import pytest
 from pycobertura import Cobertura, CoberturaDiff
 from shutil import copyfile
 
@@ -116,6 +118,31 @@ def test_configuration():
         assert config["test"]
 
 
+def test_configuration_cache():
+    path = "./ccguard-test-config"
+    os.makedirs(path, exist_ok=True)
+    config_path = os.path.join(path, ccguard.CONFIG_FILE_NAME)
+    try:
+        with open(config_path, "w") as fd:
+            fd.write('{"test": 1}')
+        loader = MagicMock(side_effect=ccguard.configuration)
+        cache = ccguard.ConfigurationCache(path, loader=loader, check_interval=0)
+        assert cache.get()["test"] == 1
+        assert cache.get()["test"] == 1
+        assert loader.call_count == 1
+
+        with open(config_path, "w") as fd:
+            fd.write('{"test": 22}')
+        assert cache.get()["test"] == 22
+        assert loader.call_count == 2
+
+        cache.invalidate()
+        cache.get()
+        assert loader.call_count == 3
+    finally:
+        shutil.rmtree(path)
+
+
 def adapter_scenario(adapter: ccguard.ReferenceAdapter):
     commits = adapter.get_cc_commits()
     adapter.persist("one", b"<coverage>1</coverage>")
@@ -167,6 +194,264 @@ def test_sqladapter():
         os.unlink(abspath)
 
 
+def test_sqladapter_latest_reference():
+    config = {"sqlite.dbpath": "./ccguard.latest.db"}
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            assert adapter.get_latest_reference("master") is None
+            adapter.persist("one", b'<coverage line-rate="0.5"/>', branch="master")
+            adapter.persist("two", b'<coverage line-rate="0.6"/>', branch="feature")
+            adapter.persist("thr", b'<coverage line-rate="0.7"/>', branch="master")
+            adapter.persist("fou", b'<coverage line-rate="0.8"/>', "master", "unit")
+            assert adapter.get_latest_reference("master") == ("thr", 0.7)
+            assert adapter.get_latest_reference("feature") == ("two", 0.6)
+            assert adapter.get_latest_reference("master", "unit") == ("fou", 0.8)
+            # recording an old reference again leaves the pointer as it is
+            adapter.persist("one", b'<coverage line-rate="0.5"/>', branch="master")
+            assert adapter.get_latest_reference("master") == ("thr", 0.7)
+            assert adapter.get_commit_info("two") == (0.6, 0, 0)
+
+            # references recorded before the pointers existed
+            adapter.conn.execute("DELETE FROM " + adapter._latest_table_name())
+            assert adapter.get_latest_reference("master") == ("thr", 0.7)
+            query = "SELECT count(*) FROM " + adapter._latest_table_name()
+            assert adapter.conn.execute(query).fetchone() == (1,)
+    finally:
+        os.unlink("./ccguard.latest.db")
+
+
+def test_sqladapter_persist_many():
+    config = {"sqlite.dbpath": "./ccguard.many.db"}
+    references = [
+        ("one", b'<coverage line-rate="0.5"/>', "master", None),
+        ("one", b'<coverage line-rate="0.6"/>', "master", "unit"),
+        ("two", b"", "master", None),
+        ("one", b'<coverage line-rate="0.5"/>', "master", None),
+    ]
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            statuses = adapter.persist_many(iter(references))
+            assert statuses == ["recorded", "recorded", "invalid", "duplicate"]
+            assert adapter.get_cc_commits() == frozenset(["one"])
+            assert adapter.get_cc_commits(subtype="unit") == frozenset(["one"])
+            assert adapter.get_latest_reference("master", "unit") == ("one", 0.6)
+            assert not adapter.conn.in_transaction
+    finally:
+        os.unlink("./ccguard.many.db")
+
+
+def test_sqladapter_persist_unindexable_report(tmp_path):
+    config = {"sqlite.dbpath": str(tmp_path.joinpath("ccguard.db"))}
+    data = report(("src/a.py", 1, 2)).replace(b'hits="1"', b'hits="many"', 1)
+    with ccguard.SqliteAdapter("test", config) as adapter:
+        adapter.persist("one", data)
+        assert adapter.retrieve_cc_data("one") == data
+        assert list(adapter.list_file_summaries(["one"], "src")) == [("one", 0, 0)]
+
+
+def test_sqladapter_persist_many_in_batches():
+    config = {"sqlite.dbpath": "./ccguard.batches.db", "sqlite.batch.size": 2}
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+
+            def references():
+                for commit_id in ("one", "two", "thr"):
+                    # the source is not read within a transaction
+                    assert not adapter.conn.in_transaction
+                    yield commit_id, b'<coverage line-rate="0.5"/>', None, None
+                raise OSError("the source went away")
+
+            with pytest.raises(OSError):
+                adapter.persist_many(references())
+            # the batches read before the failure are committed
+            assert adapter.get_cc_commits() == frozenset(["one", "two"])
+    finally:
+        os.unlink("./ccguard.batches.db")
+
+
+def test_sqladapter_retrieve_many():
+    config = {"sqlite.dbpath": "./ccguard.retrieve.db"}
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            adapter._max_variables = 2
+            for commit_id in ("one", "two", "thr"):
+                adapter.persist(
+                    commit_id, b"<coverage>" + commit_id.encode() + b"</coverage>"
+                )
+            adapter.persist("fou", b"<coverage/>", subtype="unit")
+            references = list(
+                adapter.retrieve_many(["thr", "none", "one", "two", "fou", "one"])
+            )
+            assert [commit_id for commit_id, _ in references] == ["thr", "one", "two"]
+            assert references[0][1] == b"<coverage>thr</coverage>"
+            assert list(adapter.retrieve_many(["fou"], subtype="unit")) == [
+                ("fou", b"<coverage/>")
+            ]
+            query = "SELECT count FROM {} WHERE commit_id = 'one'"
+            assert adapter.conn.execute(
+                query.format(adapter._table_name())
+            ).fetchone() == (2,)
+    finally:
+        os.unlink("./ccguard.retrieve.db")
+
+
+def test_git_iter_log():
+    git = ccguard.GitAdapter()
+    log = git.iter_log(limit=2)
+    commit_id, subject = next(log)
+    assert commit_id == git.get_current_commit_id()
+    assert subject
+    assert len(list(log)) == 1
+
+
+def test_sqladapter_iter_cc_commits():
+    config = {"sqlite.dbpath": "./ccguard.iter.db"}
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            adapter.persist("abc1", b"<coverage/>", branch="master")
+            adapter.persist("abc2", b"<coverage/>", branch="feature")
+            adapter.persist("abc1", b"<coverage/>", subtype="unit")
+            adapter.persist("def3", b"<coverage/>", branch="master")
+
+            commits = adapter.iter_cc_commits()
+            assert next(commits) == "def3"
+            assert list(commits) == ["abc1", "abc2"]
+            assert list(adapter.iter_cc_commits(branch="master")) == ["def3", "abc1"]
+            assert list(adapter.iter_cc_commits(subtype="unit")) == ["abc1"]
+
+            assert adapter.resolve_prefix("abc") == "abc1"
+            assert adapter.resolve_prefix("abc", subtype="default") == "abc2"
+            assert adapter.resolve_prefix("abc1") == "abc1"
+            assert adapter.resolve_prefix("abd") is None
+            assert adapter.resolve_prefix("") is None
+    finally:
+        os.unlink("./ccguard.iter.db")
+
+
+def test_sqladapter_list_summaries():
+    config = {"sqlite.dbpath": "./ccguard.summaries.db"}
+    data = b'<coverage line-rate="0.5" lines-covered="1" lines-valid="2"/>'
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            adapter.persist("one", data, branch="master")
+            adapter.persist("two", data, subtype="unit")
+            adapter._max_variables = 1
+            summaries = list(adapter.list_summaries(["two", "one", "thr"]))
+            assert summaries == [("one", 0.5, 1, 2, "master", "default")]
+            summaries = list(adapter.list_summaries(["two"], subtype="unit"))
+            assert summaries == [("two", 0.5, 1, 2, None, "unit")]
+    finally:
+        os.unlink("./ccguard.summaries.db")
+
+
+def test_adapter_list_summaries_from_data():
+    adapter = ccguard.ReferenceAdapter("test", {})
+    data = b'<coverage line-rate="0.5" lines-covered="1" lines-valid="2"/>'
+    adapter.retrieve_cc_data = MagicMock(side_effect=[data, None])
+    summaries = list(adapter.list_summaries(["one", "two"]))
+    assert summaries == [("one", 0.5, 1, 2, None, None)]
+
+
+def report(*files):
+    classes = "".join(
+        '<class filename="{}"><lines>{}</lines></class>'.format(
+            filename,
+            "".join(
+                '<line number="{}" hits="{}"/>'.format(number, int(number <= covered))
+                for number in range(1, valid + 1)
+            ),
+        )
+        for filename, covered, valid in files
+    )
+    xml = "<coverage><packages><package><classes>{}</classes></package></packages>"
+    return (xml.format(classes) + "</coverage>").encode("utf-8")
+
+
+def test_file_coverage():
+    data = report(("src/a.py", 1, 2), ("src/b.py", 3, 3))
+    assert ccguard.file_coverage(data) == {"src/a.py": (1, 2), "src/b.py": (3, 3)}
+    assert ccguard.file_coverage(ccguard.ccguard_binary.encode(data)) == {
+        "src/a.py": (1, 2),
+        "src/b.py": (3, 3),
+    }
+    assert ccguard.file_coverage(b"invalid xml") == {}
+    for hits in ("1.5", "many"):
+        unexpected = data.replace(b'hits="1"', 'hits="{}"'.format(hits).encode(), 1)
+        assert ccguard.file_coverage(unexpected) == {}
+    assert ccguard.in_path("src/a.py", "src/")
+    assert ccguard.in_path("src/a.py", "src/a.py")
+    assert not ccguard.in_path("src2/a.py", "src")
+    assert ccguard.in_path("src2/a.py", "")
+
+
+def test_sqladapter_list_file_summaries():
+    config = {"sqlite.dbpath": "./ccguard.files.db"}
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            adapter.persist("one", report(("src/a.py", 1, 2), ("src2/c.py", 1, 1)))
+            adapter.persist("two", report(("src/a.py", 2, 2), ("src/b/b.py", 1, 4)))
+            adapter.persist("thr", report(("src2/c.py", 0, 1)), subtype="unit")
+
+            summaries = list(adapter.list_file_summaries(["two", "one", "thr"], "src"))
+            assert summaries == [("two", 3, 6), ("one", 1, 2)]
+            summaries = adapter.list_file_summaries(["one", "two"], "src2/c.py")
+            assert list(summaries) == [("one", 1, 1), ("two", 0, 0)]
+            summaries = adapter.list_file_summaries(["one", "thr"], "", "unit")
+            assert list(summaries) == [("thr", 0, 1)]
+
+            # references recorded before the files were indexed
+            adapter.conn.execute("DELETE FROM " + adapter._files_table_name())
+            adapter._max_variables = 1
+            summaries = adapter.list_file_summaries(["two", "one"], "src/b")
+            assert list(summaries) == [("two", 1, 4), ("one", 0, 0)]
+            query = "SELECT count(*) FROM " + adapter._files_table_name()
+            assert adapter.conn.execute(query).fetchone() == (4,)
+    finally:
+        os.unlink("./ccguard.files.db")
+
+
+def test_sqladapter_list_references():
+    config = {"sqlite.dbpath": "./ccguard.list.db"}
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            for index in range(5):
+                commit_id = "commit{}".format(index)
+                adapter.persist(commit_id, b"<coverage/>", branch="master")
+                timestamp = "2020-01-0{} 10:00:00".format(index + 1)
+                query = "UPDATE {} SET collected_at = ? WHERE commit_id = ?"
+                adapter.conn.execute(
+                    query.format(adapter._table_name()), (timestamp, commit_id)
+                )
+            adapter.persist("commit4", b"<coverage/>", "feature", "unit")
+
+            references, cursor = adapter.list_references(limit=2)
+            assert [r["commit_id"] for r in references] == ["commit4", "commit4"]
+            assert references[1] == {
+                "commit_id": "commit4",
+                "subtype": "default",
+                "branch": "master",
+                "collected_at": "2020-01-05 10:00:00",
+            }
+            references, cursor = adapter.list_references(cursor=cursor, limit=2)
+            assert [r["commit_id"] for r in references] == ["commit3", "commit2"]
+            references, cursor = adapter.list_references(cursor=cursor, limit=2)
+            assert [r["commit_id"] for r in references] == ["commit1", "commit0"]
+            assert cursor is None
+
+            references, _ = adapter.list_references(
+                branch="master", since="2020-01-02", until="2020-01-04T10:00:00"
+            )
+            assert [r["commit_id"] for r in references] == [
+                "commit3",
+                "commit2",
+                "commit1",
+            ]
+            references, _ = adapter.list_references(subtype="unit")
+            assert [r["branch"] for r in references] == ["feature"]
+    finally:
+        os.unlink("./ccguard.list.db")
+
+
 class MockRequest(object):
     pattern = re.compile(".*api/v1/references/test/(?P<commit_id>.*)/data.*")
 
@@ -177,19 +462,30 @@ class MockRequest(object):
         commit_id = self.pattern.match(uri).group("commit_id")
         self.data[commit_id] = data
 
-    def get(self, uri):
-        if "/all" in uri:
-            return MagicMock(json=MagicMock(return_value=list(self.data.keys())))
+    def get(self, uri, headers=None):
+        if "/list" in uri:
+            references = [{"commit_id": commit_id} for commit_id in self.data]
+            page = {"references": references, "next": None}
+            return MagicMock(status_code=200, json=MagicMock(return_value=page))
         if "/data" in uri:
             commit_id = self.pattern.match(uri).group("commit_id")
             return MagicMock(content=self.data.get(commit_id))
 
+    def post(self, uri, json, stream=False):
+        frames = [
+            ccguard.ccguard_frames.encode_frame(commit_id, None, self.data[commit_id])
+            for commit_id in json["commit_ids"]
+            if commit_id in self.data
+        ]
+        return MagicMock(status_code=200, iter_content=MagicMock(return_value=frames))
+
 
 def test_webadapter():
     with patch.object(ccguard, "requests") as mock:
         mock_object = MockRequest()
         mock.put = MagicMock(side_effect=mock_object.put)
         mock.get = MagicMock(side_effect=mock_object.get)
+        mock.post = MagicMock(side_effect=mock_object.post)
         with ccguard.WebAdapter("test", {}) as adapter:
             adapter_scenario(adapter)
 
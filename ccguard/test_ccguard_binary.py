@@ -0,0 +1,118 @@
+import io
+import os
+import struct
+from unittest.mock import patch
+
+from pycobertura import Cobertura
+
+from . import ccguard
+from . import ccguard_binary
+from . import ccguard_convert
+
+
+def read(path):
+    with open(path, "rb") as fd:
+        return fd.read()
+
+
+def test_is_binary():
+    data = read("ccguard/test_data/sample_coverage.xml")
+    assert not ccguard_binary.is_binary(data)
+    assert ccguard_binary.is_binary(ccguard_binary.encode(data))
+    assert not ccguard_binary.is_binary(None)
+
+
+def test_encode_is_smaller():
+    data = read("ccguard/test_data/sample_coverage_longer.xml")
+    assert len(ccguard_binary.encode(data)) * 5 < len(data)
+
+
+def test_round_trip():
+    path = "ccguard/test_data/sample_coverage_longer.xml"
+    data = read(path)
+    decoded = ccguard_binary.decode(ccguard_binary.encode(data))
+
+    original = Cobertura(path)
+    converted = Cobertura(io.BytesIO(decoded))
+    assert original.line_rate() == converted.line_rate()
+    assert sorted(original.files()) == sorted(converted.files())
+    for filename in original.files():
+        assert original.missed_lines(filename) == converted.missed_lines(filename)
+        assert original.total_statements(filename) == converted.total_statements(
+            filename
+        )
+
+
+def test_random_access():
+    data = read("ccguard/test_data/sample_coverage.xml")
+    report = ccguard_binary.BinaryCoverage(ccguard_binary.encode(data))
+    assert report.line_rate == 0.791
+    assert (report.lines_covered, report.lines_valid) == (246, 311)
+    assert "ccguard.py" in report.files()
+    lines = dict(report.lines("ccguard.py"))
+    assert lines[3] == 1
+    covered, valid = report.summary("ccguard.py")
+    assert valid == len(lines)
+    assert covered == len([hits for hits in lines.values() if hits])
+
+
+def test_large_hits():
+    data = b"""<coverage><packages><package><classes><class filename="a.py">
+    <lines><line number="1" hits="5000000000"/></lines>
+    </class></classes></package></packages></coverage>"""
+    report = ccguard_binary.BinaryCoverage(ccguard_binary.encode(data))
+    assert list(report.lines("a.py")) == [(1, 5000000000)]
+
+
+def test_version_1_is_readable():
+    data = read("ccguard/test_data/sample_coverage.xml")
+    with patch.object(ccguard_binary, "VERSION", 1), patch.object(
+        ccguard_binary, "_RUN", struct.Struct("<III")
+    ):
+        encoded = ccguard_binary.encode(data)
+    report = ccguard_binary.BinaryCoverage(encoded)
+    assert dict(report.lines("ccguard.py"))[3] == 1
+    assert ccguard_binary.decode(encoded) == ccguard_binary.decode(
+        ccguard_binary.encode(data)
+    )
+
+
+def test_load():
+    path = "ccguard/test_data/sample_coverage.bin"
+    try:
+        ccguard_convert.main(
+            [
+                "ccguard/test_data/sample_coverage.xml",
+                "-if",
+                "xml",
+                "-of",
+                "binary",
+                "-o",
+                path,
+            ]
+        )
+        report = ccguard_binary.load(path)
+        assert report.line_rate == 0.791
+        assert report.files()
+    finally:
+        os.unlink(path)
+
+
+def test_sqlite_binary_storage():
+    config = {"sqlite.dbpath": "./ccguard.binary.db", "sqlite.storage.format": "binary"}
+    data = read("ccguard/test_data/sample_coverage.xml")
+    try:
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            adapter.persist("one", data)
+            stored = adapter.conn.execute(
+                "SELECT data FROM {}".format(adapter._table_name())
+            ).fetchone()[0]
+            assert ccguard_binary.is_binary(stored)
+            assert adapter.get_cc_commits() == frozenset(["one"])
+            xml = adapter.retrieve_cc_data("one")
+            assert not ccguard_binary.is_binary(xml)
+            assert Cobertura(io.BytesIO(xml)).line_rate() == 0.791
+            binary = adapter.retrieve_cc_data("one", encoding="binary")
+            assert ccguard_binary.is_binary(binary)
+    finally:
+        os.unlink("./ccguard.binary.db")
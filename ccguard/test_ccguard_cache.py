@@ -0,0 +1,125 @@
+import os
+import shutil
+from unittest.mock import MagicMock, patch
+
+from . import ccguard
+from . import ccguard_cache
+
+
+def test_disk_cache():
+    try:
+        cache = ccguard_cache.DiskCache("./ccguard-test-cache")
+        assert cache.get(("a", "b")) is None
+        cache.put(("a", "b"), b"data\nmore data", {"etag": '"abc"'})
+        data, metadata = cache.get(("a", "b"))
+        assert data == b"data\nmore data"
+        assert metadata["etag"] == '"abc"'
+        assert cache.get(("a", "c")) is None
+    finally:
+        shutil.rmtree("./ccguard-test-cache")
+
+
+def test_disk_cache_eviction():
+    try:
+        cache = ccguard_cache.DiskCache("./ccguard-test-cache", max_size=250)
+        for index in range(3):
+            cache.put(("entry", index), b"x" * 100)
+            # make the modification times distinguishable
+            os.utime(cache._entry_path(("entry", index)), (index, index))
+        assert cache.get(("entry", 0)) is None
+        assert cache.get(("entry", 1))
+        cache.put(("entry", 3), b"x" * 100)
+        assert cache.get(("entry", 1))
+        assert cache.get(("entry", 2)) is None
+        assert cache.size() <= 250
+    finally:
+        shutil.rmtree("./ccguard-test-cache")
+
+
+def test_disk_cache_size_is_tracked(tmp_path):
+    cache = ccguard_cache.DiskCache(str(tmp_path), max_size=1000)
+    cache.put(("entry", 0), b"x" * 100)
+    with patch.object(cache, "_entries") as entries:
+        for index in range(1, 5):
+            cache.put(("entry", index), b"x" * 100)
+        cache.put(("entry", 0), b"x" * 10)
+        # the entries are not listed while the folder is within its size
+        entries.assert_not_called()
+    assert int(tmp_path.joinpath(".size").read_bytes()) == cache.size() == 4 * 103 + 13
+
+    # another process (with the same folder) sees the size
+    other = ccguard_cache.DiskCache(str(tmp_path), max_size=500)
+    other.put(("entry", 5), b"x" * 100)
+    assert cache.size() <= 500
+    assert int(tmp_path.joinpath(".size").read_bytes()) == cache.size()
+
+
+def test_web_adapter_cache_hit():
+    config = {"web.cache.path": "./ccguard-test-cache"}
+    data = b"<coverage/>"
+    try:
+        with patch.object(ccguard, "requests") as requests_mock:
+            requests_mock.get = MagicMock(
+                return_value=MagicMock(status_code=200, content=data, headers={})
+            )
+            adapter = ccguard.WebAdapter("repository", config)
+            assert adapter.retrieve_cc_data("abc") == data
+            assert adapter.retrieve_cc_data("abc") == data
+            assert requests_mock.get.call_count == 1
+
+            # another server, another entry
+            other = ccguard.WebAdapter(
+                "repository", dict(config, **{"ccguard.server.address": "http://a"})
+            )
+            assert other.retrieve_cc_data("abc") == data
+            assert requests_mock.get.call_count == 2
+    finally:
+        shutil.rmtree("./ccguard-test-cache")
+
+
+def test_web_adapter_revalidates():
+    config = {"web.cache.path": "./ccguard-test-cache", "web.cache.revalidate": True}
+    data = b"<coverage/>"
+    try:
+        with patch.object(ccguard, "requests") as requests_mock:
+            requests_mock.get = MagicMock(
+                return_value=MagicMock(
+                    status_code=200, content=data, headers={"ETag": '"abc"'}
+                )
+            )
+            adapter = ccguard.WebAdapter("repository", config)
+            assert adapter.retrieve_cc_data("abc") == data
+            assert not requests_mock.get.call_args[1]["headers"]
+
+            requests_mock.get = MagicMock(
+                return_value=MagicMock(status_code=304, content=b"", headers={})
+            )
+            assert adapter.retrieve_cc_data("abc") == data
+            headers = requests_mock.get.call_args[1]["headers"]
+            assert headers["If-None-Match"] == '"abc"'
+    finally:
+        shutil.rmtree("./ccguard-test-cache")
+
+
+def test_ttl_cache():
+    cache = ccguard_cache.TTLCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    cache.put("d", 4, ttl=-1)
+    assert cache.get("d", "expired") == "expired"
+    cache.pop("a")
+    assert cache.get("a") is None
+    cache.clear()
+    assert not len(cache)
+
+
+def test_web_adapter_cache_expands_the_home_folder(tmp_path):
+    with patch.dict(os.environ, {"HOME": str(tmp_path)}):
+        adapter = ccguard.WebAdapter("repository", {"web.cache.path": "~/cache"})
+    assert adapter.cache.path == tmp_path.joinpath("cache")
@@ -0,0 +1,80 @@
+import gzip
+
+import pytest
+from werkzeug.datastructures import Accept
+
+from . import ccguard_compression
+
+
+def test_compress_roundtrip():
+    data = b"<coverage/>" * 20000
+    compressed = ccguard_compression.compress(data, "gzip")
+    assert len(compressed) < len(data)
+    assert gzip.decompress(compressed) == data
+    chunks = [compressed[:100], compressed[100:]]
+    assert ccguard_compression.decompress_stream(chunks, "gzip") == data
+
+
+def test_compress_memoryview():
+    data = b"<coverage/>" * 20000
+    compressed = ccguard_compression.compress(memoryview(data), "gzip")
+    assert gzip.decompress(compressed) == data
+
+
+def test_decompress_errors():
+    compressed = ccguard_compression.compress(b"0" * 10000, "gzip")
+    with pytest.raises(ccguard_compression.PayloadTooLarge):
+        ccguard_compression.decompress_stream([compressed], "gzip", max_size=1000)
+    with pytest.raises(ccguard_compression.InvalidPayload):
+        ccguard_compression.decompress_stream([b"not gzip"], "gzip")
+    with pytest.raises(ccguard_compression.UnsupportedEncoding):
+        ccguard_compression.decompress_stream([compressed], "br")
+
+
+def test_decompress_truncated_or_trailing_data():
+    compressed = ccguard_compression.compress(b"<coverage/>" * 1000, "gzip")
+    with pytest.raises(ccguard_compression.InvalidPayload):
+        ccguard_compression.decompress_stream([compressed[:-10]], "gzip")
+    with pytest.raises(ccguard_compression.InvalidPayload):
+        ccguard_compression.decompress_stream([compressed, b"garbage"], "gzip")
+    with pytest.raises(ccguard_compression.InvalidPayload):
+        ccguard_compression.decompress_stream([], "gzip")
+
+
+@pytest.mark.parametrize("encoding", ccguard_compression.supported_encodings())
+def test_decompress_is_bounded(encoding):
+    # a single chunk expanding to 64 MB
+    compressed = ccguard_compression.compress(b"0" * 64 * 1024 * 1024, encoding)
+    assert len(compressed) < ccguard_compression.CHUNK_SIZE
+    decompressor = ccguard_compression._decompressor(encoding)
+    pieces = ccguard_compression._decompress_chunks(
+        decompressor, encoding, [compressed]
+    )
+    # gzip: CHUNK_SIZE, zstd: 128 KB per 4 bytes of ZSTD_SLICE_SIZE
+    assert len(next(pieces)) <= 8 * 1024 * 1024
+    with pytest.raises(ccguard_compression.PayloadTooLarge):
+        ccguard_compression.decompress_stream([compressed], encoding, max_size=1000)
+
+
+@pytest.mark.parametrize("encoding", ccguard_compression.supported_encodings())
+def test_decompress_roundtrip(encoding):
+    data = b"<coverage/>" * 200000
+    compressed = ccguard_compression.compress(data, encoding)
+    chunks = [compressed[:100], compressed[100:]]
+    assert ccguard_compression.decompress_stream(chunks, encoding) == data
+    with pytest.raises(ccguard_compression.InvalidPayload):
+        ccguard_compression.decompress_stream([compressed[:-4]], encoding)
+
+
+def test_negotiate():
+    negotiate = ccguard_compression.negotiate
+    assert negotiate(Accept([("gzip", 1), ("deflate", 1)])) == "gzip"
+    assert negotiate(Accept([("gzip", 0)])) is None
+    assert negotiate(Accept([("br", 1)])) is None
+    assert negotiate(Accept([("*", 1)])) in ("zstd", "gzip")
+
+
+def test_compress_chunks():
+    chunks = [b"<coverage>", b"</coverage>"] * 1000
+    compressed = b"".join(ccguard_compression.compress_chunks(chunks, "gzip"))
+    assert gzip.decompress(compressed) == b"".join(chunks)
@@ -3,9 +3,9 @@ import lxml.etree as ET
 from ccguard import ccguard_convert
 
 
-def test_convert_go_xml():
+def test_convert_go_xml(tmp_path):
     path = "ccguard/test_data/convert/go-coverage.txt"
-    outpath = "{}.xml".format(os.path.splitext(path)[0])
+    outpath = str(tmp_path.joinpath("go-coverage.xml"))
     ccguard_convert.main([path, "-if", "go", "-of", "xml", "-o", outpath])
     assert os.path.exists(outpath)
     xml = ET.parse(outpath).getroot()
@@ -0,0 +1,136 @@
+import io
+import logging
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from . import ccguard, ccguard_client, ccguard_daemon
+
+SAMPLE_FILE = "ccguard/test_data/sample_coverage.xml"
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    path = str(tmp_path.joinpath("ccguard.sock"))
+    daemon = ccguard_daemon.Daemon(path)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    daemon.server_close()
+    thread.join()
+
+
+def forward(daemon, args):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    code = ccguard_client.forward(args, daemon.path, stdout=stdout, stderr=stderr)
+    return code, stdout.getvalue(), stderr.getvalue()
+
+
+def test_warm_git_adapter():
+    with patch.object(ccguard, "get_output", return_value="abcd\n") as get_output:
+        session = ccguard_daemon.WarmSession()
+        git = session.git(".")
+        assert git.get_repository_id() == "abcd"
+        assert git.get_root_path() == "abcd"
+        assert session.git(os.getcwd()) is git
+        assert git.get_repository_id() == "abcd"
+        assert git.get_root_path() == "abcd"
+        assert get_output.call_count == 2
+        assert session.git(".", "other") is not git
+
+
+def test_warm_adapter():
+    adapter_class = MagicMock()
+    session = ccguard_daemon.WarmSession()
+    config = {}
+    with patch.object(ccguard, "adapter_factory", return_value=adapter_class):
+        with session.adapter(None, "repo", config) as adapter:
+            assert adapter is adapter_class.return_value.__enter__.return_value
+        with session.adapter(None, "repo", config) as same:
+            assert same is adapter
+        assert adapter_class.call_count == 1
+        assert not adapter_class.return_value.__exit__.called
+
+        # a reloaded configuration gets a new adapter
+        session.adapter(None, "repo", {})
+        assert adapter_class.call_count == 2
+        assert adapter_class.return_value.__exit__.call_count == 1
+
+    session.close()
+    assert adapter_class.return_value.__exit__.call_count == 2
+
+
+def test_warm_reference():
+    session = ccguard_daemon.WarmSession(max_references=1)
+    source = ccguard.GitAdapter().get_root_path()
+    with open(SAMPLE_FILE, "rb") as fd:
+        data = fd.read()
+    reference = session.reference("abcd", None, source, data)
+    assert reference.line_rate() == 0.791
+    assert session.reference("abcd", None, source, data) is reference
+    assert session.reference("abcd", "unit", source, data) is not reference
+    assert session.reference("abcd", None, source, data) is not reference
+
+
+def test_daemon_forwards_output_and_exit_code(daemon):
+    def main(args, session=None):
+        assert session is daemon.session
+        print("report of {}".format(args[0]))
+        logging.warning("a warning")
+        raise SystemExit(255)
+
+    with patch.object(ccguard, "main", side_effect=main):
+        code, stdout, stderr = forward(daemon, ["coverage.xml"])
+
+    assert code == 255
+    assert stdout == "report of coverage.xml\n"
+    assert stderr == "WARNING:root:a warning\n"
+
+
+def test_daemon_runs_in_the_client_folder(daemon, tmp_path):
+    folders = []
+    with patch.object(
+        ccguard, "main", side_effect=lambda *a, **k: folders.append(os.getcwd())
+    ):
+        current = os.getcwd()
+        os.chdir(str(tmp_path))
+        try:
+            code, _, _ = forward(daemon, ["coverage.xml"])
+        finally:
+            os.chdir(current)
+
+    assert code == 0
+    assert folders == [str(tmp_path)]
+    assert os.getcwd() == current
+
+
+def test_daemon_reports_errors(daemon):
+    code, stdout, stderr = forward(daemon, [])
+    assert code == 2
+    assert "the following arguments are required: report" in stderr
+
+    with patch.object(ccguard, "main", side_effect=KeyError("oops")):
+        code, _, stderr = forward(daemon, ["coverage.xml"])
+    assert code == 1
+    assert "KeyError: 'oops'" in stderr
+
+    code, _, stderr = forward(daemon, ["--daemon"])
+    assert code == 2
+
+
+def test_serve_refuses_a_second_daemon(daemon):
+    assert ccguard_daemon.is_listening(daemon.path)
+    assert ccguard_daemon.serve(daemon.path) == 1
+
+
+def test_client_falls_back_to_ccguard(tmp_path):
+    path = str(tmp_path.joinpath("ccguard.sock"))
+    with patch.dict(os.environ, {"ccguard_daemon_socket": path}):
+        with patch.object(ccguard, "main", return_value=None) as main:
+            with pytest.raises(SystemExit) as exit_info:
+                ccguard_client.main(["coverage.xml"])
+    main.assert_called_once_with(["coverage.xml"])
+    assert not exit_info.value.code
@@ -15,7 +15,7 @@ def test_ccguard_diff():
 
     adapter = MagicMock()
 
-    adapter.get_cc_commits = MagicMock(return_value=[commit1, "aaaa", commit2, "bbbb"])
+    adapter.resolve_prefix = MagicMock(side_effect=lambda prefix, **_: prefix)
     adapter.retrieve_cc_data = MagicMock(side_effect=lambda commit, **_: data[commit])
     adapter_class = MagicMock()
     adapter_class.__enter__ = MagicMock(return_value=adapter)
@@ -0,0 +1,25 @@
+import pytest
+
+from . import ccguard_frames
+
+
+def test_frames_roundtrip():
+    stream = b"".join(
+        [
+            ccguard_frames.encode_frame("abc", None, b"<coverage/>"),
+            ccguard_frames.encode_frame("déf", "unit", memoryview(b"")),
+            ccguard_frames.encode_frame("ghi", "e2e", b"x" * 70000),
+        ]
+    )
+    chunks = [stream[:7], stream[7:30], stream[30:]]
+    assert list(ccguard_frames.iter_frames(chunks)) == [
+        ("abc", "default", b"<coverage/>"),
+        ("déf", "unit", b""),
+        ("ghi", "e2e", b"x" * 70000),
+    ]
+
+
+def test_frames_truncated():
+    frame = ccguard_frames.encode_frame("abc", None, b"<coverage/>")
+    with pytest.raises(ccguard_frames.TruncatedFrame):
+        list(ccguard_frames.iter_frames([frame[:-1]]))
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+from .ccguard_lazy import LazyModule, lazy_import
+
+HEAVY_MODULES = ("requests", "lxml", "pycobertura", "jinja2")
+
+
+def python(code):
+    return subprocess.check_output([sys.executable, "-c", code]).decode("utf-8")
+
+
+def test_lazy_import_loads_on_first_access():
+    module = LazyModule("colorsys")
+    assert "not loaded" in repr(module)
+    assert module.rgb_to_hsv(0, 0, 0) == (0, 0, 0)
+    assert "not loaded" not in repr(module)
+    assert "rgb_to_hsv" in module.__dict__
+
+
+def test_lazy_import_reuses_imported_modules():
+    assert lazy_import("sys") is sys
+
+
+def test_cli_startup_does_not_import_heavy_dependencies():
+    for module in ("ccguard", "ccguard.ccguard", "ccguard.ccguard_log"):
+        code = "import sys, {}; print(sorted(sys.modules))".format(module)
+        loaded = python(code)
+        for heavy in HEAVY_MODULES:
+            assert "'{}'".format(heavy) not in loaded, (module, heavy)
+
+
+def test_versioned_cobertura_is_importable():
+    code = "import ccguard; print(ccguard.VersionedCobertura.__name__)"
+    assert python(code).strip() == "VersionedCobertura"
@@ -1,7 +1,8 @@
-import git
 from . import ccguard_log
 import ccguard
-from unittest.mock import MagicMock
+from unittest.mock import patch
+
+COMMITS = [("b" * 40, "message(bbb)"), ("a" * 40, "message(aaa)")]
 
 
 def mock_adapter_class(commit_id):
@@ -15,31 +16,27 @@ def mock_adapter_class(commit_id):
         def __exit__(self, exc_type, exc_value, traceback):
             pass
 
-        def dump(self):
-            return [[commit_id, '<coverage line-rate="50"/>']]
+        def list_summaries(self, commit_ids, subtype=None):
+            if commit_id in commit_ids:
+                yield commit_id, 0.5, 1, 2, "master", "default"
+
+        def list_file_summaries(self, commit_ids, path, subtype=None):
+            assert path == "src/ccguard"
+            for index, commit_id in enumerate(commit_ids):
+                yield commit_id, 3 - index, 4
 
     return MockAdapter
 
 
-def fake_commit():
-    mit = git.Commit(
-        repo=MagicMock(), binsha=bytes("a" * 20, "utf-8"), message="message(aaa)"
-    )
-    mit2 = git.Commit(
-        repo=MagicMock(), binsha=bytes("b" * 20, "utf-8"), message="message(bbb)"
-    )
-    mits = {mit.binsha: mit, mit2.binsha: mit2}
-    mock = MagicMock()
-    mock.iter_commits = MagicMock(side_effect=lambda: [mit2, mit])
-    mock.commit = MagicMock(side_effect=lambda commit: mits[commit.binsha])
-    git.Repo = MagicMock(return_value=mock)
-    return mit
+def fake_log():
+    return patch.object(ccguard.GitAdapter, "iter_log", return_value=iter(COMMITS))
 
 
 def test_detailed_references():
-    mit = fake_commit()
-
-    refs = ccguard_log.detailed_references(adapter_class=mock_adapter_class(mit.hexsha))
+    with fake_log():
+        refs = ccguard_log.detailed_references(
+            adapter_class=mock_adapter_class("a" * 40)
+        )
     for ref in refs:
         assert isinstance(ref, ccguard_log.AnnotatedCommit)
         assert len(str(ref)) > 0
@@ -47,11 +44,11 @@ def test_detailed_references():
 
 
 def test_main():
-    mit = fake_commit()
-
-    ccguard.adapter_factory = lambda *args: mock_adapter_class(mit.hexsha)
+    ccguard.adapter_factory = lambda *args: mock_adapter_class("a" * 40)
     lines = []
-    ccguard_log.main(args=[], logging_function=lambda x: lines.append(x))
+    with fake_log() as iter_log:
+        ccguard_log.main(args=["-n", "2"], logging_function=lambda x: lines.append(x))
+        iter_log.assert_called_with(limit=2)
     assert len(lines) == 2
     for ref in lines:
         assert isinstance(ref, ccguard_log.AnnotatedCommit)
@@ -72,3 +69,44 @@ def test_parse_optionals():
 def test_parse_shortest():
     args = ccguard_log.parse_args(["--adapter", "sqlite"])
     assert args.adapter == "sqlite"
+
+
+def test_detailed_references_rates():
+    with fake_log():
+        refs = ccguard_log.detailed_references(
+            adapter_class=mock_adapter_class("a" * 40)
+        )
+    assert [ref.has_ref for ref in refs] == [False, True]
+    assert str(refs[1]) == "✅  (50.00%) aaaaaaa message(aaa)"
+
+
+def test_timeline():
+    with fake_log():
+        entries = ccguard_log.timeline(adapter_class=mock_adapter_class("a" * 40))
+    assert [entry.has_ref for entry in entries] == [False, True]
+    assert str(entries[1]) == "✅  (50.00%)                    1/2 aaaaaaa message(aaa)"
+
+
+def test_main_path():
+    ccguard.adapter_factory = lambda *args: mock_adapter_class("a" * 40)
+    lines = []
+    with fake_log():
+        args = ["--path", "./src/ccguard"]
+        ccguard_log.main(args=args, logging_function=lambda x: lines.append(x))
+    assert [entry.delta for entry in lines] == [0.25, None]
+    assert str(lines[0]) == "✅  (75.00%)  +25.00%           3/4 bbbbbbb message(bbb)"
+
+
+def test_timeline_path_missing_from_a_reference():
+    class MockAdapter(mock_adapter_class("a" * 40)):
+        def list_file_summaries(self, commit_ids, path, subtype=None):
+            # the file is not part of the reference of bbb
+            return [("b" * 40, 0, 0), ("a" * 40, 1, 2)]
+
+    with fake_log():
+        entries = ccguard_log.timeline(adapter_class=MockAdapter, path="a.py")
+    assert [entry.has_ref for entry in entries] == [True, True]
+    assert [entry.delta for entry in entries] == [None, None]
+    assert str(entries[0]).startswith("✅ ")
+    assert "%" not in str(entries[0])
+    assert "0/0" not in str(entries[0])
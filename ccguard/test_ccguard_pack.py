@@ -0,0 +1,219 @@
+import os
+import shutil
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from . import ccguard
+from . import ccguard_pack
+from . import ccguard_server as csm
+from .ccguard_server import ccguard as ccm
+
+
+def test_pack_append_get():
+    path = "./ccguard-test-packs/one"
+    try:
+        pack = ccguard_pack.ReferencePack(path)
+        assert pack.get("abc") is None
+        assert pack.append("abc", b"<coverage>1</coverage>")
+        assert pack.append("abc", b"<coverage>2</coverage>", subtype="unit")
+        assert not pack.append("abc", b"<coverage>3</coverage>")
+        view = pack.get("abc")
+        assert isinstance(view, memoryview)
+        assert bytes(view) == b"<coverage>1</coverage>"
+        assert bytes(pack.get("abc", "unit")) == b"<coverage>2</coverage>"
+
+        # another reader (ie. another worker) sees the appended data
+        other = ccguard_pack.ReferencePack(path)
+        assert bytes(other.get("abc", "unit")) == b"<coverage>2</coverage>"
+        pack.append("def", b"<coverage>4</coverage>")
+        assert bytes(other.get("def")) == b"<coverage>4</coverage>"
+        assert bytes(view) == b"<coverage>1</coverage>"
+    finally:
+        shutil.rmtree("./ccguard-test-packs")
+
+
+def test_pack_index_subtypes_and_malformed_lines(tmp_path):
+    path = str(tmp_path.joinpath("pack"))
+    pack = ccguard_pack.ReferencePack(path)
+    assert pack.append("abc", b"<coverage>1</coverage>", subtype="unit tests")
+    with open(path + ".idx", "ab") as fd:
+        fd.write(b"def default 0 22\n")
+    assert pack.append("ghi", b"<coverage>2</coverage>")
+
+    other = ccguard_pack.ReferencePack(path)
+    assert bytes(other.get("abc", "unit tests")) == b"<coverage>1</coverage>"
+    assert other.get("def") is None
+    assert bytes(other.get("ghi")) == b"<coverage>2</coverage>"
+
+
+def test_use_counter():
+    uses = ccguard_pack.UseCounter()
+    uses.add(["abc", "def"])
+    uses.add(["abc"], "unit")
+    uses.add(["abc"])
+    assert uses.take(interval=60) == {}
+    assert uses.take() == {
+        ("abc", "default"): 2,
+        ("def", "default"): 1,
+        ("abc", "unit"): 1,
+    }
+    assert uses.take() == {}
+
+
+def test_open_pack():
+    assert ccguard_pack.open_pack("./a/b") is ccguard_pack.open_pack("./a/b")
+
+
+def use_count(adapter, commit_id):
+    query = "SELECT count FROM {} WHERE commit_id = ?".format(adapter._table_name())
+    return adapter.conn.execute(query, (commit_id,)).fetchone()[0]
+
+
+def test_pack_adapter():
+    config = {
+        "sqlite.dbpath": "./ccguard.pack.db",
+        "pack.path": "./ccguard-test-packs",
+    }
+    try:
+        with ccguard.PackAdapter("test", config) as adapter:
+            assert adapter._conn is None
+            assert not adapter.retrieve_cc_data("zero")
+            adapter.persist("one", b'<coverage line-rate="0.5"/>', branch="master")
+            adapter.persist("two", b'<coverage line-rate="0.7"/>', branch="master")
+            assert adapter.get_cc_commits() == frozenset(["one", "two"])
+
+        with ccguard.PackAdapter("test", config) as adapter:
+            data = adapter.retrieve_cc_data("two")
+            assert isinstance(data, memoryview)
+            assert bytes(data) == b'<coverage line-rate="0.7"/>'
+            # served from the pack, the use is counted in memory
+            assert adapter._conn is None
+
+        # references stored before the pack existed are served as well
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            adapter.persist("thr", b'<coverage line-rate="0.9"/>')
+        with ccguard.PackAdapter("test", config) as adapter:
+            assert (
+                bytes(adapter.retrieve_cc_data("thr")) == b'<coverage line-rate="0.9"/>'
+            )
+            assert adapter.pack.get("thr")
+
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            adapter.persist("fou", b'<coverage line-rate="0.4"/>')
+        with ccguard.PackAdapter("test", config) as adapter:
+            references = adapter.retrieve_many(["fou", "none", "one"])
+            assert [(commit_id, bytes(data)) for commit_id, data in references] == [
+                ("fou", b'<coverage line-rate="0.4"/>'),
+                ("one", b'<coverage line-rate="0.5"/>'),
+            ]
+            assert adapter.pack.get("fou")
+
+        # and recorded once a connection is open
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            assert use_count(adapter, "one") == use_count(adapter, "two")
+            assert use_count(adapter, "one") == use_count(adapter, "thr")
+        config["pack.count.interval"] = 0
+        with ccguard.PackAdapter("test", config) as adapter:
+            adapter.retrieve_cc_data("two")
+            assert use_count(adapter, "two") == use_count(adapter, "one") + 1
+    finally:
+        shutil.rmtree("./ccguard-test-packs")
+        os.unlink("./ccguard.pack.db")
+
+
+def test_pack_append_many():
+    path = "./ccguard-test-packs/many"
+    try:
+        pack = ccguard_pack.ReferencePack(path)
+        pack.append("abc", b"<coverage>1</coverage>")
+        references = [
+            ("abc", b"<coverage>2</coverage>", None),
+            ("def", b"<coverage>3</coverage>", None),
+            ("def", b"<coverage>4</coverage>", None),
+            ("def", b"<coverage>5</coverage>", "unit"),
+        ]
+        with patch.object(ccguard_pack.os, "fsync") as fsync:
+            assert pack.append_many(references) == 2
+        assert fsync.call_count == 1
+        assert bytes(pack.get("abc")) == b"<coverage>1</coverage>"
+        assert bytes(pack.get("def")) == b"<coverage>3</coverage>"
+        assert bytes(pack.get("def", "unit")) == b"<coverage>5</coverage>"
+    finally:
+        shutil.rmtree("./ccguard-test-packs")
+
+
+def test_pack_adapter_writes_the_pack_once_committed():
+    config = {
+        "sqlite.dbpath": "./ccguard.commit.db",
+        "pack.path": "./ccguard-test-commit-packs",
+    }
+    try:
+        with ccguard.PackAdapter("test", config) as adapter:
+            references = [
+                ("one", b'<coverage line-rate="0.5"/>', None, None),
+                ("bad", b"", None, None),
+                ("two", b'<coverage line-rate="0.7"/>', None, None),
+            ]
+            with patch.object(ccguard_pack.os, "fsync") as fsync:
+                statuses = adapter.persist_many(references)
+            assert statuses == ["recorded", "invalid", "recorded"]
+            assert fsync.call_count == 1
+            assert adapter.pack.get("two")
+            assert not adapter.pack.get("bad")
+
+            references = [
+                ("thr", b'<coverage line-rate="0.9"/>', None, None),
+                ("fou", b'<coverage line-rate="0.4"/>', None, None),
+            ]
+            failure = [(0.9, 9, 10), OSError("the disk went away")]
+            with patch.object(adapter, "_get_line_coverage", side_effect=failure):
+                with pytest.raises(OSError):
+                    adapter.persist_many(references)
+            # rolled back in the database, hence never written to the pack
+            assert not adapter.pack.get("thr")
+            assert "thr" not in adapter.get_cc_commits()
+            adapter.persist("thr", b'<coverage line-rate="0.9"/>')
+            assert bytes(adapter.pack.get("thr")) == b'<coverage line-rate="0.9"/>'
+    finally:
+        shutil.rmtree("./ccguard-test-commit-packs")
+        os.unlink("./ccguard.commit.db")
+
+
+def test_download_reference_memoryview():
+    data = b"<coverage/>"
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=memoryview(data))
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        with csm.app.test_client() as test_client:
+            result = test_client.get("/api/v1/references/abcd/dcba/data")
+            assert result.status_code == 200
+            assert result.data == data
+            assert result.headers["Content-Length"] == str(len(data))
+
+
+def test_pack_adapter_keeps_the_recorded_data(tmp_path):
+    config = {
+        "sqlite.dbpath": str(tmp_path.joinpath("ccguard.db")),
+        "pack.path": str(tmp_path.joinpath("packs")),
+    }
+    with ccguard.SqliteAdapter("test", config) as adapter:
+        adapter.persist("one", b'<coverage line-rate="0.5"/>')
+    with ccguard.PackAdapter("test", config) as adapter:
+        # a duplicate is not recorded, in the database nor in the pack
+        adapter.persist("one", b'<coverage line-rate="0.9"/>')
+        assert bytes(adapter.retrieve_cc_data("one")) == b'<coverage line-rate="0.5"/>'
+
+
+def test_pack_adapter_expands_the_home_folder(tmp_path):
+    config = {
+        "sqlite.dbpath": str(tmp_path.joinpath("ccguard.db")),
+        "pack.path": "~/packs",
+    }
+    with patch.dict(os.environ, {"HOME": str(tmp_path)}):
+        with ccguard.PackAdapter("test", config) as adapter:
+            adapter.persist("one", b'<coverage line-rate="0.5"/>')
+    assert tmp_path.joinpath("packs").is_dir()
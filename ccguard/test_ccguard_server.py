@@ -1,10 +1,16 @@
 import os
+import shutil
+import base64
+import gzip
 import json
+import threading
 from sqlite3 import IntegrityError, OperationalError
 from unittest.mock import MagicMock, call, patch
 
 from . import ccguard_server as csm
 from . import ccguard_server_blueprints as cbm
+from . import ccguard_frames
+from . import ccguard_writer
 from .ccguard_server import ccguard as ccm
 
 
@@ -392,13 +398,11 @@ def test_download_reference_commit_not_found():
 
 
 def test_status_badge():
+    cbm.badge_cache.clear()
     repository_id = "abcd"
     commit_id = "dcba"
     adapter = MagicMock()
-    commits = frozenset([commit_id])
-    adapter = MagicMock()
-    adapter.get_cc_commits = MagicMock(return_value=commits)
-    adapter.get_commit_info = MagicMock(return_value=[0.17, 17, 100])
+    adapter.get_latest_reference = MagicMock(return_value=(commit_id, 0.17))
     adapter_class = MagicMock()
     adapter_class.__enter__ = MagicMock(return_value=adapter)
     adapter_factory = MagicMock(return_value=adapter_class)
@@ -408,16 +412,46 @@ def test_status_badge():
             result = test_client.get(url)
             assert result.status_code == 200
             assert b"17%" in result.data
-            assert adapter.get_commit_info.called_with(adapter, commit_id)
+            adapter.get_latest_reference.assert_called_with("master", None)
+            adapter.retrieve_cc_data.assert_not_called()
+
+
+def test_status_badge_cached():
+    cbm.badge_cache.clear()
+    adapter = MagicMock()
+    adapter.get_latest_reference = MagicMock(return_value=("dcba", 1.0))
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory), patch.dict(
+        csm.app.config, {"TOKEN": None}
+    ):
+        with csm.app.test_client() as test_client:
+            url = "/api/v1/repositories/abcd/status_badge.svg"
+            with patch.object(
+                cbm, "render_badge", wraps=cbm.render_badge
+            ) as render_badge:
+                for _ in range(2):
+                    result = test_client.get(url)
+                    assert result.status_code == 200
+                    assert b"100%" in result.data
+                assert render_badge.call_count == 1
+
+                result = test_client.get(url + "?red=blue")
+                assert render_badge.call_count == 2
+
+                # another process recorded a new reference
+                adapter.get_latest_reference = MagicMock(return_value=("efgh", 0.5))
+                result = test_client.get(url)
+                assert b"50%" in result.data
+                assert render_badge.call_count == 3
 
 
 def test_status_badge_unknown():
+    cbm.badge_cache.clear()
     repository_id = "abcd"
     adapter = MagicMock()
-    commits = frozenset([])
-    adapter = MagicMock()
-    adapter.get_cc_commits = MagicMock(return_value=commits)
-    adapter.get_commit_info = MagicMock(return_value=[0.17, 17, 100])
+    adapter.get_latest_reference = MagicMock(return_value=None)
     adapter_class = MagicMock()
     adapter_class.__enter__ = MagicMock(return_value=adapter)
     adapter_factory = MagicMock(return_value=adapter_class)
@@ -435,9 +469,7 @@ def test_web_main():
     data = b"""<coverage line-rate="0.791" />"""
     adapter = MagicMock()
     adapter.retrieve_cc_data = MagicMock(return_value=data)
-    commits = frozenset([commit_id])
-    adapter.get_cc_commits = MagicMock(return_value=commits)
-    adapter.get_commit_info = MagicMock(return_value=[0.17, 17, 100])
+    adapter.get_latest_reference = MagicMock(return_value=(commit_id, 0.791))
     adapter_class = MagicMock()
     adapter_class.__enter__ = MagicMock(return_value=adapter)
     adapter_factory = MagicMock(return_value=adapter_class)
@@ -447,7 +479,7 @@ def test_web_main():
             result = test_client.get(url)
             assert result.status_code == 200
             assert b"79.10%" in result.data
-            assert adapter.get_commit_info.called_with(adapter, commit_id)
+            adapter.retrieve_cc_data.assert_called_with(commit_id, subtype=None)
 
 
 def test_web_report():
@@ -751,6 +783,52 @@ def test_personal_access_token_generate():
         os.unlink(test_db_path)
 
 
+def test_personal_access_token_cache():
+    try:
+        test_db_path = "./ccguard.server.db"
+        config = {"sqlite.dbpath": test_db_path}
+        pato = cbm.PersonalAccessToken("ivo", "test name", value="bbb")
+        pato.commit(config)
+        assert not cbm.PersonalAccessToken.get_by_value("ccc", config=config)
+        patr = cbm.PersonalAccessToken.get_by_value("bbb", config=config)
+        with patch.object(cbm.PersonalAccessToken, "_get_by_value") as get_mock:
+            assert cbm.PersonalAccessToken.get_by_value("bbb", config=config) is patr
+            get_mock.assert_not_called()
+
+        # revoked by another process (ie. a worker), with a cache of its own
+        with patch.object(cbm.PersonalAccessToken._cache, "clear"):
+            cbm.PersonalAccessToken.revoke("ivo", "test name", config=config)
+        patr = cbm.PersonalAccessToken.get_by_value("bbb", config=config)
+        assert patr.revoked
+
+        with patch.object(cbm.PersonalAccessToken._cache, "clear"):
+            cbm.PersonalAccessToken.delete("ivo", "test name", config=config)
+        assert not cbm.PersonalAccessToken.get_by_value("bbb", config=config)
+    finally:
+        os.unlink(test_db_path)
+        os.unlink(test_db_path + "-tokens")
+
+
+def test_revoke_token():
+    user_id = "me@example.com"
+    with patch.object(cbm, "PersonalAccessToken") as pat_mock:
+        with patch.object(cbm, "check_auth") as mock_auth:
+
+            def set_user(a, b, g):
+                g.user = user_id
+
+            mock_auth.side_effect = set_user
+
+            with csm.app.test_client() as test_client:
+                url = "/api/v1/personal_access_token/{}/revoke".format(user_id)
+                result = test_client.post(url, json={"name": "test"})
+                assert result.status_code == 200
+                pat_mock.revoke.assert_called_with(user_id, "test")
+
+                result = test_client.post(url, json={})
+                assert result.status_code == 400
+
+
 def test_check_auth():
     pat = cbm.PersonalAccessToken("ivo", "toto")
     flask_global = MagicMock()
@@ -788,3 +866,518 @@ def test_check_auth():
         headers = {"authorization": "toto"}
         assert not cbm.check_auth(headers, config, flask_global)
         assert flask_global.user == pat.user_id
+
+
+def test_download_reference_not_modified():
+    data = b"<coverage/>"
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=data)
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        with csm.app.test_client() as test_client:
+            url = "/api/v1/references/abcd/dcba/data"
+            result = test_client.get(url)
+            assert result.status_code == 200
+            assert "immutable" in result.headers["Cache-Control"]
+            etag = result.headers["ETag"]
+            assert etag
+
+            adapter.retrieve_cc_data.reset_mock()
+            result = test_client.get(url, headers={"If-None-Match": etag})
+            assert result.status_code == 304
+            assert not result.data
+            # answered without reading the reference
+            adapter.retrieve_cc_data.assert_not_called()
+
+
+def test_web_report_not_modified():
+    data = b"""<coverage line-rate="0.791" />"""
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=data)
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        with csm.app.test_client() as test_client:
+            for url in ("/web/report/abcd/dcba", "/web/diff/abcd/dcba..dcba"):
+                result = test_client.get(url)
+                assert result.status_code == 200
+                etag = result.headers["ETag"]
+                adapter.retrieve_cc_data.reset_mock()
+                with patch.object(cbm, "parse_reference") as parse_mock:
+                    result = test_client.get(url, headers={"If-None-Match": etag})
+                    assert result.status_code == 304
+                    parse_mock.assert_not_called()
+                adapter.retrieve_cc_data.assert_not_called()
+
+
+def test_web_main_revalidated():
+    data = b"""<coverage line-rate="0.791" />"""
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=data)
+    adapter.iter_cc_commits = MagicMock(return_value=iter(["dcba"]))
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        with csm.app.test_client() as test_client:
+            result = test_client.get("/web/main/abcd")
+            assert result.status_code == 200
+            assert result.headers["Cache-Control"] == "no-cache"
+
+
+def test_download_reference_compressed():
+    data = b"<coverage/>" * 1000
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=data)
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        with csm.app.test_client() as test_client:
+            url = "/api/v1/references/abcd/dcba/data"
+            result = test_client.get(url, headers={"Accept-Encoding": "gzip"})
+            assert result.status_code == 200
+            assert result.headers["Content-Encoding"] == "gzip"
+            assert "Accept-Encoding" in result.headers["Vary"]
+            assert gzip.decompress(result.data) == data
+            etag = result.headers["ETag"]
+
+            result = test_client.get(url)
+            assert "Content-Encoding" not in result.headers
+            assert result.data == data
+            assert result.headers["ETag"] != etag
+
+
+def test_put_reference_compressed():
+    data = b"<coverage/>"
+    adapter = MagicMock()
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory), patch.dict(
+        csm.app.config, {"TOKEN": None}
+    ):
+        with csm.app.test_client() as test_client:
+            url = "/api/v1/references/abcd/dcba/data"
+            result = test_client.put(
+                url,
+                data=gzip.compress(data),
+                headers={"Content-Encoding": "gzip"},
+            )
+            assert result.status_code == 200
+            assert adapter.persist.call_args[0][1] == data
+
+            for encoding, payload, status_code in (
+                ("br", data, 415),
+                ("gzip", data, 400),
+            ):
+                result = test_client.put(
+                    url, data=payload, headers={"Content-Encoding": encoding}
+                )
+                assert result.status_code == status_code
+
+
+def test_server_configuration_cached():
+    data = b"<coverage/>"
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=data)
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        with patch.object(ccm, "configuration", return_value={}) as config_mock:
+            with csm.app.test_client() as test_client:
+                for _ in range(3):
+                    result = test_client.get("/api/v1/references/abcd/dcba/data")
+                    assert result.status_code == 200
+            assert config_mock.call_count == 1
+
+            cbm.reload_configuration(csm.app)
+            with csm.app.test_client() as test_client:
+                test_client.get("/api/v1/references/abcd/dcba/data")
+            assert config_mock.call_count == 2
+
+
+def test_render_cache_expands_the_home_folder(tmp_path):
+    config = {"server.render.cache.path": "~/render"}
+    with patch.dict(os.environ, {"HOME": str(tmp_path)}):
+        assert cbm.render_cache(config).path == tmp_path.joinpath("render")
+    assert cbm.render_cache({}) is None
+
+
+def test_web_report_render_cache():
+    data = b"""<coverage line-rate="0.791" />"""
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=data)
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    config = {"server.render.cache.path": "./ccguard-test-render-cache"}
+    try:
+        with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+            with patch.object(ccm, "configuration", return_value=config):
+                with csm.app.test_client() as test_client:
+                    for url in ("/web/report/abcd/dcba", "/web/diff/abcd/dcba..dcba"):
+                        result = test_client.get(url)
+                        assert result.status_code == 200
+                        page = result.data
+                        adapter.retrieve_cc_data.reset_mock()
+
+                        with patch.object(cbm, "parse_reference") as parse_mock:
+                            result = test_client.get(url)
+                            assert result.data == page
+                            etag = result.headers["ETag"]
+                            result = test_client.get(
+                                url, headers={"Accept-Encoding": "gzip"}
+                            )
+                            assert result.headers["Content-Encoding"] == "gzip"
+                            assert gzip.decompress(result.data) == page
+                            assert result.headers["ETag"] != etag
+
+                            result = test_client.get(
+                                url, headers={"If-None-Match": etag}
+                            )
+                            assert result.status_code == 304
+                            parse_mock.assert_not_called()
+                        adapter.retrieve_cc_data.assert_not_called()
+    finally:
+        shutil.rmtree("./ccguard-test-render-cache")
+
+
+def test_prerenderer():
+    prerenderer = csm.Prerenderer(workers=1)
+    done = []
+    assert prerenderer.submit(done.append, "one")
+    prerenderer.submit(MagicMock(side_effect=Exception("expected")))
+    assert prerenderer.submit(done.append, "two")
+    prerenderer.join()
+    assert done == ["one", "two"]
+
+    # no worker: the queue fills up
+    prerenderer = csm.Prerenderer(workers=0, queue_size=1)
+    assert prerenderer.submit(done.append, "thr")
+    assert not prerenderer.submit(done.append, "fou")
+
+
+def test_upload_prerenders_pages():
+    data = b"""<coverage line-rate="0.791" />"""
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=data)
+    adapter.get_latest_reference = MagicMock(return_value=("prev", 0.5))
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    config = {"server.render.cache.path": "./ccguard-test-render-cache"}
+    prerenderer = csm.Prerenderer(workers=1)
+    try:
+        with patch.object(
+            ccm, "adapter_factory", return_value=adapter_factory
+        ), patch.object(ccm, "configuration", return_value=config), patch.dict(
+            csm.app.config, {"TOKEN": None}
+        ), patch.dict(
+            csm.app.extensions, {"ccguard.prerender": prerenderer}
+        ):
+            with csm.app.test_client() as test_client:
+                url = "/api/v1/references/abcd/dcba/data?branch=master"
+                result = test_client.put(url, data=data)
+                assert result.status_code == 200
+                prerenderer.join()
+
+                with patch.object(cbm, "parse_reference") as parse_mock:
+                    for url in ("/web/report/abcd/dcba", "/web/diff/abcd/prev..dcba"):
+                        result = test_client.get(url)
+                        assert result.status_code == 200
+                        assert b"pycobertura" in result.data
+                    parse_mock.assert_not_called()
+    finally:
+        shutil.rmtree("./ccguard-test-render-cache")
+
+
+def test_production_options():
+    args = csm.parse_args(["--production", "--port", "8080", "--workers", "3"])
+    assert args.production
+    assert not args.debug
+    options = csm.production_options(args, {"server.threads": 8})
+    assert options["bind"] == "127.0.0.1:8080"
+    assert options["workers"] == 3
+    assert options["threads"] == 8
+    assert options["keepalive"] == 5
+    assert "certfile" not in options
+
+    host_app = MagicMock(extensions={})
+    config = {"server.prerender.workers": 1}
+    options = csm.production_options(args, config, host_app)
+    options["post_fork"](None, None)
+    assert isinstance(host_app.extensions["ccguard.prerender"], csm.Prerenderer)
+
+
+def test_run_production_without_gunicorn():
+    with patch.dict("sys.modules", {"gunicorn.app.base": None}):
+        assert csm.run_production(csm.app, {}) == 1
+
+
+def test_main_production():
+    app = MagicMock()
+    with patch.object(csm, "load_app"), patch.object(csm, "run_production") as run:
+        csm.main(["--production"], app=app, config={"server.workers": 2})
+    app.run.assert_not_called()
+    options = run.call_args[0][1]
+    assert options["workers"] == 2
+    assert app.config.__setitem__.call_args == call("DEBUG", False)
+
+
+def test_put_reference_group_commit():
+    config = {"sqlite.dbpath": "./ccguard.group.db"}
+    writer = ccguard_writer.GroupCommitWriter(max_delay=0.05)
+    results = []
+
+    def upload(commit_id):
+        with csm.app.test_client() as test_client:
+            url = "/api/v1/references/test/{}/data?branch=master".format(commit_id)
+            results.append(test_client.put(url, data=b"<coverage/>").status_code)
+
+    try:
+        with patch.object(ccm, "configuration", return_value=config), patch.object(
+            ccm, "adapter_factory", return_value=ccm.SqliteAdapter
+        ), patch.dict(csm.app.config, {"TOKEN": None}), patch.dict(
+            csm.app.extensions, {"ccguard.writer": writer}
+        ):
+            threads = [
+                threading.Thread(target=upload, args=("commit{}".format(i),))
+                for i in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert results == [200] * 8
+
+            with csm.app.test_client() as test_client:
+                url = "/api/v1/references/test/empty/data"
+                assert test_client.put(url, data=b"").status_code == 400
+
+        with ccm.SqliteAdapter("test", config) as adapter:
+            assert len(adapter.get_cc_commits()) == 8
+    finally:
+        writer.stop()
+        os.unlink("./ccguard.group.db")
+
+
+def test_upload_references_batch():
+    config = {"sqlite.dbpath": "./ccguard.batch.db"}
+
+    def line(commit_id, data, **kwargs):
+        data = base64.b64encode(data).decode("ascii")
+        return json.dumps(dict(commit_id=commit_id, data=data, **kwargs))
+
+    body = "\n".join(
+        [
+            line("one", b'<coverage line-rate="0.5"/>', branch="master"),
+            line("one", b'<coverage line-rate="0.6"/>', subtype="unit"),
+            line("two", b""),
+            line("one", b'<coverage line-rate="0.5"/>'),
+            "",
+        ]
+    ).encode("utf-8")
+    try:
+        with patch.object(ccm, "configuration", return_value=config), patch.object(
+            ccm, "adapter_factory", return_value=ccm.SqliteAdapter
+        ), patch.dict(csm.app.config, {"TOKEN": None}):
+            with csm.app.test_client() as test_client:
+                url = "/api/v1/references/test/batch"
+                result = test_client.post(
+                    url,
+                    data=gzip.compress(body),
+                    headers={"Content-Encoding": "gzip"},
+                )
+                assert result.status_code == 200
+                items = result.json["items"]
+                assert [item["status"] for item in items] == [
+                    "recorded",
+                    "recorded",
+                    "invalid",
+                    "duplicate",
+                ]
+                assert items[1] == {
+                    "commit_id": "one",
+                    "subtype": "unit",
+                    "status": "recorded",
+                }
+
+                result = test_client.post(url, data=b"not json")
+                assert result.status_code == 400
+                result = test_client.post(url, data=b'{"commit_id": "one"}')
+                assert result.status_code == 400
+
+        with ccm.SqliteAdapter("test", config) as adapter:
+            assert adapter.get_latest_reference("master") == ("one", 0.5)
+    finally:
+        os.unlink("./ccguard.batch.db")
+
+
+def test_upload_references_batch_all_or_nothing(tmp_path):
+    config = {
+        "sqlite.dbpath": str(tmp_path.joinpath("ccguard.db")),
+        "sqlite.batch.size": 1,
+    }
+    body = "\n".join(
+        json.dumps({"commit_id": commit_id, "data": "PGNvdmVyYWdlLz4="})
+        for commit_id in ("one", "two")
+    ).encode("utf-8")
+    failure = [(0.5, 1, 2), OSError("the disk went away")]
+    with patch.object(ccm, "configuration", return_value=config), patch.object(
+        ccm, "adapter_factory", return_value=ccm.SqliteAdapter
+    ), patch.object(
+        ccm.SqliteAdapter, "_get_line_coverage", side_effect=failure
+    ), patch.dict(
+        csm.app.config, {"TOKEN": None}
+    ):
+        with csm.app.test_client() as test_client:
+            result = test_client.post("/api/v1/references/test/batch", data=body)
+            assert result.status_code == 400
+
+    with ccm.SqliteAdapter("test", config) as adapter:
+        assert not adapter.get_cc_commits()
+
+
+def test_download_references():
+    config = {"sqlite.dbpath": "./ccguard.download.db"}
+    try:
+        with ccm.SqliteAdapter("test", config) as adapter:
+            adapter.persist("one", b"<coverage>1</coverage>")
+            adapter.persist("two", b"<coverage>2</coverage>", subtype="unit")
+        with patch.object(ccm, "configuration", return_value=config), patch.object(
+            ccm, "adapter_factory", return_value=ccm.SqliteAdapter
+        ):
+            with csm.app.test_client() as test_client:
+                url = "/api/v1/references/test/download"
+                result = test_client.post(url, json={"commit_ids": ["one", "two"]})
+                assert result.status_code == 200
+                assert result.mimetype == ccguard_frames.MIMETYPE
+                assert list(ccguard_frames.iter_frames([result.data])) == [
+                    ("one", "default", b"<coverage>1</coverage>")
+                ]
+
+                result = test_client.post(
+                    url + "?subtype=unit",
+                    json={"commit_ids": ["one", "two"]},
+                    headers={"Accept-Encoding": "gzip"},
+                )
+                assert result.headers["Content-Encoding"] == "gzip"
+                frames = ccguard_frames.iter_frames([gzip.decompress(result.data)])
+                assert list(frames) == [("two", "unit", b"<coverage>2</coverage>")]
+
+                result = test_client.post(url, json={"commit_ids": "one"})
+                assert result.status_code == 400
+    finally:
+        os.unlink("./ccguard.download.db")
+
+
+def test_list_references():
+    config = {"sqlite.dbpath": "./ccguard.listing.db"}
+    try:
+        with ccm.SqliteAdapter("test", config) as adapter:
+            for commit_id in ("one", "two", "thr"):
+                adapter.persist(commit_id, b"<coverage/>", branch="master")
+        with patch.object(ccm, "configuration", return_value=config), patch.object(
+            ccm, "adapter_factory", return_value=ccm.SqliteAdapter
+        ):
+            with csm.app.test_client() as test_client:
+                url = "/api/v1/references/test/list?limit=2"
+                result = test_client.get(url)
+                assert result.status_code == 200
+                assert len(result.json["references"]) == 2
+                cursor = result.json["next"]
+                result = test_client.get(url + "&cursor=" + cursor)
+                assert len(result.json["references"]) == 1
+                assert result.json["next"] is None
+
+                result = test_client.get(url + "&cursor=invalid")
+                assert result.status_code == 400
+                result = test_client.get(url + "&since=yesterday")
+                assert result.status_code == 400
+    finally:
+        os.unlink("./ccguard.listing.db")
+
+
+def test_resolve_reference_prefix():
+    adapter = MagicMock()
+    adapter.resolve_prefix = MagicMock(side_effect=[None, "abcdef"])
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        with csm.app.test_client() as test_client:
+            result = test_client.get("/api/v1/references/test/resolve/abd")
+            assert result.status_code == 200
+            assert result.json == {"commit_id": None}
+            result = test_client.get("/api/v1/references/test/resolve/abc?subtype=unit")
+            assert result.json == {"commit_id": "abcdef"}
+            adapter.resolve_prefix.assert_called_with("abc", subtype="unit")
+
+
+def test_references_summaries():
+    config = {"sqlite.dbpath": "./ccguard.summaries.db"}
+    try:
+        with ccm.SqliteAdapter("test", config) as adapter:
+            adapter.persist("one", b'<coverage line-rate="0.5"/>', branch="master")
+        with patch.object(ccm, "configuration", return_value=config), patch.object(
+            ccm, "adapter_factory", return_value=ccm.SqliteAdapter
+        ):
+            with csm.app.test_client() as test_client:
+                url = "/api/v1/references/test/summaries"
+                result = test_client.post(url, json={"commit_ids": ["one", "two"]})
+                assert result.status_code == 200
+                assert result.json["summaries"] == [
+                    {
+                        "commit_id": "one",
+                        "line_rate": 0.5,
+                        "lines_covered": 0,
+                        "lines_valid": 0,
+                        "branch": "master",
+                        "subtype": "default",
+                    }
+                ]
+                result = test_client.post(url, json={"commit_ids": ["x"] * 501})
+                assert result.status_code == 400
+    finally:
+        os.unlink("./ccguard.summaries.db")
+
+
+def test_references_file_summaries():
+    adapter = MagicMock()
+    adapter.list_file_summaries = MagicMock(return_value=iter([("one", 1, 2)]))
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        with csm.app.test_client() as test_client:
+            url = "/api/v1/references/test/file_summaries?path=src&subtype=unit"
+            result = test_client.post(url, json={"commit_ids": ["one", "two"]})
+            assert result.status_code == 200
+            assert result.json["summaries"] == [
+                {"commit_id": "one", "lines_covered": 1, "lines_valid": 2}
+            ]
+            adapter.list_file_summaries.assert_called_with(
+                ["one", "two"], "src", subtype="unit"
+            )
+            result = test_client.post(url, json={})
+            assert result.status_code == 400
+
+
+def test_upload_references_batch_unauthorized():
+    with patch.dict(csm.app.config, {"TOKEN": "secret"}):
+        with csm.app.test_client() as test_client:
+            result = test_client.post("/api/v1/references/test/batch", data=b"")
+            assert result.status_code == 401
+
+
+def test_init_worker_group_commit():
+    host_app = MagicMock(extensions={})
+    csm.init_worker(host_app, {"server.writer.group-commit": True})
+    writer = host_app.extensions["ccguard.writer"]
+    assert isinstance(writer, ccguard_writer.GroupCommitWriter)
+    assert writer.max_delay == 0.005
@@ -0,0 +1,220 @@
+import asyncio
+import gzip
+import os
+import shutil
+from unittest.mock import MagicMock, patch
+
+from . import ccguard
+from . import ccguard_server as csm
+from . import ccguard_server_asgi as asgi
+from .ccguard_server import ccguard as ccm
+
+
+def request(application, method, path, body=b"", headers=(), query_string=b""):
+    start, messages = send_request(
+        application, method, path, body, headers, query_string
+    )
+    return (
+        start["status"],
+        dict(start["headers"]),
+        b"".join(message["body"] for message in messages),
+    )
+
+
+def send_request(application, method, path, body=b"", headers=(), query_string=b""):
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": list(headers),
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 1234),
+    }
+    asyncio.run(application(scope, receive, send))
+    start, *body = sent
+    assert start["type"] == "http.response.start"
+    assert not body[-1].get("more_body", False)
+    return start, body
+
+
+def test_asgi_home():
+    application = asgi.AsgiApplication(csm.app)
+    status, headers, body = request(application, "GET", "/")
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/html")
+    assert headers[b"content-length"] == str(len(body)).encode("latin-1")
+
+
+def test_asgi_download_reference():
+    data = b"<coverage/>"
+    adapter = MagicMock()
+    adapter.retrieve_cc_data = MagicMock(return_value=data)
+    adapter_class = MagicMock()
+    adapter_class.__enter__ = MagicMock(return_value=adapter)
+    adapter_factory = MagicMock(return_value=adapter_class)
+    application = asgi.AsgiApplication(csm.app)
+    with patch.object(ccm, "adapter_factory", return_value=adapter_factory):
+        path = "/api/v1/references/abcd/dcba/data"
+        status, _, body = request(application, "GET", path, query_string=b"a=b")
+        assert status == 200
+        assert body == data
+
+
+def test_asgi_upload_reference():
+    config = {"sqlite.dbpath": "./ccguard.asgi.db"}
+    application = asgi.AsgiApplication(csm.app)
+    try:
+        with patch.object(ccm, "configuration", return_value=config), patch.object(
+            ccm, "adapter_factory", return_value=ccguard.SqliteAdapter
+        ), patch.dict(csm.app.config, {"TOKEN": None}):
+            path = "/api/v1/references/test/abc/data"
+            data = b'<coverage line-rate="0.5"/>'
+            status, _, body = request(
+                application,
+                "PUT",
+                path,
+                gzip.compress(data),
+                headers=[(b"content-encoding", b"gzip")],
+                query_string=b"branch=master",
+            )
+            assert status == 200
+            assert body.decode("utf-8").startswith(str(len(data)))
+
+            status, _, _ = request(
+                application, "PUT", path, data, [(b"content-encoding", b"br")]
+            )
+            assert status == 415
+            status, _, _ = request(application, "PUT", path, b"")
+            assert status == 400
+
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            assert adapter.get_latest_reference("master") == ("abc", 0.5)
+    finally:
+        application.writer.stop()
+        os.unlink("./ccguard.asgi.db")
+
+
+def test_asgi_upload_unauthorized():
+    application = asgi.AsgiApplication(csm.app)
+    with patch.dict(csm.app.config, {"TOKEN": "token"}):
+        path = "/api/v1/references/test/abc/data"
+        status, _, body = request(application, "PUT", path, b"<coverage/>")
+        assert status == 401
+        assert body == b"Authentication required"
+
+
+def test_asgi_streams_wsgi_responses():
+    closed = []
+
+    class Result(object):
+        def __iter__(self):
+            yield b"one"
+            yield b""
+            yield b"two"
+
+        def close(self):
+            closed.append(True)
+
+    def wsgi_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return Result()
+
+    application = asgi.AsgiApplication(wsgi_app)
+    start, messages = send_request(application, "GET", "/")
+    assert start["status"] == 200
+    assert [message["body"] for message in messages] == [b"one", b"two", b""]
+    assert [message.get("more_body") for message in messages] == [True, True, None]
+    assert closed == [True]
+
+
+def test_asgi_upload_prerenders_pages():
+    config = {
+        "sqlite.dbpath": "./ccguard.asgi-prerender.db",
+        "server.render.cache.path": "./ccguard-test-asgi-render-cache",
+    }
+    application = asgi.AsgiApplication(csm.app)
+    prerenderer = MagicMock()
+    try:
+        with patch.object(ccm, "configuration", return_value=config), patch.object(
+            ccm, "adapter_factory", return_value=ccguard.SqliteAdapter
+        ), patch.dict(csm.app.config, {"TOKEN": None}), patch.dict(
+            csm.app.extensions, {"ccguard.prerender": prerenderer}
+        ):
+            data = b'<coverage line-rate="0.5"/>'
+            for commit_id in ("abc", "def"):
+                path = "/api/v1/references/test/{}/data".format(commit_id)
+                status, _, _ = request(
+                    application, "PUT", path, data, query_string=b"branch=master"
+                )
+                assert status == 200
+
+        first, second = (call.args for call in prerenderer.submit.call_args_list)
+        assert first[2:] == ("test", "abc", None, None)
+        assert second[2:] == ("test", "def", "abc", None)
+    finally:
+        application.writer.stop()
+        os.unlink("./ccguard.asgi-prerender.db")
+        shutil.rmtree("./ccguard-test-asgi-render-cache", ignore_errors=True)
+
+
+def test_asgi_wsgi_body_too_large():
+    config = {"server.upload.max-size-mb": 1}
+    application = asgi.AsgiApplication(csm.app)
+    with patch.object(ccm, "configuration", return_value=config):
+        path = "/api/v1/references/test/batch"
+        body = b"x" * (1024 * 1024 + 1)
+        status, _, response = request(application, "POST", path, body)
+        assert status == 413
+        assert response == b"Payload too large."
+
+
+def lifespan(application):
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(application({"type": "lifespan"}, receive, send))
+    return sent
+
+
+def test_asgi_lifespan_configures_the_worker():
+    config = {"server.writer.max-batch": 8}
+    application = asgi.AsgiApplication(csm.app)
+    with patch.object(ccm, "configuration", return_value=config), patch.object(
+        csm, "init_worker"
+    ) as init_worker, patch.dict(csm.app.config, {"TOKEN": None}), patch.dict(
+        os.environ, {"ccguard_server_token": "token"}
+    ):
+        sent = lifespan(application)
+        assert csm.app.config["TOKEN"] == "token"
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    init_worker.assert_called_once_with(csm.app, config)
+    assert application.config == config
+    assert application.writer.max_batch == 8
+
+
+def test_asgi_lifespan_keeps_the_configuration_of_main():
+    config = {"server.writer.max-batch": 8}
+    application = asgi.AsgiApplication(csm.app)
+    application.configure(config)
+    with patch.object(csm, "init_worker") as init_worker, patch.dict(
+        csm.app.config, {"TOKEN": "main"}
+    ), patch.dict(os.environ, {"ccguard_server_token": "token"}):
+        lifespan(application)
+        assert csm.app.config["TOKEN"] == "main"
+    init_worker.assert_called_once_with(csm.app, config)
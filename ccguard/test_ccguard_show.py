@@ -8,7 +8,7 @@ def test_ccguard_show():
     commit_id = "dcba"
     data = b'<coverage line-rate="0.791" />'
     adapter = MagicMock()
-    adapter.get_cc_commits = MagicMock(return_value=[commit_id])
+    adapter.resolve_prefix = MagicMock(return_value=commit_id)
     adapter.retrieve_cc_data = MagicMock(return_value=data)
     adapter_class = MagicMock()
     adapter_class.__enter__ = MagicMock(return_value=adapter)
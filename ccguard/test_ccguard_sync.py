@@ -1,6 +1,3 @@
-import git
-from unittest.mock import MagicMock
-
 import ccguard
 from ccguard import ccguard_sync
 
@@ -22,40 +19,39 @@ def mock_adapter_class(commit_id_):
         def retrieve_cc_data(self, commit_id):
             assert commit_id == commit_id_
 
+        def retrieve_many(self, commit_ids):
+            for commit_id in commit_ids:
+                yield commit_id, self.retrieve_cc_data(commit_id)
+
         def persist(self, commit_id, data):
             assert commit_id == commit_id_
 
+        def persist_many(self, references):
+            statuses = []
+            for commit_id, data, branch, subtype in references:
+                self.persist(commit_id, data)
+                statuses.append("recorded")
+            return statuses
+
     return MockAdapter
 
 
-def fake_commit():
-    mit = git.Commit(
-        repo=MagicMock(), binsha=bytes("a" * 20, "utf-8"), message="message(aaa)"
-    )
-    mock = MagicMock()
-    mock.iter_commits = MagicMock(side_effect=lambda: [mit])
-    mock.commit = MagicMock(return_value=mit)
-    git.Repo = MagicMock(return_value=mock)
-    return mit
+COMMIT_ID = "a" * 40
 
 
 def test_transfer():
-    mit = fake_commit()
-
     ccguard_sync.transfer(
         commit_id=None,
-        source_adapter_class=mock_adapter_class(mit.hexsha),
-        dest_adapter_class=mock_adapter_class(mit.hexsha),
+        source_adapter_class=mock_adapter_class(COMMIT_ID),
+        dest_adapter_class=mock_adapter_class(COMMIT_ID),
     )
 
 
 def test_transfer_single():
-    mit = fake_commit()
-
     ccguard_sync.transfer(
-        commit_id=mit.hexsha,
-        source_adapter_class=mock_adapter_class(mit.hexsha),
-        dest_adapter_class=mock_adapter_class(mit.hexsha),
+        commit_id=COMMIT_ID,
+        source_adapter_class=mock_adapter_class(COMMIT_ID),
+        dest_adapter_class=mock_adapter_class(COMMIT_ID),
     )
 
 
@@ -82,16 +78,14 @@ def test_parse_shortest():
 
 
 def test_main():
-    commit = fake_commit()
-    ccguard.adapter_factory = lambda a, b: mock_adapter_class(commit.hexsha)
+    ccguard.adapter_factory = lambda a, b: mock_adapter_class(COMMIT_ID)
     lines = []
     ccguard_sync.main(["web", "web"], log_function=lambda *x: lines.append(x))
     assert lines
 
 
 def test_main_debug():
-    commit = fake_commit()
-    ccguard.adapter_factory = lambda a, b: mock_adapter_class(commit.hexsha)
+    ccguard.adapter_factory = lambda a, b: mock_adapter_class(COMMIT_ID)
     lines = []
     ccguard_sync.main(
         ["--debug", "web", "web"], log_function=lambda *x: lines.append(x)
@@ -0,0 +1,80 @@
+import os
+import shutil
+from concurrent.futures import wait
+from unittest.mock import patch
+
+import pytest
+
+from . import ccguard
+from . import ccguard_pack
+from . import ccguard_writer
+
+
+def test_group_commit_writer():
+    config = {"sqlite.dbpath": "./ccguard.writer.db"}
+    writer = ccguard_writer.GroupCommitWriter(max_delay=0.05)
+    try:
+        futures = [
+            writer.submit(
+                ccguard.SqliteAdapter,
+                config,
+                "test",
+                "commit{}".format(i),
+                b'<coverage line-rate="0.5"/>',
+                "master",
+            )
+            for i in range(20)
+        ]
+        # the invalid reference fails alone
+        invalid = writer.submit(ccguard.SqliteAdapter, config, "test", "bad", b"")
+        duplicate = writer.submit(
+            ccguard.SqliteAdapter, config, "test", "commit1", b"<coverage/>"
+        )
+        wait(futures + [invalid, duplicate])
+        assert all(future.result() is None for future in futures)
+        assert duplicate.result() is None
+        with pytest.raises(ValueError):
+            invalid.result()
+
+        writer.persist(ccguard.SqliteAdapter, config, "test", "last", b"<coverage/>")
+        writer.stop()
+
+        with ccguard.SqliteAdapter("test", config) as adapter:
+            assert len(adapter.get_cc_commits()) == 21
+            assert adapter.get_latest_reference("master") == ("commit19", 0.5)
+    finally:
+        writer.stop()
+        os.unlink("./ccguard.writer.db")
+
+
+def test_group_commit_writer_pack():
+    config = {
+        "sqlite.dbpath": "./ccguard.writer.db",
+        "pack.path": "./ccguard-test-writer-packs",
+    }
+    writer = ccguard_writer.GroupCommitWriter(max_delay=0.05)
+    try:
+        with patch.object(ccguard_pack.os, "fsync") as fsync:
+            futures = [
+                writer.submit(
+                    ccguard.PackAdapter,
+                    config,
+                    "test",
+                    "commit{}".format(i),
+                    b'<coverage line-rate="0.5"/>',
+                )
+                for i in range(10)
+            ]
+            invalid = writer.submit(ccguard.PackAdapter, config, "test", "bad", b"")
+            wait(futures + [invalid])
+            writer.stop()
+        # the pack is written once per group, after its commit
+        assert 1 <= fsync.call_count < 10
+
+        with ccguard.PackAdapter("test", config) as adapter:
+            assert all(adapter.pack.get("commit{}".format(i)) for i in range(10))
+            assert not adapter.pack.get("bad")
+    finally:
+        writer.stop()
+        os.unlink("./ccguard.writer.db")
+        shutil.rmtree("./ccguard-test-writer-packs")
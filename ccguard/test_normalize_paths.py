@@ -1,6 +1,13 @@
 import io
+from unittest.mock import patch
 from lxml import etree as ET
-from .ccguard import normalize_report_paths, GitAdapter
+from . import ccguard
+from .ccguard import (
+    normalize_report_paths,
+    normalized_reference,
+    reference_cache,
+    GitAdapter,
+)
 
 REPOSITORY = "."
 REPORT = "ccguard/test_data/paths.xml"
@@ -70,3 +77,38 @@ def test_relativize_other_machine():
     for filename in filenames:
         # paths are now all relative
         assert filename.startswith("ccguard/")
+
+
+def test_normalized_reference_cache(tmp_path):
+    with open(REPORT, "rb") as report_fd:
+        data = report_fd.read()
+    sources = GitAdapter(REPOSITORY).get_root_path()
+    cache = reference_cache({"reference.cache.path": str(tmp_path)})
+
+    normalized = normalized_reference("abcd", None, sources, data, cache)
+    xml = ET.fromstring(normalized)
+    assert xml.xpath('/coverage/sources/source[@class="ccguard-meta-sources-root"]')
+    assert cache.size()
+
+    # the cached reference is used as is
+    with patch.object(ccguard, "normalize_report_paths") as normalize:
+        same = normalized_reference("abcd", None, sources, data, cache)
+        assert same == normalized
+        assert not normalize.called
+
+        # ..but not for another content, commit, subtype or repository root
+        normalize.return_value = ET.ElementTree(ET.fromstring(data))
+        normalized_reference("abcd", None, sources, data + b" ", cache)
+        normalized_reference("abce", None, sources, data, cache)
+        normalized_reference("abcd", "unit", sources, data, cache)
+        normalized_reference("abcd", None, "/elsewhere", data, cache)
+        assert normalize.call_count == 4
+
+
+def test_reference_cache_is_optional():
+    assert reference_cache({}) is None
+    cache = reference_cache(
+        {"reference.cache.path": "~/.ccguard-cache", "reference.cache.size-mb": 1}
+    )
+    assert not str(cache.path).startswith("~")
+    assert cache.max_size == 1024 * 1024
@@ -1,5 +1,10 @@
+import base64
+import gzip
+import json
+import shutil
 from unittest.mock import MagicMock
 from . import ccguard
+from . import ccguard_frames
 
 
 def test_web_adapter_retrieve_cc_data():
@@ -18,12 +23,307 @@ def test_web_adapter_retrieve_cc_data():
 def test_web_adapter_get_cc_commits():
     adapter = ccguard.WebAdapter("repository")
     requests_mock = MagicMock()
+    page = {"references": [{"commit_id": "abc"}, {"commit_id": "def"}], "next": None}
     requests_mock.get = MagicMock(
-        return_value=MagicMock(json=MagicMock(return_value=["abc", "def"]))
+        return_value=MagicMock(status_code=200, json=MagicMock(return_value=page))
     )
     ccguard.requests = requests_mock
     response = adapter.get_cc_commits()
-    assert requests_mock.get.called_with(
-        "http://localhost:5000/api/v1/references/repository/all"
+    assert requests_mock.get.call_args[0][0] == (
+        "http://localhost:5000/api/v1/references/repository/list?limit=100"
     )
     assert len(response) == 2
+
+
+def test_web_adapter_get_cc_commits_pages():
+    adapter = ccguard.WebAdapter("repository", {"ccguard.page.size": 2})
+    pages = [
+        {"references": [{"commit_id": "abc"}, {"commit_id": "def"}], "next": "c1"},
+        {"references": [{"commit_id": "def"}, {"commit_id": "ghi"}], "next": "c2"},
+        {"references": [{"commit_id": "jkl"}], "next": None},
+    ]
+    requests_mock = MagicMock()
+    requests_mock.get = MagicMock(
+        side_effect=[
+            MagicMock(status_code=200, json=MagicMock(return_value=page))
+            for page in pages
+        ]
+    )
+    ccguard.requests = requests_mock
+    commits = adapter.iter_cc_commits()
+    assert list(commits) == ["abc", "def", "ghi", "jkl"]
+    assert "cursor=c2" in requests_mock.get.call_args[0][0]
+
+    # the following pages are only requested when needed
+    requests_mock.get.side_effect = [
+        MagicMock(status_code=200, json=MagicMock(return_value=page)) for page in pages
+    ]
+    assert adapter.get_cc_commits(count=1) == frozenset(["abc"])
+    assert requests_mock.get.call_count == 4
+    assert "limit=1" in requests_mock.get.call_args[0][0]
+
+
+def test_web_adapter_resolve_prefix():
+    adapter = ccguard.WebAdapter("repository")
+    requests_mock = MagicMock()
+    requests_mock.get = MagicMock(
+        return_value=MagicMock(
+            status_code=200, json=MagicMock(return_value={"commit_id": "abcdef"})
+        )
+    )
+    ccguard.requests = requests_mock
+    assert adapter.resolve_prefix("abc", subtype="unit") == "abcdef"
+    assert requests_mock.get.call_args[0][0] == (
+        "http://localhost:5000/api/v1/references/repository/resolve/abc?subtype=unit"
+    )
+
+    # older servers: the prefix is resolved by listing the references
+    page = {"references": [{"commit_id": "bcd"}, {"commit_id": "abd"}], "next": None}
+    requests_mock.get = MagicMock(
+        side_effect=[
+            MagicMock(status_code=404),
+            MagicMock(status_code=200, json=MagicMock(return_value=page)),
+        ]
+    )
+    assert adapter.resolve_prefix("ab") == "abd"
+
+
+def test_web_adapter_list_summaries():
+    adapter = ccguard.WebAdapter("repository")
+    summary = {
+        "commit_id": "abc",
+        "line_rate": 0.5,
+        "lines_covered": 1,
+        "lines_valid": 2,
+        "branch": "master",
+        "subtype": "default",
+    }
+    requests_mock = MagicMock()
+    requests_mock.post = MagicMock(
+        return_value=MagicMock(
+            status_code=200, json=MagicMock(return_value={"summaries": [summary]})
+        )
+    )
+    ccguard.requests = requests_mock
+    summaries = list(adapter.list_summaries(["abc", "def"]))
+    assert summaries == [("abc", 0.5, 1, 2, "master", "default")]
+    assert requests_mock.post.call_args[1]["json"] == {"commit_ids": ["abc", "def"]}
+
+
+def test_web_adapter_list_file_summaries():
+    adapter = ccguard.WebAdapter("repository")
+    summary = {"commit_id": "abc", "lines_covered": 1, "lines_valid": 2}
+    requests_mock = MagicMock()
+    requests_mock.post = MagicMock(
+        return_value=MagicMock(
+            status_code=200, json=MagicMock(return_value={"summaries": [summary]})
+        )
+    )
+    ccguard.requests = requests_mock
+    summaries = list(adapter.list_file_summaries(["abc", "def"], "src"))
+    assert summaries == [("abc", 1, 2)]
+    assert requests_mock.post.call_args[0][0] == (
+        "http://localhost:5000/api/v1/references/repository/file_summaries?path=src"
+    )
+
+
+def test_web_adapter_list_references_encodes_the_options():
+    adapter = ccguard.WebAdapter("repository")
+    page = {"references": [], "next": None}
+    requests_mock = MagicMock()
+    requests_mock.get = MagicMock(
+        return_value=MagicMock(status_code=200, json=MagicMock(return_value=page))
+    )
+    ccguard.requests = requests_mock
+    adapter.list_references(branch="feature/a&b", since="2020-01-01T00:00:00+02:00")
+    assert requests_mock.get.call_args[0][0] == (
+        "http://localhost:5000/api/v1/references/repository/list"
+        "?branch=feature%2Fa%26b&since=2020-01-01T00%3A00%3A00%2B02%3A00&limit=100"
+    )
+
+
+def test_web_adapter_get_cc_commits_legacy_server():
+    adapter = ccguard.WebAdapter("repository")
+    requests_mock = MagicMock()
+    requests_mock.get = MagicMock(
+        side_effect=[
+            MagicMock(status_code=404),
+            MagicMock(json=MagicMock(return_value=["abc", "def"])),
+        ]
+    )
+    ccguard.requests = requests_mock
+    assert adapter.get_cc_commits() == frozenset(["abc", "def"])
+    assert requests_mock.get.call_args[0][0].endswith("/repository/all")
+
+
+def test_web_adapter_binary_wire_format():
+    adapter = ccguard.WebAdapter("repository", {"ccguard.wire.format": "binary"})
+    with open("ccguard/test_data/sample_coverage.xml", "rb") as fd:
+        data = fd.read()
+    requests_mock = MagicMock()
+    ccguard.requests = requests_mock
+    adapter.persist("abc", data)
+    sent = requests_mock.put.call_args[1]["data"]
+    assert ccguard.ccguard_binary.is_binary(sent)
+
+    requests_mock.get = MagicMock(return_value=MagicMock(content=sent))
+    response = adapter.retrieve_cc_data("abc")
+    assert "format=binary" in requests_mock.get.call_args[0][0]
+    assert not ccguard.ccguard_binary.is_binary(response)
+
+
+def test_web_adapter_wire_compression():
+    adapter = ccguard.WebAdapter("repository", {"ccguard.wire.compression": "gzip"})
+    requests_mock = MagicMock()
+    ccguard.requests = requests_mock
+    adapter.persist("abc", b"<coverage/>")
+    kwargs = requests_mock.put.call_args[1]
+    assert kwargs["headers"]["Content-Encoding"] == "gzip"
+    assert gzip.decompress(kwargs["data"]) == b"<coverage/>"
+
+
+def test_web_adapter_persist_many():
+    adapter = ccguard.WebAdapter(
+        "repository", {"ccguard.batch.size": 2, "ccguard.wire.compression": "gzip"}
+    )
+    requests_mock = MagicMock()
+    requests_mock.post = MagicMock(
+        side_effect=lambda uri, headers, data: MagicMock(
+            json=MagicMock(
+                return_value={
+                    "items": [
+                        {"status": "recorded"}
+                        for _ in gzip.decompress(data).splitlines()
+                    ]
+                }
+            )
+        )
+    )
+    ccguard.requests = requests_mock
+    references = [
+        ("abc", b"<coverage/>", "master", None),
+        ("abc", b"<coverage/>", "master", "unit"),
+        ("def", b"<coverage/>", None, None),
+    ]
+    assert adapter.persist_many(references) == ["recorded"] * 3
+    assert requests_mock.post.call_count == 2
+    uri, kwargs = requests_mock.post.call_args[0][0], requests_mock.post.call_args[1]
+    assert uri == "http://localhost:5000/api/v1/references/repository/batch"
+    assert kwargs["headers"]["Content-Encoding"] == "gzip"
+    item = json.loads(gzip.decompress(kwargs["data"]))
+    assert item["commit_id"] == "def"
+    assert base64.b64decode(item["data"]) == b"<coverage/>"
+
+
+def test_web_adapter_persist_many_failure():
+    adapter = ccguard.WebAdapter("repository")
+    requests_mock = MagicMock()
+    requests_mock.post = MagicMock(
+        return_value=MagicMock(json=MagicMock(side_effect=ValueError))
+    )
+    ccguard.requests = requests_mock
+    references = [("abc", b"<coverage/>", None, None)]
+    assert adapter.persist_many(references) == ["error"]
+
+
+def test_web_adapter_retrieve_many():
+    adapter = ccguard.WebAdapter("repository", {"web.cache.path": "./ccguard-test-web"})
+    stream = ccguard_frames.encode_frame("abc", None, b"<coverage>1</coverage>")
+    stream += ccguard_frames.encode_frame("def", None, b"<coverage>2</coverage>")
+    requests_mock = MagicMock()
+    requests_mock.post = MagicMock(
+        return_value=MagicMock(
+            status_code=200,
+            iter_content=MagicMock(return_value=[stream[:5], stream[5:]]),
+        )
+    )
+    ccguard.requests = requests_mock
+    try:
+        references = list(adapter.retrieve_many(["abc", "def", "ghi"]))
+        assert references == [
+            ("abc", b"<coverage>1</coverage>"),
+            ("def", b"<coverage>2</coverage>"),
+        ]
+        uri, kwargs = (
+            requests_mock.post.call_args[0][0],
+            requests_mock.post.call_args[1],
+        )
+        assert uri == "http://localhost:5000/api/v1/references/repository/download"
+        assert kwargs["json"] == {"commit_ids": ["abc", "def", "ghi"]}
+
+        # the references downloaded once are served from the cache
+        requests_mock.post.return_value.iter_content.return_value = []
+        references = list(adapter.retrieve_many(["def", "ghi"]))
+        assert references == [("def", b"<coverage>2</coverage>")]
+        assert requests_mock.post.call_args[1]["json"] == {"commit_ids": ["ghi"]}
+    finally:
+        shutil.rmtree("./ccguard-test-web")
+
+
+class LegacyServer(object):
+    """A server without any of the batch endpoints."""
+
+    def __init__(self, references):
+        self.references = references
+
+    def get(self, uri, headers=None):
+        commit_id = uri.split("/")[-2]
+        if uri.split("?")[0].endswith("/data") and commit_id in self.references:
+            return MagicMock(status_code=200, content=self.references[commit_id])
+        return MagicMock(status_code=404, content=b"<html>Not Found</html>")
+
+    def post(self, uri, **kwargs):
+        return MagicMock(status_code=404, content=b"<html>Not Found</html>")
+
+    def put(self, uri, headers=None, data=None):
+        self.references[uri.split("?")[0].split("/")[-2]] = data
+        return MagicMock(status_code=200, content=b"received")
+
+
+def legacy_server():
+    with open("ccguard/test_data/sample_coverage.xml", "rb") as fd:
+        server = LegacyServer({"abc": fd.read()})
+    requests_mock = MagicMock()
+    requests_mock.get = MagicMock(side_effect=server.get)
+    requests_mock.post = MagicMock(side_effect=server.post)
+    requests_mock.put = MagicMock(side_effect=server.put)
+    ccguard.requests = requests_mock
+    return server
+
+
+def test_web_adapter_retrieve_many_legacy_server():
+    server = legacy_server()
+    adapter = ccguard.WebAdapter("repository")
+    references = list(adapter.retrieve_many(["abc", "def"]))
+    assert references == [("abc", server.references["abc"])]
+
+
+def test_web_adapter_list_summaries_legacy_server():
+    server = legacy_server()
+    adapter = ccguard.WebAdapter("repository")
+    line_rate, covered, valid = ccguard.line_coverage(server.references["abc"])
+    assert valid
+
+    summaries = list(adapter.list_summaries(["abc", "def"]))
+    assert [summary[:4] for summary in summaries] == [
+        ("abc", line_rate, covered, valid)
+    ]
+
+
+def test_web_adapter_list_file_summaries_legacy_server():
+    legacy_server()
+    adapter = ccguard.WebAdapter("repository")
+    summaries = list(adapter.list_file_summaries(["abc", "def"], "ccguard.py"))
+    assert summaries == [("abc", 137, 202)]
+
+
+def test_web_adapter_persist_many_legacy_server():
+    server = legacy_server()
+    adapter = ccguard.WebAdapter("repository")
+    references = [
+        ("def", b"<coverage/>", "master", None),
+        ("ghi", b"", "master", None),
+    ]
+    assert adapter.persist_many(references) == ["recorded", "invalid"]
+    assert server.references["def"] == b"<coverage/>"
+    assert "ghi" not in server.references
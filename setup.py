@@ -15,6 +15,8 @@ setuptools.setup(
             "ccguard_convert=ccguard.ccguard_convert:main",
             "ccguard_sync=ccguard.ccguard_sync:main",
             "ccguard_server=ccguard.ccguard_server:main",
+            "ccguard_server_asgi=ccguard.ccguard_server_asgi:main",
+            "ccguard_client=ccguard.ccguard_client:main",
         ]
     },
     author="Ivo Bellin Salarin",
@@ -27,7 +29,12 @@ setuptools.setup(
     package_data={
         "": ["scripts/migrate_sqlite_database.py", "scripts/cleanup_database.py", "templates/index.html"],
     },
-    install_requires=["pycobertura", "gitpython", "flask", "requests", "lxml", "colour"],
+    install_requires=["pycobertura", "flask", "requests", "lxml", "colour"],
+    extras_require={
+        "zstd": ["zstandard"],
+        "production": ["gunicorn"],
+        "asgi": ["uvicorn"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GNU Affero General Public License v3 or later (AGPLv3+)",